@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark for main.extract_dates_from_message over realistic chat messages.
+
+``legacy_extract_dates`` is a frozen copy of the implementation that sent
+every message without a Korean "M월 D일" date through dateparser.search_dates.
+The script reports messages per second for both, how many messages still
+reach dateparser, and every message where the two disagree (mostly relative
+forms dateparser resolves into the past, e.g. "next Friday").
+
+    python bench_dates.py
+"""
+import argparse
+import re
+import time
+from datetime import datetime, timedelta
+
+from dateparser.search import search_dates
+
+import main
+
+CORPUS = [
+    "오사카 맛집 추천해줘",
+    "오사카 호텔이랑 맛집 추천해줘",
+    "6월 20일부터 3박 4일 성인 2명 오사카 숙소",
+    "2025년 7월 1일 출발 2박 3일",
+    "다음주 금요일부터 2박 3일 갈거야",
+    "내일 출발해서 3박 4일",
+    "모레부터 4박 5일 일정이야",
+    "성인 두명 어린이 한명이에요",
+    "도쿄 가성비 좋은 호텔 찾아줘",
+    "감성 카페 알려줘",
+    "교토 관광지 추천해줘",
+    "5일 동안 여행할 거야",
+    "고마워요!",
+    "Recommend hotels in Tokyo",
+    "Recommend hotels and restaurants in Osaka from June 20 for 3 nights, 2 adults",
+    "Leaving next Friday for 4 nights",
+    "Flying out tomorrow, 5 day trip",
+    "3 nights starting 2026-11-03",
+    "A 7-day trip from 6/20",
+    "I want to visit Paris",
+    "budget hotel with pool in Bangkok",
+    "2 adults and 1 child",
+    "What should I eat there?",
+    "Thanks! That's all.",
+]
+
+
+# --- frozen reference implementation (pre-fast-path extract_dates_from_message) ---
+
+def legacy_extract_dates(message):
+    manual_match = re.search(r'(\d{4})년\s*(\d{1,2})월\s*(\d{1,2})일', message)
+    if manual_match:
+        departure = datetime(int(manual_match.group(1)), int(manual_match.group(2)), int(manual_match.group(3)))
+    else:
+        manual_match = re.search(r'(\d{1,2})월\s*(\d{1,2})일', message)
+        if manual_match:
+            now = datetime.now()
+            month, day = int(manual_match.group(1)), int(manual_match.group(2))
+            departure = datetime(now.year + 1 if month < now.month else now.year, month, day)
+        else:
+            en_match = re.search(r'(?:Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)[a-z]*\.?\s+(\d{1,2})', message, re.IGNORECASE)
+            try:
+                date_match = search_dates(message, languages=["en"] if en_match else ["ko", "en"])
+                departure = date_match[0][1] if date_match else None
+            except Exception:
+                departure = None
+
+    nights = main.extract_turn_slots(message)["nights"]
+    if departure and nights:
+        return str(departure.date()), str((departure + timedelta(days=nights)).date())
+    return None, None
+
+
+def throughput(fn, messages, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for message in messages:
+            fn(message)
+    return rounds * len(messages) / (time.perf_counter() - start)
+
+
+def main_():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rounds", type=int, default=5, help="passes over the corpus per implementation")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    main.warm_dateparser()
+    print(f"dateparser first call (locale load): {(time.perf_counter() - start) * 1000:.0f} ms")
+
+    reaches_dateparser = sum(
+        1 for message in CORPUS
+        if main.extract_turn_slots(message)["nights"] and main.parse_date_fast(message) is None and main.has_date_tokens(message)
+    )
+    legacy_reaches = sum(1 for message in CORPUS if not re.search(r'(\d{1,2})월\s*(\d{1,2})일', message))
+    print(f"messages reaching dateparser: legacy {legacy_reaches}/{len(CORPUS)}, "
+          f"fast path {reaches_dateparser}/{len(CORPUS)}")
+
+    for message in CORPUS:
+        legacy, fast = legacy_extract_dates(message), main.extract_dates_from_message(message)
+        if legacy != fast:
+            print(f"differs: {message!r}\n  legacy: {legacy}\n  fast:   {fast}")
+
+    legacy_rate = throughput(legacy_extract_dates, CORPUS, args.rounds)
+    fast_rate = throughput(main.extract_dates_from_message, CORPUS, args.rounds)
+    print(f"legacy:    {legacy_rate:>10,.0f} msg/s")
+    print(f"fast path: {fast_rate:>10,.0f} msg/s  ({fast_rate / legacy_rate:.0f}x)")
+
+
+if __name__ == "__main__":
+    main_()
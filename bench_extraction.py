@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+"""
+Golden-corpus check and microbenchmark for the local slot extraction engine.
+
+``legacy_extract`` is a frozen copy of the keyword/regex logic update_context
+and extract_dates_from_message used before main.extract_turn_slots existed.
+The script verifies that both produce identical slots for every message in
+GOLDEN_CORPUS, then reports messages per second for each.
+
+    python bench_extraction.py
+    python bench_extraction.py --rounds 500
+"""
+import argparse
+import re
+import sys
+import time
+
+import main
+
+GOLDEN_CORPUS = [
+    "오사카 맛집 추천해줘",
+    "오사카 호텔이랑 맛집 추천해줘",
+    "6월 20일부터 3박 4일 성인 2명 오사카 숙소",
+    "2025년 7월 1일 출발 2박 3일 성인 2명 어린이 1명",
+    "성인 두명 어린이 한명이에요",
+    "성인 이명, 어린이 일명",
+    "도쿄 가성비 좋은 호텔 찾아줘",
+    "수영장 있는 럭셔리 호텔",
+    "조식포함 호텔로 부탁해",
+    "반려동물 동반 가능한 숙소",
+    "감성 카페 알려줘",
+    "인스타 감성 맛집",
+    "해변 근처 맛집 있어?",
+    "분위기 좋은 레스토랑",
+    "저렴한 음식점 추천",
+    "배고파 먹을 곳 알려줘",
+    "교토 관광지 추천해줘",
+    "가볼만한 곳 알려줘",
+    "부산 볼거리랑 명소",
+    "5일 동안 여행할 거야",
+    "십일 정도 머물 예정",
+    "Recommend hotels in Tokyo",
+    "Recommend hotels and restaurants in Osaka from June 20 for 3 nights, 2 adults",
+    "I want to visit Paris",
+    "Find restaurants in Melbourne",
+    "budget hotel with pool in Bangkok",
+    "Cheap eats in Seoul?",
+    "cheap eats in Seoul?",
+    "cozy cafe near the beach",
+    "beachside dining with a vibe",
+    "popular instagram spots",
+    "Looking for a pet-friendly hostel",
+    "luxury accommodation with breakfast",
+    "2 adults and 1 child, 5 day trip",
+    "3 ADULTS, 2 CHILDREN, 4 NIGHTS",
+    "A 7-day trip to London",
+    "tourist attractions and landmarks in Rome",
+    "sightseeing places to visit in Kyoto",
+    "Where should I stay in New York?",
+    "What's a great place to eat?",
+    "hello",
+    "",
+    "ㅎㅎ 고마워",
+    "Thanks! That's all.",
+]
+
+
+# --- frozen reference implementation (pre-engine update_context/extract_dates_from_message) ---
+
+def legacy_extract(user_input):
+    lowered = user_input.lower()
+    slots = {
+        "hotel": any(k in lowered for k in ["숙소", "호텔", "잠잘 곳", "묵을 곳", "자고싶어", "hotel", "accommodation", "stay", "lodge", "hostel"]),
+        "food": any(k in lowered for k in ["맛집", "음식", "카페", "배고파", "먹을 곳", "restaurant", "food", "cafe", "dining", "eat", "cuisine"]),
+        "tourist": any(k in lowered for k in ["관광지", "명소", "볼거리", "관광명소", "가볼만한 곳", "attraction", "sightseeing", "tourist", "visit", "landmark", "places to visit"]),
+        "food_filter": None,
+        "hotel_filters": [kw for kw in main.HOTEL_CATEGORIES_MAP if kw in lowered],
+        "adults": None,
+        "children": None,
+        "nights": None,
+    }
+    for keyword in ["감성", "인스타", "해변", "해변 근처", "분위기 좋은", "인기 많은", "저렴한", "vibe", "instagram", "beach", "beachside", "cozy", "popular", "cheap", "budget"]:
+        if keyword in user_input:
+            slots["food_filter"] = keyword
+            break
+
+    adult_match = re.search(r'성인\s*([0-9]+|[일이삼사오육칠팔구십]+)', user_input)
+    if adult_match:
+        slots["adults"] = main.korean_number_to_int(adult_match.group(1))
+    else:
+        en_adult_match = re.search(r'(\d+)\s*adult', user_input, re.IGNORECASE)
+        if en_adult_match:
+            slots["adults"] = int(en_adult_match.group(1))
+
+    child_match = re.search(r'어린이\s*([0-9]+|[일이삼사오육칠팔구십]+)', user_input)
+    if child_match:
+        slots["children"] = main.korean_number_to_int(child_match.group(1))
+    else:
+        en_child_match = re.search(r'(\d+)\s*child', user_input, re.IGNORECASE)
+        if en_child_match:
+            slots["children"] = int(en_child_match.group(1))
+
+    stay_match = re.search(r'([0-9]+|[일이삼사오육칠팔구십]+)\s*박\s*([0-9]+|[일이삼사오육칠팔구십]+)\s*일', user_input)
+    if stay_match:
+        slots["nights"] = main.korean_number_to_int(stay_match.group(2))
+    else:
+        en_night_match = re.search(r'(\d+)\s*night', user_input, re.IGNORECASE)
+        en_day_match = re.search(r'(\d+)\s*day', user_input, re.IGNORECASE)
+        if en_night_match:
+            slots["nights"] = int(en_night_match.group(1)) + 1
+        elif en_day_match:
+            slots["nights"] = int(en_day_match.group(1))
+        else:
+            duration_match = re.search(r'([0-9]+|[일이삼사오육칠팔구십]+)\s*일', user_input)
+            if duration_match:
+                slots["nights"] = main.korean_number_to_int(duration_match.group(1))
+    return slots
+
+
+def throughput(fn, messages, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for message in messages:
+            fn(message)
+    return rounds * len(messages) / (time.perf_counter() - start)
+
+
+def main_():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rounds", type=int, default=200, help="passes over the corpus per implementation")
+    args = parser.parse_args()
+
+    mismatches = 0
+    for message in GOLDEN_CORPUS:
+        expected, actual = legacy_extract(message), main.extract_turn_slots(message)
+        if expected != actual:
+            mismatches += 1
+            print(f"MISMATCH {message!r}\n  legacy: {expected}\n  engine: {actual}")
+    print(f"golden corpus: {len(GOLDEN_CORPUS) - mismatches}/{len(GOLDEN_CORPUS)} identical")
+
+    legacy_rate = throughput(legacy_extract, GOLDEN_CORPUS, args.rounds)
+    engine_rate = throughput(main.extract_turn_slots, GOLDEN_CORPUS, args.rounds)
+    print(f"legacy: {legacy_rate:>10,.0f} msg/s")
+    print(f"engine: {engine_rate:>10,.0f} msg/s  ({engine_rate / legacy_rate:.2f}x)")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_())
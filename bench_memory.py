@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""
+Memory per conversation session: legacy 13-key dict vs ConversationContext.
+
+Builds N sessions the way /chat fills them - destination, dates and hotel
+filters arrive as fresh str objects from GPT output / date formatting, so
+nothing is shared unless the context interns it - and reports tracemalloc
+bytes per session for each representation.
+
+    python bench_memory.py
+    python bench_memory.py --sessions 300000
+"""
+import argparse
+import json
+import random
+import tracemalloc
+from datetime import date, timedelta
+
+import main
+
+CITIES = ["Osaka", "Tokyo", "Seoul", "Paris", "Bangkok", "Kyoto", "Fukuoka", "London", "New York", "Da Nang"]
+FILTERS = [["pool"], ["budget"], ["luxury", "breakfast"], ["가성비"], None]
+
+
+def legacy_context():
+    return {
+        "destination": None,
+        "departure_date": None,
+        "return_date": None,
+        "duration": None,
+        "adults_number": None,
+        "children_number": 0,
+        "no_rooms": 1,
+        "flight_asked": False,
+        "hotel_asked": False,
+        "hotel_filter": None,
+        "food_asked": False,
+        "food_filter": None,
+        "tourist_asked": False
+    }
+
+
+def session_values(rng):
+    """Values as a finished slot-filling turn produces them (new string objects each time)."""
+    checkin = date(2026, 6, 1) + timedelta(days=rng.randrange(120))
+    nights = rng.randrange(1, 8)
+    hotel_filter = rng.choice(FILTERS)
+    return {
+        "destination": json.loads(json.dumps(rng.choice(CITIES))),
+        "departure_date": str(checkin),
+        "return_date": str(checkin + timedelta(days=nights)),
+        "duration": nights,
+        "adults_number": rng.randrange(1, 5),
+        "children_number": rng.randrange(0, 3),
+        "hotel_filter": json.loads(json.dumps(hotel_filter)),
+    }
+
+
+def measure(factory, count, fill):
+    rng = random.Random(42)
+    tracemalloc.start()
+    sessions = []
+    for i in range(count):
+        context = factory()
+        if i % 2 == 0:  # 절반은 목적지/날짜까지 채워진 세션, 나머지는 빈 세션
+            fill(context, session_values(rng))
+        sessions.append(context)
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    list_overhead = 8 * count + 56
+    return (current - list_overhead) / count
+
+
+def fill_dict(context, values):
+    context.update(values)
+
+
+def fill_slots(context, values):
+    for name, value in values.items():
+        setattr(context, name, value)
+
+
+def main_():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=100_000)
+    args = parser.parse_args()
+
+    legacy = measure(legacy_context, args.sessions, fill_dict)
+    slotted = measure(main.init_context, args.sessions, fill_slots)
+    print(f"{args.sessions:,} sessions (half filled)")
+    print(f"dict:                {legacy:>7.0f} bytes/session")
+    print(f"ConversationContext: {slotted:>7.0f} bytes/session  ({legacy / slotted:.1f}x smaller)")
+
+
+if __name__ == "__main__":
+    main_()
@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+"""
+Offline accuracy / latency / cost eval for the extraction model route.
+
+Every message in LABELLED_CORPUS goes through the same structured-output
+extraction call /chat makes (EXTRACTION_PROMPT + EXTRACTION_SCHEMA, the
+"extraction" route's max_tokens and temperature). The script does this once
+per candidate model and once through main.routed_completion (cheap model,
+escalating on unparseable output). For each it reports destination and
+hotel-filter accuracy, p50/p95 latency, unparseable outputs, escalations and
+the estimated cost per 1k extractions from the token usage.
+
+    python bench_models.py                                   # needs OPENAI_API_KEY
+    python bench_models.py --models gpt-4o-mini gpt-4.1-nano gpt-4o
+    python bench_models.py --price gpt-4.1-nano=0.10,0.40
+    python bench_models.py --stub                            # plumbing check, no quota
+
+The corpus holds messages the local gazetteer cannot settle on its own
+(ambiguous names, misspellings, districts, landmarks), i.e. the traffic
+that actually reaches the extraction call.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+# USD per 1M tokens (input, output) - --price로 덮어쓰기
+PRICES = {
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4.1": (2.00, 8.00),
+    "gpt-4.1-mini": (0.40, 1.60),
+    "gpt-4.1-nano": (0.10, 0.40),
+}
+
+# (message, expected destination or None, expected hotel filters)
+LABELLED_CORPUS = [
+    ("오사카 맛집 추천해줘", "Osaka", []),
+    ("Recommend hotels in Tokyo", "Tokyo", []),
+    ("budget hotel with pool in Paris", "Paris", ["budget", "pool"]),
+    ("서울 가성비 좋은 호텔", "Seoul", ["가성비"]),
+    ("Find restaurants in Melbourne", "Melbourne", []),
+    ("나고야 근처 온천 료칸 가고 싶어", "Nagoya", []),
+    ("Tokio hotel recommendations please", "Tokyo", []),
+    ("Osakka trip next month", "Osaka", []),
+    ("I'm staying near Shibuya, any cafes?", "Tokyo", []),
+    ("신주쿠 근처 럭셔리 호텔", "Tokyo", ["럭셔리"]),
+    ("해운대 바다 보이는 숙소", "Busan", []),
+    ("명동 근처 조식포함 호텔", "Seoul", ["조식포함"]),
+    ("Trip to the Eiffel Tower city", "Paris", []),
+    ("Going to Big Apple for a week, pet-friendly hotel", "New York", ["pet-friendly"]),
+    ("하노이랑 다낭 중에 고민중이야", "Hanoi", []),
+    ("Cancun all-inclusive resort with pool", "Cancun", ["pool"]),
+    ("I want to go somewhere warm", None, []),
+    ("숙소 추천해줘", None, []),
+    ("cheap hostel please", None, ["cheap", "hostel"]),
+    ("Reykjavik in winter, is it worth it?", "Reykjavik", []),
+    ("치앙마이 수영장 있는 호텔", "Chiang Mai", ["수영장"]),
+    ("Looking for a luxury stay in Marrakech", "Marrakech", ["luxury"]),
+    ("삿포로 눈축제 보러 갈거야", "Sapporo", []),
+    ("Somewhere in Bali with breakfast included", "Bali", ["breakfast"]),
+    ("Kyoto or Nara for temples?", "Kyoto", []),
+    ("프라하 감성 숙소", "Prague", []),
+    ("Cebu beach resort, family friendly", "Cebu", ["family friendly"]),
+    ("LA 가성비 모텔", "Los Angeles", ["가성비"]),
+]
+
+
+def parse_prices(items):
+    prices = dict(PRICES)
+    for item in items:
+        model, rates = item.split("=")
+        prompt_rate, completion_rate = rates.split(",")
+        prices[model] = (float(prompt_rate), float(completion_rate))
+    return prices
+
+
+def normalize_city(name):
+    return " ".join((name or "").lower().replace("-", " ").split()) or None
+
+
+def score(expected_dest, expected_filters, slots):
+    dest_ok = normalize_city(slots["destination"]) == normalize_city(expected_dest)
+    filters_ok = {f.lower() for f in slots["hotel_filters"]} == {f.lower() for f in expected_filters}
+    return dest_ok, filters_ok
+
+
+async def run_candidate(main, label, call, prices):
+    """call(messages) -> (slots, model_usage) where model_usage is [(model, prompt_tokens, completion_tokens)]."""
+    latencies, dest_hits, filter_hits, unparseable, cost = [], 0, 0, 0, 0.0
+    escalations_before = main.model_call_stats["escalations"].get("extraction", 0)
+    for message, expected_dest, expected_filters in LABELLED_CORPUS:
+        messages = [{"role": "system", "content": main.EXTRACTION_PROMPT}, {"role": "user", "content": message}]
+        start = time.perf_counter()
+        try:
+            slots, usage = await call(messages)
+        except main.UnparseableOutput:
+            unparseable += 1
+            slots, usage = {"destination": None, "hotel_filters": []}, []
+        latencies.append(time.perf_counter() - start)
+        dest_ok, filters_ok = score(expected_dest, expected_filters, slots)
+        dest_hits += dest_ok
+        filter_hits += filters_ok
+        for model, prompt_tokens, completion_tokens in usage:
+            prompt_rate, completion_rate = prices.get(model, (0.0, 0.0))
+            cost += (prompt_tokens * prompt_rate + completion_tokens * completion_rate) / 1_000_000
+    latencies.sort()
+    total = len(LABELLED_CORPUS)
+    return {
+        "label": label,
+        "dest_acc": dest_hits / total,
+        "filter_acc": filter_hits / total,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": latencies[min(total - 1, int(total * 0.95))] * 1000,
+        "unparseable": unparseable,
+        "escalations": main.model_call_stats["escalations"].get("extraction", 0) - escalations_before,
+        "usd_per_1k": cost / total * 1000,
+    }
+
+
+def single_model_call(main, model):
+    route = main.MODEL_ROUTES["extraction"]
+
+    async def call(messages):
+        # 모델 하나만 평가 - escalation 없이 같은 route 파라미터(max_tokens, temperature)로 호출
+        response = await main.chat_completion(
+            "extraction", messages, model=model,
+            response_format={"type": "json_schema", "json_schema": main.EXTRACTION_SCHEMA},
+        )
+        usage = [(model, response.usage.prompt_tokens, response.usage.completion_tokens)] if response.usage else []
+        choice = response.choices[0]
+        if choice.finish_reason == "length":
+            raise main.UnparseableOutput(f"truncated at max_tokens={route['max_tokens']}")
+        return main.parse_trip_slots(choice.message.content), usage
+
+    return call
+
+
+def routed_call(main):
+    async def call(messages):
+        usage = []
+        original = main.chat_completion
+
+        async def recording(task, messages, model=None, **kwargs):
+            response = await original(task, messages, model=model, **kwargs)
+            if response.usage:
+                usage.append((model, response.usage.prompt_tokens, response.usage.completion_tokens))
+            return response
+
+        main.chat_completion = recording
+        try:
+            slots = await main.routed_completion(
+                "extraction", messages, main.parse_trip_slots,
+                response_format={"type": "json_schema", "json_schema": main.EXTRACTION_SCHEMA},
+            )
+        finally:
+            main.chat_completion = original
+        return slots, usage
+
+    return call
+
+
+async def evaluate(args, prices):
+    import main
+    async with main.lifespan(main.app):
+        rows = [await run_candidate(main, model, single_model_call(main, model), prices) for model in args.models]
+        route = main.MODEL_ROUTES["extraction"]
+        rows.append(await run_candidate(main, f"routed {route['model']}->{route['escalate_to']}", routed_call(main), prices))
+    return rows
+
+
+def main_():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--models", nargs="+", default=["gpt-4o-mini", "gpt-4o"])
+    parser.add_argument("--price", nargs="*", default=[], metavar="MODEL=IN,OUT", help="USD per 1M tokens")
+    parser.add_argument("--stub", action="store_true", help="run against benchmark.stub_app instead of OpenAI")
+    args = parser.parse_args()
+    prices = parse_prices(args.price)
+
+    stub = None
+    os.environ.setdefault("DATEPARSER_PRELOAD", "0")
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    if args.stub:
+        import benchmark
+        port = benchmark.free_port()
+        stub = benchmark.start_server("benchmark:stub_app", port, dict(os.environ, STUB_LATENCY_MS="20"))
+        os.environ.update(OPENAI_API_KEY="stub", OPENAI_BASE_URL=f"http://127.0.0.1:{port}/v1")
+    elif not os.getenv("OPENAI_API_KEY"):
+        print("OPENAI_API_KEY is not set (use --stub for an offline plumbing check)")
+        return 1
+    try:
+        rows = asyncio.run(evaluate(args, prices))
+    finally:
+        if stub:
+            stub.terminate()
+            stub.wait()
+
+    print(f"{len(LABELLED_CORPUS)} labelled messages")
+    print(f"{'candidate':<32} {'dest':>6} {'filters':>8} {'p50 ms':>8} {'p95 ms':>8} {'bad':>4} {'esc':>4} {'$/1k':>8}")
+    for row in rows:
+        print(f"{row['label']:<32} {row['dest_acc']:>6.0%} {row['filter_acc']:>8.0%} {row['p50_ms']:>8.0f} "
+              f"{row['p95_ms']:>8.0f} {row['unparseable']:>4} {row['escalations']:>4} {row['usd_per_1k']:>8.4f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_())
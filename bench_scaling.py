@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+"""
+Throughput scaling of the production server mode across worker processes.
+
+For each --workers count it starts ``python main.py`` with
+SERVER_MODE=production and WEB_CONCURRENCY=N against the stub upstreams from
+benchmark.py. Every row, including N = 1, keeps sessions and caches in the
+shared SQLite backends serve() uses for N > 1 (in a fresh temp directory),
+so only the worker count changes between rows. The benchmark.CONVERSATIONS
+workload is played from --clients load-generator processes, so the client is
+not the bottleneck, and each row reports req/s, speedup and per-worker
+efficiency against the first row.
+
+    python bench_scaling.py                               # 1, 2, 4 ... up to the core count
+    python bench_scaling.py --workers 1 2 4 8 --concurrency 128 --requests 4000
+    python bench_scaling.py --endpoint stream --latency-ms 200
+
+Scaling is only near-linear while there are free cores for the workers,
+the stub and the load generators. On a machine with C cores, expect the
+curve to flatten once N approaches C minus the cores the stub and clients
+need.
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+import benchmark
+import main
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def run_client(base_url, stub_url, endpoint, concurrency, total):
+    return asyncio.run(benchmark.run_level(base_url, stub_url, endpoint, concurrency, total))
+
+
+def run_clients(base_url, stub_url, endpoint, concurrency, total, clients):
+    """Splits concurrency and turns over `clients` processes; returns (req/s, p50 ms, p95 ms, errors)."""
+    share = [(concurrency // clients + (i < concurrency % clients), total // clients + (i < total % clients))
+             for i in range(clients)]
+    share = [(c, t) for c, t in share if c and t]
+    with multiprocessing.Pool(len(share)) as pool:
+        start = time.perf_counter()
+        rows = pool.starmap(run_client, [(base_url, stub_url, endpoint, c, t) for c, t in share])
+        elapsed = time.perf_counter() - start
+    requests = sum(row["requests"] for row in rows)
+    # 클라이언트별 분위수를 요청 수로 가중 평균 (근사치)
+    p50 = sum(row["p50_ms"] * row["requests"] for row in rows) / requests
+    p95 = sum(row["p95_ms"] * row["requests"] for row in rows) / requests
+    return requests / elapsed, p50, p95, sum(row["errors"] for row in rows)
+
+
+def start_app(port, workers, stub_url, state_dir):
+    env = dict(
+        os.environ,
+        SERVER_MODE="production",
+        WEB_CONCURRENCY=str(workers),
+        PORT=str(port),
+        OPENAI_API_KEY="stub",
+        RAPIDAPI_KEY="stub",
+        GOOGLE_API_KEY="stub",
+        OPENAI_BASE_URL=f"{stub_url}/v1",
+        BOOKING_BASE_URL=stub_url,
+        PLACES_BASE_URL=stub_url,
+        LOG_LEVEL=os.getenv("LOG_LEVEL", "WARNING"),
+        BOOKING_RPS=os.getenv("BOOKING_RPS", "1000"),
+        BOOKING_BURST=os.getenv("BOOKING_BURST", "1000"),
+        HTTP_PREWARM="0",
+        CATALOGUE_PATH=os.path.join(state_dir, "city_catalogue.sqlite3"),
+        SESSION_STORE_PATH=os.path.join(state_dir, "sessions.sqlite3"),
+        PLACES_CACHE_PATH=os.path.join(state_dir, "places_cache.sqlite3"),
+        DEST_CACHE_PATH=os.path.join(state_dir, "dest_cache.sqlite3"),
+        HOTEL_CACHE_PATH=os.path.join(state_dir, "hotel_cache.sqlite3"),
+        EXTRACTION_MEMO_PATH=os.path.join(state_dir, "extraction_memo.sqlite3"),
+    )
+    # 1 워커 행도 같은 공유 백엔드로 - 행 간 차이가 워커 수만 되도록
+    env.update((name, "sqlite") for name in main.SHARED_STATE_BACKENDS)
+    proc = subprocess.Popen([sys.executable, "main.py"], env=env, cwd=HERE, stdout=subprocess.DEVNULL)
+    benchmark.wait_for_port(proc, port, f"main.py ({workers} workers)")
+    # 모든 워커가 import/워밍업을 마칠 때까지 /ready를 여러 번 확인
+    deadline = time.time() + 60
+    ready = 0
+    with httpx.Client(timeout=5) as http:
+        while ready < workers * 4 and time.time() < deadline:
+            try:
+                ready = ready + 1 if http.get(f"http://127.0.0.1:{port}/ready").status_code == 200 else 0
+            except httpx.TransportError:
+                ready = 0
+            time.sleep(0.05)
+    return proc
+
+
+def main_():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    cores = os.cpu_count() or 1
+    parser.add_argument("--workers", type=int, nargs="+",
+                        default=[n for n in (1, 2, 4, 8, 16) if n <= max(1, cores)])
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--requests", type=int, default=2000, help="turns per worker count")
+    parser.add_argument("--clients", type=int, default=max(1, min(4, cores // 2)), help="load-generator processes")
+    parser.add_argument("--endpoint", choices=sorted(benchmark.ENDPOINT_PATHS), default="chat")
+    parser.add_argument("--latency-ms", type=float, default=50, help="stub upstream latency")
+    parser.add_argument("--stub-workers", type=int, default=max(1, min(4, cores // 4)))
+    args = parser.parse_args()
+
+    stub_port = benchmark.free_port()
+    stub = benchmark.start_server("benchmark:stub_app", stub_port, dict(os.environ, STUB_LATENCY_MS=str(args.latency_ms)),
+                                  workers=args.stub_workers)
+    stub_url = f"http://127.0.0.1:{stub_port}"
+    print(f"{cores} cores, stub {args.latency_ms:.0f} ms x{args.stub_workers} workers, {args.clients} client processes, "
+          f"{args.endpoint}, concurrency {args.concurrency}, {args.requests} turns per row")
+    print(f"{'workers':>7} {'req/s':>8} {'speedup':>8} {'eff':>6} {'p50 ms':>8} {'p95 ms':>8} {'errors':>7}")
+    baseline = None
+    try:
+        for workers in args.workers:
+            port = benchmark.free_port()
+            with tempfile.TemporaryDirectory() as state_dir:
+                app = start_app(port, workers, stub_url, state_dir)
+                try:
+                    base_url = f"http://127.0.0.1:{port}"
+                    # 워밍업 (워커별 커넥션 풀, dest_id/Places 캐시) - 측정에서 제외
+                    run_clients(base_url, stub_url, args.endpoint, args.concurrency, args.concurrency * 4, args.clients)
+                    rps, p50, p95, errors = run_clients(base_url, stub_url, args.endpoint, args.concurrency,
+                                                        args.requests, args.clients)
+                finally:
+                    app.terminate()
+                    app.wait()
+            baseline = baseline or rps / args.workers[0]
+            speedup = rps / baseline
+            print(f"{workers:>7} {rps:>8.1f} {speedup:>7.2f}x {speedup / workers:>6.0%} {p50:>8.1f} {p95:>8.1f} {errors:>7}")
+    finally:
+        stub.terminate()
+        stub.wait()
+
+
+if __name__ == "__main__":
+    main_()
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+"""
+Cold-start measurement for main:app.
+
+Two numbers matter when Render scales the service to zero:
+
+- import time: ``import main`` in a fresh interpreter (median of --runs)
+- time to first successful chat: from spawning uvicorn until the first
+  POST /chat returns 200, plus when the port opened and when GET /ready
+  first returned 200
+
+Upstreams are the local stubs from benchmark.py, so the chat timing covers
+server start-up, not network or API latency (stub latency --latency-ms).
+
+    python bench_startup.py
+    python bench_startup.py --runs 5 --message "I want to visit Paris, any tips?"
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import httpx
+
+import benchmark
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def import_time():
+    code = "import time; start = time.perf_counter(); import main; print(time.perf_counter() - start)"
+    output = subprocess.run([sys.executable, "-c", code], cwd=HERE, capture_output=True, text=True, check=True,
+                            env=dict(os.environ, LOG_LEVEL="WARNING"))
+    return float(output.stdout.strip().splitlines()[-1])
+
+
+def cold_start(stub_url, message, timeout=60):
+    """Returns seconds from spawn to (port open, first /chat 200, first /ready 200)."""
+    port = benchmark.free_port()
+    env = dict(
+        os.environ,
+        OPENAI_API_KEY="stub",
+        RAPIDAPI_KEY="stub",
+        GOOGLE_API_KEY="stub",
+        OPENAI_BASE_URL=f"{stub_url}/v1",
+        BOOKING_BASE_URL=stub_url,
+        PLACES_BASE_URL=stub_url,
+        LOG_LEVEL="WARNING",
+    )
+    start = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        env=env, cwd=HERE, stdout=subprocess.DEVNULL,
+    )
+    listening = first_chat = ready = None
+    try:
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=30) as http:
+            def poll(send):
+                while time.perf_counter() - start < timeout:
+                    try:
+                        if send().status_code == 200:
+                            return time.perf_counter() - start
+                    except httpx.TransportError:
+                        pass
+                    time.sleep(0.005)
+                return None
+
+            listening = poll(lambda: http.get("/"))
+            first_chat = poll(lambda: http.post("/chat", json={"user_id": "startup", "chat_id": "0", "user_input": message}))
+            ready = poll(lambda: http.get("/ready"))
+    finally:
+        proc.terminate()
+        proc.wait()
+    return listening, first_chat, ready
+
+
+def fmt(seconds):
+    return f"{seconds * 1000:>8.0f}" if seconds is not None else f"{'-':>8}"
+
+
+def main_():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--latency-ms", type=float, default=50, help="stub upstream latency")
+    parser.add_argument("--message", default="Recommend hotels and restaurants in Osaka from June 20 for 3 nights, 2 adults")
+    args = parser.parse_args()
+
+    imports = sorted(import_time() for _ in range(args.runs))
+    print(f"import main: median {statistics.median(imports) * 1000:.0f} ms "
+          f"(min {imports[0] * 1000:.0f}, max {imports[-1] * 1000:.0f}) over {args.runs} runs")
+
+    stub_port = benchmark.free_port()
+    stub = benchmark.start_server("benchmark:stub_app", stub_port, dict(os.environ, STUB_LATENCY_MS=str(args.latency_ms)))
+    try:
+        print(f"{'run':>4} {'listen ms':>9} {'1st chat':>8} {'ready ms':>8}")
+        for run in range(args.runs):
+            listening, first_chat, ready = cold_start(f"http://127.0.0.1:{stub_port}", args.message)
+            print(f"{run + 1:>4} {fmt(listening):>9} {fmt(first_chat)} {fmt(ready)}")
+    finally:
+        stub.terminate()
+        stub.wait()
+
+
+if __name__ == "__main__":
+    main_()
@@ -0,0 +1,455 @@
+# -*- coding: utf-8 -*-
+"""
+Load benchmark for main:app against local stub upstreams.
+
+Booking (/v1/hotels/locations, /v1/hotels/search), Google Places textsearch
+and OpenAI chat completions are replaced by a stub app (``stub_app``), so no
+API quota is used and every run is reproducible. Each worker plays whole
+multi-turn Korean/English conversations from CONVERSATIONS against /chat
+and/or /chat/stream, and each concurrency level reports req/s, p50/p95/p99
+per endpoint and how many LLM / upstream calls one turn cost (counted at the
+stubs, so retries are included).
+
+    python benchmark.py                       # default concurrency sweep
+    python benchmark.py --latency-ms 200 --concurrency 1 8 32 64
+    python benchmark.py --latency-dist lognormal --provider-latency openai=800 booking=400
+    python benchmark.py --endpoints chat stream --json results.json
+
+Stub latency is --latency-ms per call, optionally per provider, and drawn
+from a fixed, uniform (+/- jitter) or lognormal distribution with the same
+median. With blocking upstream calls req/s stays flat as concurrency grows;
+with async I/O it should scale roughly linearly until the pool limit is hit.
+
+Fault injection exercises the upstream resilience layer - a share of stub
+responses become HTTP 503s or hang past every deadline:
+
+    python benchmark.py --error-rate 0.2 --hang-rate 0.05 --fault-providers google booking
+
+The "degraded" column counts /chat responses that came back with at least
+one section marked degraded instead of failing outright.
+
+--target baseline runs the original blocking app (main.py at the repo's root
+commit, or --baseline-rev) against the same stubs, for a before/after
+comparison of how /chat scales with concurrency:
+
+    python benchmark.py --target baseline --concurrency 1 4 16 64
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+STUB_LATENCY = float(os.getenv("STUB_LATENCY_MS", "100")) / 1000
+STUB_LATENCY_DIST = os.getenv("STUB_LATENCY_DIST", "fixed")  # fixed | uniform | lognormal
+STUB_LATENCY_JITTER = float(os.getenv("STUB_LATENCY_JITTER", "0.5"))  # uniform: +/- 비율, lognormal: sigma
+STUB_PROVIDER_LATENCY = {
+    name: float(ms) / 1000
+    for name, ms in (item.split("=") for item in os.getenv("STUB_PROVIDER_LATENCY", "").split(",") if item)
+}
+STUB_ERROR_RATE = float(os.getenv("STUB_ERROR_RATE", "0"))
+STUB_HANG_RATE = float(os.getenv("STUB_HANG_RATE", "0"))
+STUB_FAULT_PROVIDERS = set(os.getenv("STUB_FAULT_PROVIDERS", "booking,google,openai").split(","))
+STUB_PROVIDERS = {"/v1/hotels": "booking", "/textsearch": "google", "/v1/chat": "openai"}
+
+stub_app = FastAPI()
+stub_calls = {}
+
+
+def stub_delay(provider):
+    median = STUB_PROVIDER_LATENCY.get(provider, STUB_LATENCY)
+    if STUB_LATENCY_DIST == "uniform":
+        return median * random.uniform(1 - STUB_LATENCY_JITTER, 1 + STUB_LATENCY_JITTER)
+    if STUB_LATENCY_DIST == "lognormal":
+        return median * random.lognormvariate(0, STUB_LATENCY_JITTER)
+    return median
+
+
+async def stub_sleep(request):
+    await asyncio.sleep(request.state.delay)
+
+
+@stub_app.middleware("http")
+async def inject_faults(request: Request, call_next):
+    provider = next((name for prefix, name in STUB_PROVIDERS.items() if request.url.path.startswith(prefix)), None)
+    if provider is None:
+        return await call_next(request)
+    stub_calls[provider] = stub_calls.get(provider, 0) + 1
+    request.state.delay = stub_delay(provider)
+    if provider in STUB_FAULT_PROVIDERS:
+        roll = random.random()
+        if roll < STUB_HANG_RATE:
+            await asyncio.sleep(60)  # 호출 측 데드라인이 먼저 끊음
+            return JSONResponse({"error": "injected hang"}, status_code=504)
+        if roll < STUB_HANG_RATE + STUB_ERROR_RATE:
+            await asyncio.sleep(request.state.delay)
+            return JSONResponse({"error": "injected fault"}, status_code=503)
+    return await call_next(request)
+
+
+@stub_app.get("/__stub/calls")
+async def stub_call_counts():
+    return stub_calls
+
+
+@stub_app.get("/v1/hotels/locations")
+async def stub_locations(request: Request, name: str = ""):
+    await stub_sleep(request)
+    return [{"name": name, "dest_id": "-240905", "dest_type": "city"}]
+
+
+@stub_app.get("/v1/hotels/search")
+async def stub_hotel_search(request: Request, page_number: int = 0):
+    await stub_sleep(request)
+    # 20개씩 3페이지, 4개 중 1개는 리뷰 점수 없음 (필터링/페이지 넘김 경로 확인용)
+    if page_number >= 3:
+        return {"count": 60, "result": []}
+    return {"count": 60, "result": [
+        {
+            "hotel_name": f"Stub Hotel {i}",
+            "min_total_price": 100000 + i * 1000,
+            "review_score": None if i % 4 == 3 else 8.0,
+            "address": f"{i} Stub Street",
+            "latitude": 34.69 + i / 1000,
+            "longitude": 135.50 + i / 1000,
+        }
+        for i in range(page_number * 20, page_number * 20 + 20)
+    ]}
+
+
+@stub_app.get("/textsearch/json")
+async def stub_places(request: Request, query: str = ""):
+    await stub_sleep(request)
+    return {"status": "OK", "results": [
+        {
+            "name": f"{query} #{i}",
+            "rating": 4.5,
+            "formatted_address": f"{i} Stub Avenue",
+            "geometry": {"location": {"lat": 34.69 + i / 1000, "lng": 135.50 + i / 1000}},
+        }
+        for i in range(10)
+    ]}
+
+
+@stub_app.post("/v1/chat/completions")
+async def stub_chat_completions(req: Request):
+    body = await req.json()
+    await stub_sleep(req)
+    user_input = body["messages"][-1]["content"]
+    content = "Sounds great! When are you leaving?"
+    if "response_format" in body:
+        content = json.dumps({"destination": "Osaka", "hotel_filters": ["budget"]})
+    if body.get("stream"):
+        return StreamingResponse(stream_completion(body, content), media_type="text/event-stream")
+    return {
+        "id": "chatcmpl-stub",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "gpt-4o"),
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": content},
+            "finish_reason": "stop",
+        }],
+        "usage": {"prompt_tokens": len(user_input), "completion_tokens": 3, "total_tokens": len(user_input) + 3},
+    }
+
+
+async def stream_completion(body, content):
+    for i, word in enumerate(content.split(" ")):
+        chunk = {
+            "id": "chatcmpl-stub",
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": body.get("model", "gpt-4o"),
+            "choices": [{"index": 0, "delta": {"content": word if i == 0 else " " + word}, "finish_reason": None}],
+        }
+        yield f"data: {json.dumps(chunk)}\n\n"
+        await asyncio.sleep(0.01)
+    yield "data: [DONE]\n\n"
+
+
+# 실제 대화처럼 슬롯을 여러 턴에 나눠 채우는 한/영 대화 - 워커는 대화 단위로 새 chat_id를 사용
+CONVERSATIONS = [
+    [
+        "오사카 여행 가려고 해",
+        "6월 20일부터 3박 4일, 성인 2명이야",
+        "가성비 좋은 호텔 추천해줘",
+        "맛집도 알려줘",
+        "고마워!",
+    ],
+    [
+        "도쿄 관광지 추천해줘",
+        "감성 카페도 알려줘",
+        "7월 1일부터 2박 3일 성인 두명 어린이 한명 호텔 찾아줘",
+    ],
+    [
+        "I want to visit Paris",
+        "From June 20 for 3 nights, 2 adults",
+        "Recommend a hotel with breakfast",
+        "Any good restaurants?",
+    ],
+    [
+        "Recommend hotels and restaurants in Osaka from June 20 for 3 nights, 2 adults",
+        "What about tourist attractions?",
+        "Thanks! That's all.",
+    ],
+    [
+        "방콕 가성비 숙소 찾아줘",
+        "6월 20일부터 4박 5일 성인 2명",
+        "cheap eats near the hotel?",
+    ],
+]
+WORKLOAD_TURNS = sum(len(turns) for turns in CONVERSATIONS)
+ENDPOINT_PATHS = {"chat": "/chat", "stream": "/chat/stream"}
+
+
+# 기준(변경 전) 앱 실행기 - 하드코딩된 Booking/Places 주소를 스텁으로 돌리고 git에서 꺼낸 main.py를 import
+BASELINE_LAUNCHER = """\
+import os
+
+import requests
+
+REWRITES = [(prefix, os.environ["BASELINE_STUB_URL"])
+            for prefix in ("https://booking-com.p.rapidapi.com", "https://maps.googleapis.com/maps/api/place")]
+session_request = requests.Session.request
+
+
+def request(self, method, url, *args, **kwargs):
+    for prefix, target in REWRITES:
+        if url.startswith(prefix):
+            url = target + url[len(prefix):]
+    return session_request(self, method, url, *args, **kwargs)
+
+
+requests.Session.request = request
+
+from baseline_main import app  # noqa: E402,F401
+"""
+
+
+def prepare_baseline(rev, directory):
+    """Writes main.py at `rev` (default: the root commit) and its launcher into directory; returns the rev used."""
+    here = os.path.dirname(os.path.abspath(__file__))
+    git = ["git", "-C", here]
+    if rev is None:
+        rev = subprocess.check_output([*git, "rev-list", "--max-parents=0", "HEAD"], text=True).split()[-1]
+    source = subprocess.check_output([*git, "show", f"{rev}:main.py"])
+    with open(os.path.join(directory, "baseline_main.py"), "wb") as f:
+        f.write(source)
+    with open(os.path.join(directory, "baseline_app.py"), "w", encoding="utf-8") as f:
+        f.write(BASELINE_LAUNCHER)
+    return rev[:7]
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(target, port, env, workers=1, cwd=None):
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", target, "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning",
+         "--workers", str(workers)],
+        env=env,
+        stdout=subprocess.DEVNULL,
+        cwd=cwd or os.path.dirname(os.path.abspath(__file__)),
+    )
+    return wait_for_port(proc, port, target)
+
+
+def wait_for_port(proc, port, target):
+    deadline = time.time() + 20
+    while time.time() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.2):
+                return proc
+        except OSError:
+            time.sleep(0.1)
+    proc.kill()
+    raise RuntimeError(f"{target} did not start on port {port}")
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * q))]
+
+
+async def send_turn(http, endpoint, body):
+    """One turn; returns (ok, degraded, first_byte_s, total_s)."""
+    start = time.perf_counter()
+    first_byte = None
+    async with http.stream("POST", ENDPOINT_PATHS[endpoint], json=body) as response:
+        chunks = []
+        async for chunk in response.aiter_bytes():
+            if first_byte is None:
+                first_byte = time.perf_counter() - start
+            chunks.append(chunk)
+    total = time.perf_counter() - start
+    if response.status_code != 200:
+        return False, False, first_byte or total, total
+    payload = b"".join(chunks).decode()
+    if endpoint == "chat":
+        degraded = bool(json.loads(payload).get("degraded"))
+    else:
+        done = payload.rsplit("event: done\ndata: ", 1)
+        degraded = len(done) == 2 and bool(json.loads(done[1].split("\n", 1)[0]).get("degraded"))
+    return True, degraded, first_byte, total
+
+
+async def run_level(base_url, stub_url, endpoint, concurrency, total):
+    """Plays `total` turns of CONVERSATIONS with `concurrency` workers against one endpoint."""
+    latencies, first_bytes = [], []
+    errors = degraded = 0
+    turns = iter(range(total))
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=60,
+                                 limits=httpx.Limits(max_connections=concurrency)) as http:
+        async def worker(worker_id):
+            nonlocal errors, degraded
+            conversation = 0
+            while True:
+                # 대화 하나를 처음부터 끝까지 (예산이 남아 있는 동안)
+                turns_of = CONVERSATIONS[(worker_id + conversation * concurrency) % len(CONVERSATIONS)]
+                chat_id = f"{endpoint}-{worker_id}-{conversation}-{time.monotonic_ns()}"
+                conversation += 1
+                for user_input in turns_of:
+                    if next(turns, None) is None:
+                        return
+                    body = {"user_id": f"bench{worker_id}", "chat_id": chat_id, "user_input": user_input}
+                    try:
+                        ok, was_degraded, first_byte, elapsed = await send_turn(http, endpoint, body)
+                    except httpx.HTTPError:
+                        ok, was_degraded, first_byte, elapsed = False, False, 0.0, 0.0
+                    errors += not ok
+                    degraded += was_degraded
+                    if ok:
+                        latencies.append(elapsed)
+                        first_bytes.append(first_byte)
+
+        calls_before = (await http.get(stub_url + "/__stub/calls")).json()
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(w) for w in range(concurrency)))
+        elapsed = time.perf_counter() - start
+        calls_after = (await http.get(stub_url + "/__stub/calls")).json()
+
+    latencies.sort()
+    first_bytes.sort()
+    calls = {name: calls_after.get(name, 0) - calls_before.get(name, 0) for name in ("openai", "booking", "google")}
+    return {
+        "endpoint": endpoint,
+        "concurrency": concurrency,
+        "requests": total,
+        "errors": errors,
+        "degraded": degraded,
+        "rps": total / elapsed,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "first_byte_p50_ms": percentile(first_bytes, 0.50) * 1000,
+        "llm_calls_per_turn": calls["openai"] / total,
+        "upstream_calls_per_turn": sum(calls.values()) / total,
+        "calls": calls,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--latency-ms", type=float, default=100, help="median stub upstream latency")
+    parser.add_argument("--latency-dist", choices=["fixed", "uniform", "lognormal"], default="fixed")
+    parser.add_argument("--latency-jitter", type=float, default=0.5,
+                        help="uniform: +/- fraction of the median; lognormal: sigma")
+    parser.add_argument("--provider-latency", nargs="*", default=[], metavar="PROVIDER=MS",
+                        help="per-provider median latency override, e.g. openai=800")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16, 64])
+    parser.add_argument("--requests", type=int, default=200, help="turns per endpoint and concurrency level")
+    parser.add_argument("--endpoints", nargs="+", choices=sorted(ENDPOINT_PATHS), default=["chat"])
+    parser.add_argument("--error-rate", type=float, default=0, help="share of stub responses turned into 503s")
+    parser.add_argument("--hang-rate", type=float, default=0, help="share of stub responses that never arrive")
+    parser.add_argument("--fault-providers", nargs="+", default=["booking", "google", "openai"])
+    parser.add_argument("--json", help="also write every result row to this file")
+    parser.add_argument("--target", choices=["main", "baseline"], default="main",
+                        help="baseline: the original blocking app from git (only has /chat)")
+    parser.add_argument("--baseline-rev", help="git revision of main.py for --target baseline (default: root commit)")
+    args = parser.parse_args()
+    if args.target == "baseline" and args.endpoints != ["chat"]:
+        parser.error("--target baseline only serves /chat (use --endpoints chat)")
+
+    stub_port, app_port = free_port(), free_port()
+    env = dict(
+        os.environ,
+        STUB_LATENCY_MS=str(args.latency_ms),
+        STUB_LATENCY_DIST=args.latency_dist,
+        STUB_LATENCY_JITTER=str(args.latency_jitter),
+        STUB_PROVIDER_LATENCY=",".join(args.provider_latency),
+        STUB_ERROR_RATE=str(args.error_rate),
+        STUB_HANG_RATE=str(args.hang_rate),
+        STUB_FAULT_PROVIDERS=",".join(args.fault_providers),
+    )
+    stub = start_server("benchmark:stub_app", stub_port, env)
+    stub_url = f"http://127.0.0.1:{stub_port}"
+    app_env = dict(
+        env,
+        OPENAI_API_KEY="stub",
+        RAPIDAPI_KEY="stub",
+        GOOGLE_API_KEY="stub",
+        OPENAI_BASE_URL=f"{stub_url}/v1",
+        BOOKING_BASE_URL=stub_url,
+        PLACES_BASE_URL=stub_url,
+        LOG_LEVEL=os.getenv("LOG_LEVEL", "WARNING"),
+        BOOKING_RPS=os.getenv("BOOKING_RPS", "1000"),  # 스텁은 쿼터가 없음 - 실제 RapidAPI 한도로 측정하려면 env로 지정
+        BOOKING_BURST=os.getenv("BOOKING_BURST", "1000"),
+    )
+    baseline_dir = None
+    target = "main:app"
+    if args.target == "baseline":
+        baseline_dir = tempfile.TemporaryDirectory()
+        target = f"baseline {prepare_baseline(args.baseline_rev, baseline_dir.name)}"
+        server = start_server("baseline_app:app", app_port, dict(app_env, BASELINE_STUB_URL=stub_url),
+                              cwd=baseline_dir.name)
+    else:
+        server = start_server("main:app", app_port, app_env)
+    rows = []
+    try:
+        latency = f"{args.latency_ms:.0f} ms {args.latency_dist}"
+        if args.provider_latency:
+            latency += f" ({', '.join(args.provider_latency)})"
+        print(f"{target}: stub latency {latency}, {args.requests} turns per level over {len(CONVERSATIONS)} conversations "
+              f"({WORKLOAD_TURNS} turns), faults: {args.error_rate:.0%} errors / {args.hang_rate:.0%} hangs "
+              f"on {', '.join(args.fault_providers)}")
+        print(f"{'endpoint':>8} {'conc':>5} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'ttfb ms':>8} "
+              f"{'llm/turn':>9} {'up/turn':>8} {'errors':>7} {'degraded':>9}")
+        for endpoint in args.endpoints:
+            for concurrency in args.concurrency:
+                result = asyncio.run(run_level(f"http://127.0.0.1:{app_port}", stub_url, endpoint,
+                                               concurrency, args.requests))
+                rows.append(result)
+                print(f"{endpoint:>8} {concurrency:>5} {result['rps']:>8.1f} {result['p50_ms']:>8.1f} "
+                      f"{result['p95_ms']:>8.1f} {result['p99_ms']:>8.1f} {result['first_byte_p50_ms']:>8.1f} "
+                      f"{result['llm_calls_per_turn']:>9.2f} {result['upstream_calls_per_turn']:>8.2f} "
+                      f"{result['errors']:>7} {result['degraded']:>9}")
+    finally:
+        server.terminate()
+        stub.terminate()
+        server.wait()
+        stub.wait()
+        if baseline_dir is not None:
+            baseline_dir.cleanup()
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "results": rows}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+"""
+Offline builder for the city catalogue main.py serves popular cities from.
+
+For every city in the list (the keys of dest_seed.json by default) it stores
+the Booking dest_id and the top Places results of the two searches /chat
+makes when the user gave no food filter ("restaurant in X", "tourist
+attraction in X"). It writes them to a new SQLite file and atomically renames
+that over CATALOGUE_PATH as version + 1. Running workers pick the new file
+up within CATALOGUE_RELOAD_INTERVAL.
+
+    python build_catalogue.py                              # needs RAPIDAPI_KEY and GOOGLE_API_KEY
+    python build_catalogue.py --refresh --max-age-days 7   # only refetch rows older than a week
+    python build_catalogue.py --cities Osaka Tokyo --output /tmp/catalogue.sqlite3
+    python build_catalogue.py --stub                       # plumbing check, no quota
+
+A row that fails to refresh keeps its previous value and timestamp, so the
+app's staleness limits (CATALOGUE_DEST_MAX_AGE / CATALOGUE_PLACES_MAX_AGE)
+decide when it stops being served. Meant to run from cron, e.g. weekly with
+--refresh.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sqlite3
+import sys
+import time
+from datetime import datetime, timezone
+
+SCHEMA = """
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE cities (query TEXT PRIMARY KEY, name TEXT, dest_id TEXT, updated_at REAL);
+CREATE TABLE places (key TEXT PRIMARY KEY, section TEXT, places TEXT, updated_at REAL);
+"""
+
+
+def read_existing(path, schema):
+    """(version, cities, places) of the current file; rows are only reused when the schema matches."""
+    if not os.path.exists(path):
+        return 0, {}, {}
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        meta = dict(conn.execute("SELECT key, value FROM meta"))
+        version = int(meta.get("version", 0))
+        if meta.get("schema") != str(schema):
+            return version, {}, {}
+        cities = {row[0]: row[1:] for row in conn.execute("SELECT query, name, dest_id, updated_at FROM cities")}
+        places = {row[0]: row[1:] for row in conn.execute("SELECT key, section, places, updated_at FROM places")}
+        return version, cities, places
+    except sqlite3.Error as e:
+        print(f"ignoring unreadable catalogue {path}: {e}")
+        return 0, {}, {}
+    finally:
+        conn.close()
+
+
+def write_catalogue(path, schema, version, cities, places):
+    tmp = f"{path}.tmp-{os.getpid()}"
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    conn = sqlite3.connect(tmp)
+    try:
+        conn.executescript(SCHEMA)
+        conn.executemany("INSERT INTO meta VALUES (?, ?)", [
+            ("schema", str(schema)),
+            ("version", str(version)),
+            ("built_at", datetime.now(timezone.utc).isoformat(timespec="seconds")),
+        ])
+        conn.executemany("INSERT INTO cities VALUES (?, ?, ?, ?)", [(query, *row) for query, row in cities.items()])
+        conn.executemany("INSERT INTO places VALUES (?, ?, ?, ?)", [(key, *row) for key, row in places.items()])
+        conn.commit()
+    finally:
+        conn.close()
+    os.replace(tmp, path)  # 읽는 워커는 열린 이전 파일을 계속 쓰다가 reload에서 새 버전으로 전환
+
+
+async def collect(main, seed, old_cities, old_places, max_age, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    cities, places = {}, {}
+    counts = {"fetched": 0, "kept": 0, "failed": 0, "unknown": 0}
+    now = time.time()
+
+    async def refresh(table, key, old, fetch, make_row):
+        if old is not None and now - old[-1] < max_age:
+            table[key] = old
+            counts["kept"] += 1
+            return
+        async with semaphore:
+            try:
+                result = await fetch()
+            except Exception as e:
+                print(f"  failed {key}: {e}")
+                counts["failed"] += 1
+                if old is not None:
+                    table[key] = old  # 실패하면 이전 값을 그대로 (만료 판단은 앱의 staleness 한도)
+                return
+        if result is None:
+            counts["unknown"] += 1
+            return
+        table[key] = make_row(result)
+        counts["fetched"] += 1
+
+    jobs = []
+    for city, seeded_id in seed.items():
+        query = main.normalize_dest_query(city)
+        if seeded_id:
+            cities[query] = (city, str(seeded_id), now)
+        else:
+            jobs.append(refresh(cities, query, old_cities.get(query),
+                                lambda city=city: main.fetch_dest_id_from_booking(city),
+                                lambda result: (result[0], str(result[1]), time.time())))
+        searches = [
+            ("foods", main.food_places_query(city, main.init_context()), None),
+            ("tourist_spots", main.tourist_places_query(city), "tourist_attraction"),
+        ]
+        for section, search, place_type in searches:
+            key = json.dumps(main.places_cache_key(search, place_type), ensure_ascii=False)
+            jobs.append(refresh(places, key, old_places.get(key),
+                                lambda search=search, place_type=place_type: main.fetch_places(search, place_type),
+                                lambda result, section=section: (section, json.dumps(result, ensure_ascii=False), time.time())))
+    await asyncio.gather(*jobs)
+    return cities, places, counts
+
+
+async def build(args, seed):
+    import main
+    version, old_cities, old_places = read_existing(args.output, main.CATALOGUE_SCHEMA)
+    max_age = args.max_age_days * 24 * 3600 if args.refresh else 0
+    async with main.lifespan(main.app):
+        cities, places, counts = await collect(main, seed, old_cities, old_places, max_age, args.concurrency)
+    write_catalogue(args.output, main.CATALOGUE_SCHEMA, version + 1, cities, places)
+    return version + 1, cities, places, counts
+
+
+def main_():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cities", nargs="*", help="city names (default: the keys of DEST_SEED_FILE)")
+    parser.add_argument("--output", default=os.getenv("CATALOGUE_PATH", "city_catalogue.sqlite3"))
+    parser.add_argument("--refresh", action="store_true", help="keep rows younger than --max-age-days")
+    parser.add_argument("--max-age-days", type=float, default=7)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--stub", action="store_true", help="fetch from benchmark.stub_app instead of Booking/Places")
+    args = parser.parse_args()
+
+    stub = None
+    os.environ.update(DATEPARSER_PRELOAD="0", HTTP_PREWARM="0", PREFETCH_ENABLED="0")
+    os.environ.setdefault("LOG_LEVEL", "ERROR")  # 실패는 아래에서 직접 출력 (OpenAI 키 없이도 조용히 동작)
+    if args.stub:
+        import benchmark
+        port = benchmark.free_port()
+        stub = benchmark.start_server("benchmark:stub_app", port, dict(os.environ, STUB_LATENCY_MS="20"))
+        url = f"http://127.0.0.1:{port}"
+        os.environ.update(RAPIDAPI_KEY="stub", GOOGLE_API_KEY="stub", BOOKING_BASE_URL=url, PLACES_BASE_URL=url)
+    elif not (os.getenv("RAPIDAPI_KEY") and os.getenv("GOOGLE_API_KEY")):
+        print("RAPIDAPI_KEY and GOOGLE_API_KEY must be set (use --stub for an offline plumbing check)")
+        return 1
+
+    import main
+    seed = {city: None for city in args.cities} if args.cities else main.load_dest_seed()
+    if not seed:
+        print("no cities to build")
+        return 1
+    start = time.perf_counter()
+    try:
+        version, cities, places, counts = asyncio.run(build(args, seed))
+    finally:
+        if stub:
+            stub.terminate()
+            stub.wait()
+    print(f"catalogue v{version} -> {args.output}: {len(cities)} cities, {len(places)} place lists "
+          f"({counts['fetched']} fetched, {counts['kept']} kept, {counts['failed']} failed, "
+          f"{counts['unknown']} unknown) in {time.perf_counter() - start:.1f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_())
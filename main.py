@@ -1,37 +1,1256 @@
 # -*- coding: utf-8 -*-
 import os
-import openai
-import requests
+import sys
+import asyncio
+import dataclasses
+import json
+import time
+import random
+import contextvars
+import base64
+import itertools
+import logging
+import logging.handlers
+import queue
+import atexit
+import sqlite3
+import threading
+import importlib
+import httpx
+from collections import OrderedDict, deque
+from contextlib import aclosing, asynccontextmanager, contextmanager
+from dataclasses import dataclass
+from typing import Optional
 from datetime import datetime, timedelta
 import re
-from dateparser.search import search_dates
+import bisect
+import math
+import zlib
 from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from pydantic import BaseModel
 import urllib.parse
 
-app = FastAPI()
-client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 RAPIDAPI_KEY = os.getenv("RAPIDAPI_KEY")
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 
-memory_store = {}
+# 업스트림 주소 (벤치마크/테스트 시 로컬 스텁 서버로 교체 가능)
+BOOKING_BASE_URL = os.getenv("BOOKING_BASE_URL", "https://booking-com.p.rapidapi.com")
+PLACES_BASE_URL = os.getenv("PLACES_BASE_URL", "https://maps.googleapis.com/maps/api/place")
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL")  # None이면 OpenAI 기본값 사용
+HTTP_MAX_CONNECTIONS_PER_HOST = int(os.getenv("HTTP_MAX_CONNECTIONS_PER_HOST", "20"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30"))
+
+# /chat 병렬 조회 브랜치별 타임아웃(초) - 초과 시 해당 섹션만 degraded 처리
+BRANCH_TIMEOUTS = {
+    "recommendation": float(os.getenv("REPLY_TIMEOUT", "10")),
+    "hotels": float(os.getenv("HOTELS_TIMEOUT", "8")),
+    "foods": float(os.getenv("FOODS_TIMEOUT", "5")),
+    "tourist_spots": float(os.getenv("TOURIST_TIMEOUT", "5")),
+}
+# Booking dest_id 캐시 - 도시→dest_id 매핑은 거의 바뀌지 않으므로 TTL을 길게
+DEST_CACHE_SIZE = int(os.getenv("DEST_CACHE_SIZE", "2048"))
+DEST_CACHE_TTL = float(os.getenv("DEST_CACHE_TTL", str(7 * 24 * 3600)))
+DEST_CACHE_NEGATIVE_TTL = float(os.getenv("DEST_CACHE_NEGATIVE_TTL", str(6 * 3600)))
+DEST_SEED_FILE = os.getenv("DEST_SEED_FILE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "dest_seed.json"))
+DEST_CACHE_WARMUP = os.getenv("DEST_CACHE_WARMUP", "0") == "1"
+DEST_CACHE_BACKEND = os.getenv("DEST_CACHE_BACKEND", "memory")
+DEST_CACHE_PATH = os.getenv("DEST_CACHE_PATH", "dest_cache.sqlite3")
+
+# 호텔 검색 결과 캐시 - 가격/재고가 바뀌므로 짧은 TTL + stale-while-revalidate
+HOTEL_CACHE_SIZE = int(os.getenv("HOTEL_CACHE_SIZE", "1024"))
+HOTEL_CACHE_TTL = float(os.getenv("HOTEL_CACHE_TTL", "300"))
+HOTEL_CACHE_STALE_TTL = float(os.getenv("HOTEL_CACHE_STALE_TTL", "900"))
+HOTEL_CACHE_BACKEND = os.getenv("HOTEL_CACHE_BACKEND", "memory")
+HOTEL_CACHE_PATH = os.getenv("HOTEL_CACHE_PATH", "hotel_cache.sqlite3")
+# 호텔 결과 개수 (/chat의 hotel_count로 요청별 지정, 최대값 제한) 및 Booking 결과 페이지 조회 한도
+HOTEL_RESULT_COUNT = int(os.getenv("HOTEL_RESULT_COUNT", "5"))
+HOTEL_MAX_RESULT_COUNT = int(os.getenv("HOTEL_MAX_RESULT_COUNT", "20"))
+HOTEL_SEARCH_MAX_PAGES = int(os.getenv("HOTEL_SEARCH_MAX_PAGES", "3"))
+# 호텔을 추천된 맛집/관광지와의 거리로 재정렬하고, 반경 안의 장소를 호텔별 nearby로 묶음
+HOTEL_PROXIMITY_RANK = os.getenv("HOTEL_PROXIMITY_RANK", "1") == "1"
+NEARBY_RADIUS_KM = float(os.getenv("NEARBY_RADIUS_KM", "1.5"))
+NEARBY_MAX_SPOTS = int(os.getenv("NEARBY_MAX_SPOTS", "3"))
+
+# 대화 세션 저장소 - backend: memory (LRU+TTL) | sqlite (재시작/멀티 워커 공유)
+SESSION_STORE_BACKEND = os.getenv("SESSION_STORE_BACKEND", "memory")
+SESSION_STORE_PATH = os.getenv("SESSION_STORE_PATH", "sessions.sqlite3")
+SESSION_STORE_SIZE = int(os.getenv("SESSION_STORE_SIZE", "200000"))
+SESSION_STORE_MAX_BYTES = int(os.getenv("SESSION_STORE_MAX_BYTES", str(256 * 1024 * 1024)))
+SESSION_TTL = float(os.getenv("SESSION_TTL", str(3 * 24 * 3600)))
+# sqlite 세션 저장소에서 같은 채팅의 턴을 워커 간에도 직렬화하는 파일 락 (키 해시로 고른 stripe 파일에 flock)
+SESSION_LOCK_DIR = os.getenv("SESSION_LOCK_DIR", SESSION_STORE_PATH + ".locks")
+SESSION_LOCK_STRIPES = int(os.getenv("SESSION_LOCK_STRIPES", "256"))
+SESSION_LOCK_POLL = float(os.getenv("SESSION_LOCK_POLL", "0.005"))
+
+# 서버 실행 (python main.py) - dev: 자동 재시작 단일 프로세스, production: WEB_CONCURRENCY개 워커
+SERVER_MODE = os.getenv("SERVER_MODE", "dev")
+PORT = int(os.getenv("PORT", "10000"))
+# 워커 수 (uvicorn --workers도 같은 env를 기본값으로 사용) - 제공자 속도 제한/선조회 예산을 워커 수로 나눔
+WEB_CONCURRENCY = max(1, int(os.getenv("WEB_CONCURRENCY", "1")))
+# production에서 워커가 2개 이상이면 기본값을 sqlite로 바꾸는 공유 상태 (env로 직접 지정한 값은 유지)
+SHARED_STATE_BACKENDS = (
+    "SESSION_STORE_BACKEND", "PLACES_CACHE_BACKEND", "DEST_CACHE_BACKEND",
+    "HOTEL_CACHE_BACKEND", "EXTRACTION_MEMO_BACKEND",
+)
+# sqlite 백엔드의 잠금 대기 한도(초) - 캐시는 이벤트 루프에서 짧게만 기다리고 넘으면 miss/저장 생략,
+# 세션은 스레드에서 읽고 쓰므로 더 오래 기다리고, 넘으면 요청을 실패시킴 (빈 컨텍스트로 덮어쓰지 않도록)
+SQLITE_BUSY_TIMEOUT = float(os.getenv("SQLITE_BUSY_TIMEOUT", "0.05"))
+SESSION_BUSY_TIMEOUT = float(os.getenv("SESSION_BUSY_TIMEOUT", "5"))
+
+# dateparser 로케일 데이터 선로딩 (첫 호출이 매우 느림)
+DATEPARSER_PRELOAD = os.getenv("DATEPARSER_PRELOAD", "1") == "1"
+# 실패한 시작 단계(openai/dateparser 로딩 등) 재시도 횟수와 첫 대기(초, 매번 2배)
+STARTUP_RETRIES = int(os.getenv("STARTUP_RETRIES", "3"))
+STARTUP_RETRY_DELAY = float(os.getenv("STARTUP_RETRY_DELAY", "2"))
+# 시작 직후 업스트림 호스트에 커넥션(TLS 포함)을 미리 열어 둠
+HTTP_PREWARM = os.getenv("HTTP_PREWARM", "1") == "1"
+
+# 목적지 별칭 사전 (한/영 별칭 → 영문 도시명) - GPT 없이 바로 목적지를 확정하는 데 사용
+GAZETTEER_FILE = os.getenv("GAZETTEER_FILE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "gazetteer.json"))
+
+# GPT 슬롯 추출 메모이제이션 (정규화된 입력 → 목적지/호텔 필터)
+EXTRACTION_MEMO_SIZE = int(os.getenv("EXTRACTION_MEMO_SIZE", "4096"))
+EXTRACTION_MEMO_TTL = float(os.getenv("EXTRACTION_MEMO_TTL", str(24 * 3600)))
+EXTRACTION_MEMO_BACKEND = os.getenv("EXTRACTION_MEMO_BACKEND", "memory")
+EXTRACTION_MEMO_PATH = os.getenv("EXTRACTION_MEMO_PATH", "extraction_memo.sqlite3")
+
+# Google Places 검색 캐시 (맛집/관광지 공용) - backend: memory | sqlite
+PLACES_CACHE_BACKEND = os.getenv("PLACES_CACHE_BACKEND", "memory")
+PLACES_CACHE_PATH = os.getenv("PLACES_CACHE_PATH", "places_cache.sqlite3")
+PLACES_CACHE_SIZE = int(os.getenv("PLACES_CACHE_SIZE", "4096"))
+PLACES_CACHE_MAX_BYTES = int(os.getenv("PLACES_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))
+PLACES_CACHE_TTL = float(os.getenv("PLACES_CACHE_TTL", str(24 * 3600)))
+
+# 인기 도시 카탈로그 (build_catalogue.py로 오프라인 생성) - dest_id/맛집/관광지를 네트워크 없이 응답
+CATALOGUE_PATH = os.getenv("CATALOGUE_PATH", "city_catalogue.sqlite3")
+CATALOGUE_DEST_MAX_AGE = float(os.getenv("CATALOGUE_DEST_MAX_AGE", str(90 * 24 * 3600)))
+CATALOGUE_PLACES_MAX_AGE = float(os.getenv("CATALOGUE_PLACES_MAX_AGE", str(30 * 24 * 3600)))
+CATALOGUE_RELOAD_INTERVAL = float(os.getenv("CATALOGUE_RELOAD_INTERVAL", "60"))  # 재생성된 파일 감지 주기
+CATALOGUE_MMAP_BYTES = int(os.getenv("CATALOGUE_MMAP_BYTES", str(64 * 1024 * 1024)))
+
+# 로그 레벨 (DEBUG면 턴별 슬롯/업스트림 응답까지 출력)
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+
+# 작업별 모델 라우팅 - 추출은 저렴/저지연 모델, 응답을 파싱할 수 없을 때만 escalate_to 모델로 재시도
+MODEL_ROUTES = {
+    "extraction": {
+        "model": os.getenv("EXTRACTION_MODEL", "gpt-4o-mini"),
+        "max_tokens": int(os.getenv("EXTRACTION_MAX_TOKENS", "100")),
+        "temperature": 0.0,
+        "escalate_to": os.getenv("EXTRACTION_ESCALATION_MODEL", "gpt-4o"),
+    },
+    "reply": {
+        "model": os.getenv("REPLY_MODEL", "gpt-4o"),
+        "max_tokens": int(os.getenv("REPLY_MAX_TOKENS", "150")),
+        "temperature": float(os.getenv("REPLY_TEMPERATURE", "1.0")),
+        "escalate_to": None,
+    },
+}
+
+# 답변 템플릿 정책 - templates: 슬롯 채우기/추천/마무리 턴은 LLM 없이 템플릿으로 답변, llm: 항상 gpt-4o
+REPLY_POLICY = os.getenv("REPLY_POLICY", "templates")
+# 템플릿으로 처리할 턴 종류 (recommendations, slot_update, closing 중 선택)
+REPLY_TEMPLATE_INTENTS = set(os.getenv("REPLY_TEMPLATE_INTENTS", "recommendations,slot_update,closing").split(","))
+
+# /chat/batch - 요청당 최대 항목 수, 동시에 처리하는 대화 수
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "500"))
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+
+# 추천 선행 조회 - 목적지+날짜가 채워지면 다음 턴에 쓸 호텔/맛집/관광지 캐시를 미리 채움
+PREFETCH_ENABLED = os.getenv("PREFETCH_ENABLED", "1") == "1"
+PREFETCH_WORKERS = int(os.getenv("PREFETCH_WORKERS", "2"))
+PREFETCH_QUEUE_SIZE = int(os.getenv("PREFETCH_QUEUE_SIZE", "256"))
+PREFETCH_RESERVE = float(os.getenv("PREFETCH_RESERVE", "0.5"))  # 제공자 rate-limit 버킷 중 실사용 트래픽용으로 남길 비율
+PREFETCH_MAX_PER_MINUTE = int(os.getenv("PREFETCH_MAX_PER_MINUTE", "120"))
+
+FALLBACK_REPLY = "Sorry, I couldn't put together a reply just now. Could you tell me a bit more about your trip?"
+
+try:
+    import h2  # noqa: F401  (pip install httpx[http2])
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+# NumPy는 선택 의존성이고 import에 ~100ms가 걸려 SpotIndex가 처음 쓸 때 로드 - 없으면 거리 계산을 순수 파이썬으로
+_numpy = None
+_numpy_checked = False
+
+def load_numpy():
+    """The numpy module, imported on first call; None when it isn't installed."""
+    global _numpy, _numpy_checked
+    if not _numpy_checked:
+        try:
+            _numpy = importlib.import_module("numpy")
+        except ImportError:
+            _numpy = None
+        _numpy_checked = True
+    return _numpy
+
+try:
+    import fcntl  # Unix 전용 - 없으면 워커 간 세션 락 없이 프로세스 내 락만 사용
+except ImportError:
+    fcntl = None
+
+# 호스트별 커넥션 풀 - lifespan에서 생성/정리
+http_clients = {}
+client = None
+
+caches = {}
+upstreams = {}
+background_tasks = set()
+
+_MISSING = object()
+
+def setup_logging():
+    """
+    Leveled logging that never blocks the event loop on stdout: records go
+    through a QueueHandler and a background QueueListener thread writes them.
+    """
+    logger = logging.getLogger("flyby")
+    if logger.handlers:
+        return logger
+    records = queue.SimpleQueue()
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(message)s"))
+    listener = logging.handlers.QueueListener(records, handler)
+    listener.start()
+    atexit.register(listener.stop)
+    logger.addHandler(logging.handlers.QueueHandler(records))
+    logger.setLevel(LOG_LEVEL)
+    logger.propagate = False
+    return logger
+
+log = setup_logging()
+
+# --- 메트릭 (Prometheus text format, GET /metrics) ---
+metrics = {}
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def _escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _format_labels(labelnames, values, extra=""):
+    pairs = [f'{name}="{_escape_label(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._values = {}
+        metrics[name] = self
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        for key, value in self._values.items():
+            yield self.name + _format_labels(self.labelnames, key), value
+
+class Histogram:
+    """Cumulative-bucket latency histogram; observe() is a bisect plus three additions."""
+
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self._series = {}  # labels -> [per-bucket counts..., +Inf count, sum]
+        metrics[name] = self
+
+    def observe(self, value, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = [0] * (len(self.buckets) + 2)
+        series[bisect.bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def samples(self):
+        for key, series in self._series.items():
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), series):
+                cumulative += count
+                yield self.name + "_bucket" + _format_labels(self.labelnames, key, f'le="{bound}"'), cumulative
+            yield self.name + "_sum" + _format_labels(self.labelnames, key), series[-1]
+            yield self.name + "_count" + _format_labels(self.labelnames, key), cumulative
+
+class GaugeCallback:
+    """Gauge/counter family read from existing stats at scrape time (caches, breakers, sessions)."""
+
+    def __init__(self, name, help, collect, kind="gauge"):
+        self.name = name
+        self.help = help
+        self.kind = kind
+        self._collect = collect
+        metrics[name] = self
+
+    def samples(self):
+        for labels, value in self._collect():
+            yield self.name + _format_labels(tuple(labels), tuple(labels.values())), value
+
+def render_metrics():
+    lines = []
+    for metric in metrics.values():
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(f"{sample} {value}" for sample, value in metric.samples())
+    return "\n".join(lines) + "\n"
+
+request_latency = Histogram("flyby_request_seconds", "HTTP request latency by route.", ("route", "method", "status"))
+stage_latency = Histogram("flyby_stage_seconds", "Latency of each /chat stage.", ("stage", "outcome"))
+upstream_latency = Histogram("flyby_upstream_seconds", "Latency of each upstream attempt.", ("provider",))
+upstream_responses = Counter(
+    "flyby_upstream_responses_total",
+    "Upstream attempts by provider and HTTP status (or error class when no response arrived).",
+    ("provider", "status"),
+)
+
+def _cache_samples(field):
+    return lambda: (({"cache": name}, cache.stats()[field]) for name, cache in caches.items())
+
+BREAKER_STATES = {"closed": 0, "half_open": 1, "open": 2}
+
+GaugeCallback("flyby_cache_hits_total", "Fresh cache hits.", _cache_samples("hits"), kind="counter")
+GaugeCallback("flyby_cache_stale_hits_total", "Stale entries served while revalidating.", _cache_samples("stale_hits"), kind="counter")
+GaugeCallback("flyby_cache_coalesced_total", "Lookups that joined an in-flight load.", _cache_samples("coalesced"), kind="counter")
+GaugeCallback("flyby_cache_misses_total", "Cache misses (loader called).", _cache_samples("misses"), kind="counter")
+GaugeCallback("flyby_cache_entries", "Entries currently cached.", _cache_samples("size"))
+GaugeCallback(
+    "flyby_upstream_circuit_state", "Circuit breaker state (0 closed, 1 half-open, 2 open).",
+    lambda: (({"provider": name}, BREAKER_STATES[upstream.breaker.state]) for name, upstream in upstreams.items()),
+)
+GaugeCallback(
+    "flyby_llm_calls_total", "Extraction-stage LLM calls actually made.",
+    lambda: [({}, llm_call_stats["calls"])], kind="counter",
+)
+GaugeCallback(
+    "flyby_llm_requests_total", "Chat completion requests by task and routed model.",
+    lambda: (({"task": key.split(":", 1)[0], "model": key.split(":", 1)[1]}, count)
+             for key, count in model_call_stats["calls"].items()),
+    kind="counter",
+)
+GaugeCallback(
+    "flyby_llm_escalations_total", "Calls repeated on the larger model after unparseable output.",
+    lambda: (({"task": task}, count) for task, count in model_call_stats["escalations"].items()),
+    kind="counter",
+)
+GaugeCallback(
+    "flyby_prefetch_jobs_total", "Speculative prefetch jobs by outcome.",
+    lambda: (({"outcome": outcome}, count) for outcome, count in prefetcher.counts.items()),
+    kind="counter",
+)
+GaugeCallback(
+    "flyby_reply_turns_total", "Reply generation per turn, by source (template intent or llm).",
+    lambda: [({"source": "llm"}, reply_stats["turns"] - reply_stats["templated"])] + [
+        ({"source": intent}, reply_stats[intent]) for intent in ("recommendations", "slot_update", "closing")
+    ],
+    kind="counter",
+)
+
+@contextmanager
+def timed(stage):
+    """Records the enclosed block in flyby_stage_seconds{stage, outcome}."""
+    start = time.perf_counter()
+    outcome = "error"
+    try:
+        yield
+        outcome = "ok"
+    finally:
+        stage_latency.observe(time.perf_counter() - start, stage=stage, outcome=outcome)
+
+def _json_default(value):
+    return value.to_dict() if hasattr(value, "to_dict") else str(value)
+
+class TTLCache:
+    """
+    Bounded in-process LRU cache with per-entry TTL.
+
+    lookup() coalesces concurrent misses for the same key into a
+    single loader call. A loader returning None is cached for negative_ttl;
+    loader exceptions are never cached. With stale_ttl > 0 an expired entry is
+    still served for that long while one background reload refreshes it
+    (stale-while-revalidate). max_bytes optionally bounds the approximate
+    (JSON-encoded) size of the stored values as well as the entry count.
+
+    Subclasses swap the storage by overriding _read/_write/_delete/clear/__len__.
+    """
+
+    backend = "memory"
+    clock = staticmethod(time.monotonic)
+
+    def __init__(self, name, maxsize, ttl, negative_ttl=None, stale_ttl=0, max_bytes=None):
+        self.name = name
+        self.maxsize = maxsize
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.negative_ttl = ttl if negative_ttl is None else negative_ttl
+        self.stale_ttl = stale_ttl
+        self._data = OrderedDict()  # key -> (fresh_until, stale_until, value, nbytes)
+        self._bytes = 0
+        self._inflight = {}
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        caches[name] = self
+
+    def __len__(self):
+        return len(self._data)
+
+    def _read(self, key):
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        self._data.move_to_end(key)
+        return entry[:3]
+
+    def _write(self, key, fresh_until, stale_until, value):
+        nbytes = len(json.dumps(value, ensure_ascii=False, default=_json_default)) if self.max_bytes else 0
+        self._delete(key)
+        self._data[key] = (fresh_until, stale_until, value, nbytes)
+        self._bytes += nbytes
+        while self._data and (len(self._data) > self.maxsize or (self.max_bytes and self._bytes > self.max_bytes)):
+            _, evicted = self._data.popitem(last=False)
+            self._bytes -= evicted[3]
+            self.evictions += 1
+
+    def _delete(self, key):
+        entry = self._data.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry[3]
+
+    def clear(self):
+        self._data.clear()
+        self._bytes = 0
+
+    def delete(self, key):
+        self._delete(key)
+
+    def _lookup(self, key):
+        entry = self._read(key)
+        if entry is None:
+            return _MISSING, False
+        fresh_until, stale_until, value = entry
+        now = self.clock()
+        if now >= stale_until:
+            self._delete(key)
+            return _MISSING, False
+        return value, now >= fresh_until
+
+    def get(self, key):
+        value, stale = self._lookup(key)
+        return _MISSING if stale else value
+
+    def set(self, key, value, ttl=None):
+        if ttl is None:
+            ttl = self.negative_ttl if value is None else self.ttl
+        fresh_until = self.clock() + ttl
+        self._write(key, fresh_until, fresh_until + self.stale_ttl, value)
+
+    async def lookup(self, key, loader):
+        """Returns (value, status) where status is hit, stale, coalesced or miss."""
+        value, stale = self._lookup(key)
+        if value is not _MISSING:
+            if not stale:
+                self.hits += 1
+                return value, "hit"
+            self.stale_hits += 1
+            if key not in self._inflight:
+                self._start_load(key, loader)
+            return value, "stale"
+        task = self._inflight.get(key)
+        if task is None:
+            self.misses += 1
+            task = self._start_load(key, loader)
+            status = "miss"
+        else:
+            self.coalesced += 1
+            status = "coalesced"
+        # shield: 한 호출자가 타임아웃으로 취소돼도 나머지 대기자와 캐시 저장은 계속 진행
+        return await asyncio.shield(task), status
+
+    def _start_load(self, key, loader):
+        task = asyncio.ensure_future(self._load(key, loader))
+        self._inflight[key] = task
+        task.add_done_callback(lambda t: self._load_done(key, t))
+        return task
+
+    async def _load(self, key, loader):
+        value = await loader()
+        self.set(key, value)
+        return value
+
+    def _load_done(self, key, task):
+        self._inflight.pop(key, None)
+        if not task.cancelled() and task.exception() is not None:
+            # 대기자가 없는 백그라운드 갱신 실패도 여기서 처리 ("never retrieved" 경고 방지)
+            log.warning("❌ %s 캐시 갱신 실패: %s", self.name, task.exception())
+
+    def stats(self):
+        lookups = self.hits + self.stale_hits + self.misses + self.coalesced
+        stats = {
+            "backend": self.backend,
+            "size": len(self),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+            "hit_ratio": round((self.hits + self.stale_hits + self.coalesced) / lookups, 4) if lookups else 0.0,
+        }
+        if self.max_bytes:
+            stats["bytes"] = self._bytes
+            stats["max_bytes"] = self.max_bytes
+        return stats
+
+class SQLiteTTLCache(TTLCache):
+    """
+    TTLCache stored in an SQLite file (WAL mode) so entries survive restarts and
+    are shared by every uvicorn worker on the host. Keys and values must be
+    JSON-serializable. Hit/miss counters and request coalescing stay per-process.
+
+    Reads never write: LRU touches are buffered and flushed with the next
+    write (or every TOUCH_EVERY hits). Waits on another worker's write lock
+    are capped at busy_timeout; past it a read counts as a miss and a write
+    is dropped, as if the entry had been evicted. With raise_on_busy (the
+    session store) both raise instead: a conversation must not silently
+    restart from an empty context or lose a turn.
+    """
+
+    backend = "sqlite"
+    clock = staticmethod(time.time)  # 프로세스 간 공유되므로 wall clock 사용
+    PRUNE_EVERY = 64  # 매 쓰기마다 COUNT(*)를 하지 않도록 주기적으로만 정리
+    TOUCH_EVERY = 256  # 쓰기 없이 히트만 계속될 때 accessed를 모아서 갱신하는 주기
+
+    def __init__(self, name, maxsize, ttl, path, busy_timeout=SQLITE_BUSY_TIMEOUT, raise_on_busy=False, **kwargs):
+        super().__init__(name, maxsize, ttl, **kwargs)
+        self.path = path
+        self.raise_on_busy = raise_on_busy
+        self._writes = 0
+        self._touched = {}  # key(JSON) -> 마지막 히트 시각, 다음 쓰기 때 한 트랜잭션으로 반영
+        self.busy_errors = 0
+        # 세션 저장소는 asyncio.to_thread에서도 쓰므로 커넥션 사용을 직렬화
+        self._db_lock = threading.RLock()
+        self._conn = sqlite3.connect(path, timeout=busy_timeout, isolation_level=None, check_same_thread=False)
+        for attempt in range(50):
+            try:
+                # 여러 워커가 동시에 새 파일을 열면 WAL 전환이 busy_timeout 없이 바로 locked로 실패할 수 있음
+                self._conn.execute("PRAGMA journal_mode=WAL")
+                break
+            except sqlite3.OperationalError:
+                if attempt == 49:
+                    raise
+                time.sleep(0.05 + random.random() * 0.05)
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache (name TEXT, key TEXT, fresh_until REAL, stale_until REAL,"
+            " accessed REAL, value TEXT, PRIMARY KEY (name, key))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS cache_lru ON cache (name, accessed)")
+
+    def __len__(self):
+        with self._db_lock:
+            return self._conn.execute("SELECT COUNT(*) FROM cache WHERE name = ?", (self.name,)).fetchone()[0]
+
+    def _key(self, key):
+        return json.dumps(key, ensure_ascii=False)
+
+    def _busy(self, action, e):
+        self.busy_errors += 1
+        if self.raise_on_busy:
+            raise e
+        log.warning("⚠️ %s 캐시 %s 생략 (sqlite: %s)", self.name, action, e)
+
+    def _read(self, key):
+        encoded = self._key(key)
+        with self._db_lock:
+            try:
+                row = self._conn.execute(
+                    "SELECT fresh_until, stale_until, value FROM cache WHERE name = ? AND key = ?", (self.name, encoded)
+                ).fetchone()
+            except sqlite3.OperationalError as e:
+                self._busy("읽기", e)
+                return None
+            if row is None:
+                return None
+            self._touched[encoded] = time.time()
+            if len(self._touched) >= self.TOUCH_EVERY:
+                self._write_batch([])
+        return row[0], row[1], json.loads(row[2])
+
+    def _write(self, key, fresh_until, stale_until, value):
+        row = (self.name, self._key(key), fresh_until, stale_until, time.time(), json.dumps(value, ensure_ascii=False))
+        with self._db_lock:
+            self._write_batch([("INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?, ?, ?)", row)])
+            self._writes += 1
+            if self._writes % self.PRUNE_EVERY == 0:
+                self.prune()
+
+    def _write_batch(self, statements):
+        """Runs statements plus the buffered LRU touches in one write transaction."""
+        touched, self._touched = self._touched, {}
+        try:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.executemany(
+                    "UPDATE cache SET accessed = ? WHERE name = ? AND key = ?",
+                    [(accessed, self.name, encoded) for encoded, accessed in touched.items()],
+                )
+                for sql, params in statements:
+                    self._conn.execute(sql, params)
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        except sqlite3.OperationalError as e:
+            self._busy("쓰기", e)
+
+    def prune(self):
+        """Drops expired rows, then least-recently-used rows beyond maxsize (run every PRUNE_EVERY writes)."""
+        with self._db_lock:
+            self._write_batch([("DELETE FROM cache WHERE name = ? AND stale_until <= ?", (self.name, time.time()))])
+            overflow = len(self) - self.maxsize
+            if overflow > 0:
+                self._write_batch([(
+                    "DELETE FROM cache WHERE rowid IN (SELECT rowid FROM cache WHERE name = ? ORDER BY accessed LIMIT ?)",
+                    (self.name, overflow),
+                )])
+                self.evictions += overflow
+
+    def _delete(self, key):
+        encoded = self._key(key)
+        with self._db_lock:
+            self._touched.pop(encoded, None)
+            self._write_batch([("DELETE FROM cache WHERE name = ? AND key = ?", (self.name, encoded))])
+
+    def clear(self):
+        with self._db_lock:
+            self._touched.clear()
+            self._write_batch([("DELETE FROM cache WHERE name = ?", (self.name,))])
+
+    def stats(self):
+        stats = super().stats()
+        stats["busy_errors"] = self.busy_errors
+        stats.pop("bytes", None)
+        stats.pop("max_bytes", None)  # 파일 백엔드는 항목 수로만 제한
+        stats["file_bytes"] = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+        return stats
+
+def make_cache(name, maxsize, ttl, backend="memory", path=None, busy_timeout=SQLITE_BUSY_TIMEOUT,
+               raise_on_busy=False, **kwargs):
+    if backend == "sqlite":
+        return SQLiteTTLCache(name, maxsize, ttl, path, busy_timeout=busy_timeout, raise_on_busy=raise_on_busy, **kwargs)
+    if backend != "memory":
+        raise ValueError(f"Unknown cache backend: {backend}")
+    return TTLCache(name, maxsize, ttl, **kwargs)
+
+CATALOGUE_SCHEMA = 1
+
+class CityCatalogue:
+    """
+    Read-only view of the city catalogue file written by build_catalogue.py:
+    Booking dest_ids and top Places results for popular cities, in SQLite
+    opened memory-mapped so every worker shares the OS page cache. Rows
+    older than their staleness limit are not served and the lookup falls
+    through to the live caches. The builder swaps in a new version with an
+    atomic rename; reload() notices and reopens without a restart.
+    """
+
+    def __init__(self, path, dest_max_age, places_max_age):
+        self.path = path
+        self.dest_max_age = dest_max_age
+        self.places_max_age = places_max_age
+        self.meta = {}
+        self._conn = None
+        self._signature = None
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+
+    def reload(self):
+        """Opens the file if it is new or was rebuilt; returns True when another version got loaded."""
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return False  # 파일이 없으면 카탈로그 없이 동작 (이미 열린 버전은 계속 사용)
+        signature = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        if signature == self._signature:
+            return False
+        self._signature = signature
+        try:
+            conn = sqlite3.connect(f"file:{urllib.parse.quote(os.path.abspath(self.path))}?mode=ro",
+                                   uri=True, check_same_thread=False)
+            conn.execute(f"PRAGMA mmap_size={CATALOGUE_MMAP_BYTES}")
+            meta = dict(conn.execute("SELECT key, value FROM meta"))
+        except sqlite3.Error as e:
+            log.warning("❌ 카탈로그 로드 실패 (%s): %s", self.path, e)
+            return False
+        if meta.get("schema") != str(CATALOGUE_SCHEMA):
+            log.warning("❌ 카탈로그 스키마 %s는 지원하지 않음 (필요: %s)", meta.get("schema"), CATALOGUE_SCHEMA)
+            conn.close()
+            return False
+        previous, self._conn, self.meta = self._conn, conn, meta
+        if previous is not None:
+            previous.close()
+        log.info("📚 카탈로그 v%s 로드 (%s, 생성 %s)", meta.get("version"), self.path, meta.get("built_at"))
+        return True
+
+    def _lookup(self, sql, key, max_age):
+        if self._conn is None:
+            return None
+        row = self._conn.execute(sql, (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        if time.time() - row[-1] > max_age:
+            self.expired += 1  # 너무 오래된 항목은 실시간 조회로 넘김
+            return None
+        self.hits += 1
+        return row[:-1]
+
+    def dest_id(self, query):
+        """(name, dest_id) for a catalogued city, else None."""
+        row = self._lookup("SELECT name, dest_id, updated_at FROM cities WHERE query = ?",
+                           normalize_dest_query(query), self.dest_max_age)
+        return (row[0], row[1]) if row else None
+
+    def places(self, query, place_type=None):
+        """Formatted Places results stored for exactly this search, else None."""
+        row = self._lookup("SELECT places, updated_at FROM places WHERE key = ?",
+                           json.dumps(places_cache_key(query, place_type), ensure_ascii=False), self.places_max_age)
+        return json.loads(row[0]) if row else None
+
+    def stats(self):
+        stats = {"loaded": self._conn is not None, "path": self.path, "hits": self.hits,
+                 "misses": self.misses, "expired": self.expired}
+        if self._conn is not None:
+            stats.update(
+                version=int(self.meta.get("version", 0)),
+                built_at=self.meta.get("built_at"),
+                cities=self._conn.execute("SELECT COUNT(*) FROM cities").fetchone()[0],
+                places=self._conn.execute("SELECT COUNT(*) FROM places").fetchone()[0],
+            )
+        return stats
+
+catalogue = CityCatalogue(CATALOGUE_PATH, CATALOGUE_DEST_MAX_AGE, CATALOGUE_PLACES_MAX_AGE)
+
+async def reload_catalogue_periodically(interval=CATALOGUE_RELOAD_INTERVAL):
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            catalogue.reload()
+        except Exception as e:
+            log.warning("❌ 카탈로그 갱신 확인 실패: %s", e)
+
+# 요청 단위 캐시 상태 (/chat 응답의 "cache" 메타데이터) - gather된 브랜치들이 같은 dict를 공유
+turn_cache_status = contextvars.ContextVar("turn_cache_status", default=None)
+
+def record_cache_status(section, status):
+    statuses = turn_cache_status.get()
+    if statuses is not None:
+        statuses[section] = status
+
+dest_id_cache = make_cache(
+    "dest_id", DEST_CACHE_SIZE, DEST_CACHE_TTL,
+    backend=DEST_CACHE_BACKEND, path=DEST_CACHE_PATH, negative_ttl=DEST_CACHE_NEGATIVE_TTL,
+)
+hotel_search_cache = make_cache(
+    "hotel_search", HOTEL_CACHE_SIZE, HOTEL_CACHE_TTL,
+    backend=HOTEL_CACHE_BACKEND, path=HOTEL_CACHE_PATH, stale_ttl=HOTEL_CACHE_STALE_TTL,
+)
+extraction_memo = make_cache(
+    "extraction", EXTRACTION_MEMO_SIZE, EXTRACTION_MEMO_TTL,
+    backend=EXTRACTION_MEMO_BACKEND, path=EXTRACTION_MEMO_PATH,
+)
+places_cache = make_cache(
+    "places", PLACES_CACHE_SIZE, PLACES_CACHE_TTL,
+    backend=PLACES_CACHE_BACKEND, path=PLACES_CACHE_PATH, max_bytes=PLACES_CACHE_MAX_BYTES,
+)
+
+class SessionStore:
+    """
+    Conversation contexts keyed by "{user_id}_{chat_id}".
+
+    Backed by a TTLCache (in-process LRU + idle TTL) or an SQLiteTTLCache (WAL
+    file that survives restarts and is shared by every worker on the host).
+    Each save() restarts the idle TTL. lock(key) serializes concurrent turns on
+    the same chat within this process and, given a lock_dir, across workers.
+    """
+
+    def __init__(self, cache, lock_dir=None, stripes=SESSION_LOCK_STRIPES):
+        self.cache = cache
+        self._locks = {}  # key -> [asyncio.Lock, waiter count]
+        self.lock_dir = lock_dir if fcntl is not None else None
+        self.stripes = stripes
+        self.lock_waits = 0
+        if self.lock_dir:
+            os.makedirs(self.lock_dir, exist_ok=True)
+
+    async def load(self, key):
+        # sqlite 백엔드는 다른 워커의 쓰기를 기다릴 수 있으므로 이벤트 루프 밖에서
+        context = await self._run(self.cache.get, key)
+        if context is _MISSING:
+            self.cache.misses += 1
+            return None
+        self.cache.hits += 1
+        if isinstance(context, dict):
+            return ConversationContext.from_dict(context)
+        return context.copy()
+
+    async def save(self, key, context):
+        # 파일 백엔드는 JSON, 메모리 백엔드는 slotted 객체 그대로 보관
+        if self.cache.backend == "memory":
+            self.cache.set(key, context.copy())
+        else:
+            await self._run(self.cache.set, key, context.to_dict())
+
+    async def _run(self, method, *args):
+        if self.cache.backend == "memory":
+            return method(*args)
+        return await asyncio.to_thread(method, *args)
+
+    @asynccontextmanager
+    async def lock(self, key):
+        entry = self._locks.get(key)
+        if entry is None:
+            entry = self._locks[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                if self.lock_dir is None:
+                    yield
+                else:
+                    async with self._worker_lock(key):
+                        yield
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._locks[key]
+
+    @asynccontextmanager
+    async def _worker_lock(self, key):
+        """flock on one of `stripes` files chosen by a stable hash of the key; released when the fd closes."""
+        stripe = zlib.crc32(key.encode()) % self.stripes
+        fd = os.open(os.path.join(self.lock_dir, f"{stripe}.lock"), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            while True:
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except BlockingIOError:
+                    # 다른 워커가 같은 stripe를 잡고 있음 - 이벤트 루프를 막지 않도록 폴링
+                    self.lock_waits += 1
+                    await asyncio.sleep(SESSION_LOCK_POLL)
+            yield
+        finally:
+            os.close(fd)
+
+    def stats(self):
+        stats = {**self.cache.stats(), "active_locks": len(self._locks)}
+        if self.lock_dir:
+            stats["worker_lock_waits"] = self.lock_waits
+        return stats
+
+session_store = SessionStore(
+    make_cache(
+        "sessions", SESSION_STORE_SIZE, SESSION_TTL,
+        backend=SESSION_STORE_BACKEND, path=SESSION_STORE_PATH, max_bytes=SESSION_STORE_MAX_BYTES,
+        busy_timeout=SESSION_BUSY_TIMEOUT, raise_on_busy=True,
+    ),
+    lock_dir=SESSION_LOCK_DIR if SESSION_STORE_BACKEND == "sqlite" else None,
+)
+
+def spawn_background(coro):
+    """Start a fire-and-forget task, keeping a reference so it isn't garbage-collected."""
+    task = asyncio.ensure_future(coro)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    return task
+
+def make_http_client(base_url=""):
+    """Pooled keep-alive client for a single upstream host (per-host connection limit)."""
+    return httpx.AsyncClient(
+        base_url=base_url,
+        http2=HTTP2_AVAILABLE,
+        limits=httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS_PER_HOST,
+            max_keepalive_connections=HTTP_MAX_CONNECTIONS_PER_HOST,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+        ),
+        timeout=httpx.Timeout(30.0),
+    )
+
+class UpstreamError(Exception):
+    pass
+
+class CircuitOpenError(UpstreamError):
+    pass
+
+class RetryableStatus(Exception):
+    def __init__(self, response):
+        super().__init__(f"HTTP {response.status_code}")
+        self.response = response
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+# openai 예외는 openai 모듈을 지연 로딩할 때 추가됨 (load_openai)
+RETRYABLE_ERRORS = (
+    httpx.TransportError,
+    asyncio.TimeoutError,
+    RetryableStatus,
+)
+
+class TokenBucket:
+    """Token-bucket rate limiter: `rate` requests/s sustained, bursts up to `capacity`."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    async def acquire(self, timeout):
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            wait = (1 - self.tokens) / self.rate
+            if wait > timeout:
+                raise UpstreamError("rate limit budget exhausted")
+            timeout -= wait
+            await asyncio.sleep(wait)
+
+class CircuitBreaker:
+    """Opens after `failure_threshold` consecutive failures; lets one probe through after `reset_timeout`."""
+
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if self.probing or time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def allow(self):
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self.probing:
+            self.probing = True
+            return True
+        return False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self.probing or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+        self.probing = False
+
+class Upstream:
+    """
+    Resilience wrapper for one provider: an overall deadline per call, bounded
+    retries with full-jitter exponential backoff on transport errors, timeouts,
+    429 and 5xx, a circuit breaker that fast-fails while the provider is down,
+    and a token bucket sized to the provider's quota.
+    """
+
+    def __init__(self, name, timeout, retries, rate, burst, failure_threshold=5, reset_timeout=30.0,
+                 backoff_base=0.2, backoff_max=2.0):
+        self.name = name
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.bucket = TokenBucket(rate, burst)
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.calls = 0
+        self.failures = 0
+        self.retried = 0
+        self.short_circuited = 0
+        upstreams[name] = self
+
+    async def call(self, request):
+        """Runs request() (a zero-arg coroutine factory) under this provider's policy."""
+        if not self.breaker.allow():
+            self.short_circuited += 1
+            raise CircuitOpenError(f"{self.name} circuit open")
+        probe = self.breaker.probing  # half-open 상태에서 들여보낸 시험 호출
+        settled = False
+        self.calls += 1
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.timeout
+        error = None
+        try:
+            for attempt in range(self.retries + 1):
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                await self.bucket.acquire(remaining)
+                start = time.perf_counter()
+                try:
+                    result = await asyncio.wait_for(request(), deadline - loop.time())
+                except RETRYABLE_ERRORS as e:
+                    self._observe(start, e)
+                    error = e
+                except Exception as e:
+                    # 4xx 등 재시도 불가 오류는 제공자 장애로 보지 않음
+                    self._observe(start, e)
+                    settled = True
+                    self.breaker.record_success()
+                    raise
+                else:
+                    self._observe(start, result)
+                    settled = True
+                    self.breaker.record_success()
+                    return result
+                backoff = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+                if attempt == self.retries or loop.time() + backoff >= deadline:
+                    break
+                self.retried += 1
+                await asyncio.sleep(backoff)
+            self.failures += 1
+            settled = True
+            self.breaker.record_failure()
+            log.warning("❌ %s 업스트림 실패 (시도 %d회): %s", self.name, attempt + 1, error or "deadline exceeded")
+            raise UpstreamError(f"{self.name} failed: {error or 'deadline exceeded'}")
+        finally:
+            if probe and not settled:
+                # 취소(클라이언트 끊김/종료)나 rate-limit 예산 소진으로 결과 없이 끝난 시험 호출 -
+                # 실패로 기록해 다시 열어 두고 reset_timeout 뒤 다음 시험을 허용 (half-open에 고정되지 않도록)
+                self.breaker.record_failure()
+
+    def _observe(self, start, outcome):
+        upstream_latency.observe(time.perf_counter() - start, provider=self.name)
+        if isinstance(outcome, RetryableStatus):
+            outcome = outcome.response
+        status = getattr(outcome, "status_code", None)
+        if status is None:
+            status = type(outcome).__name__ if isinstance(outcome, BaseException) else "ok"
+        upstream_responses.inc(provider=self.name, status=status)
+
+    async def get(self, url, **kwargs):
+        async def request():
+            response = await http_clients[self.name].get(url, **kwargs)
+            if response.status_code in RETRYABLE_STATUS:
+                raise RetryableStatus(response)
+            return response
+        return await self.call(request)
+
+    def stats(self):
+        return {
+            "state": self.breaker.state,
+            "calls": self.calls,
+            "failures": self.failures,
+            "retried": self.retried,
+            "short_circuited": self.short_circuited,
+            "tokens": round(self.bucket.tokens, 2),
+        }
+
+def make_upstream(name, timeout, retries, rate, burst):
+    prefix = name.upper()
+    # 속도 제한은 서비스 전체 쿼터 기준 - 버킷이 워커마다 따로 있으므로 워커 수로 나눔
+    return Upstream(
+        name,
+        timeout=float(os.getenv(f"{prefix}_TIMEOUT", str(timeout))),
+        retries=int(os.getenv(f"{prefix}_RETRIES", str(retries))),
+        rate=float(os.getenv(f"{prefix}_RPS", str(rate))) / WEB_CONCURRENCY,
+        burst=max(1.0, float(os.getenv(f"{prefix}_BURST", str(burst))) / WEB_CONCURRENCY),
+        failure_threshold=int(os.getenv(f"{prefix}_BREAKER_FAILURES", "5")),
+        reset_timeout=float(os.getenv(f"{prefix}_BREAKER_RESET", "30")),
+    )
+
+# 제공자별 기본값 - 데드라인은 /chat 브랜치 타임아웃보다 짧게, 속도 제한은 쿼터에 맞게 (env로 조정)
+booking_upstream = make_upstream("booking", timeout=6.0, retries=2, rate=5, burst=10)
+google_upstream = make_upstream("google", timeout=4.0, retries=2, rate=50, burst=50)
+openai_upstream = make_upstream("openai", timeout=8.0, retries=1, rate=50, burst=50)
+
+async def load_openai():
+    """
+    Imports the openai SDK (~0.7 s of module loading, kept off the import path
+    of main) in a worker thread and creates the shared AsyncOpenAI client.
+    Safe to call concurrently; the first caller to finish creates the client.
+    """
+    global client, RETRYABLE_ERRORS
+    if client is not None:
+        return client
+    openai = await asyncio.to_thread(importlib.import_module, "openai")
+    if client is None:
+        RETRYABLE_ERRORS = RETRYABLE_ERRORS + (
+            openai.APIConnectionError,  # APITimeoutError 포함
+            openai.RateLimitError,
+            openai.InternalServerError,
+        )
+        client = openai.AsyncOpenAI(
+            api_key=os.getenv("OPENAI_API_KEY"),
+            base_url=OPENAI_BASE_URL,
+            http_client=http_clients["openai"],
+            max_retries=0,  # 재시도/데드라인은 openai_upstream이 담당
+        )
+    return client
+
+# 시작 단계별 상태 (/ready) - None: 진행 중, 숫자: 완료까지 걸린 ms, 문자열: 실패 사유
+startup_stages = {}
+
+async def run_startup_stage(name, start, started, retries=0):
+    """Awaits start() and records the outcome; a failure is retried `retries` times with doubling delays."""
+    startup_stages[name] = None
+    for attempt in range(retries + 1):
+        try:
+            await start()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            startup_stages[name] = f"failed: {e}"
+            log.warning("❌ startup %s failed (attempt %d/%d): %s", name, attempt + 1, retries + 1, e)
+            if attempt < retries:
+                await asyncio.sleep(STARTUP_RETRY_DELAY * 2 ** attempt)
+        else:
+            startup_stages[name] = round((time.perf_counter() - started) * 1000, 1)
+            log.info("🚀 %s ready after %.0f ms", name, startup_stages[name])
+            return
+
+async def prewarm_http_pools():
+    """One cheap HEAD per upstream host so DNS, TCP and TLS are done before the first lookup."""
+    async def touch(name, url=""):
+        try:
+            await http_clients[name].head(url, timeout=5)
+        except httpx.HTTPError:
+            pass  # 커넥션만 열면 되므로 응답은 무시
+
+    await asyncio.gather(touch("booking"), touch("google"), touch("openai", OPENAI_BASE_URL or "https://api.openai.com/v1"))
+
+async def warm_up(started):
+    # 모듈 로딩은 GIL을 두고 경쟁하므로 동시에 하지 않고 첫 요청에 필요한 openai부터 순서대로
+    await run_startup_stage("openai", load_openai, started, STARTUP_RETRIES)
+    if DATEPARSER_PRELOAD:
+        await run_startup_stage("dateparser", lambda: asyncio.to_thread(warm_dateparser), started, STARTUP_RETRIES)
+
+# 준비 완료 판단에 필요한 단계 (dest_id 워밍업/커넥션 예열은 best-effort).
+# 둘 다 요청 경로에서 처음 쓸 때 다시 로딩하므로, 재시도까지 실패해도 준비 완료로 보고 failed에만 표시
+READINESS_STAGES = ("openai", "dateparser")
+
+@asynccontextmanager
+async def lifespan(app):
+    global client
+    # 첫 요청에 필요한 것만 동기적으로 준비하고, 무거운 작업은 백그라운드에서
+    started = time.perf_counter()
+    http_clients["booking"] = make_http_client(BOOKING_BASE_URL)
+    http_clients["google"] = make_http_client(PLACES_BASE_URL)
+    http_clients["openai"] = make_http_client()
+    startup_stages.clear()
+    startup_stages["http_pools"] = round((time.perf_counter() - started) * 1000, 1)
+    catalogue.reload()
+    spawn_background(reload_catalogue_periodically())
+    if WEB_CONCURRENCY > 1 and SESSION_STORE_BACKEND == "memory":
+        log.warning("⚠️ %d workers with SESSION_STORE_BACKEND=memory - conversations are lost when a turn "
+                    "lands on another worker (use SERVER_MODE=production python main.py)", WEB_CONCURRENCY)
+    spawn_background(warm_up(started))
+    if HTTP_PREWARM:
+        spawn_background(run_startup_stage("http_prewarm", prewarm_http_pools, started))
+    if DEST_CACHE_WARMUP:
+        spawn_background(run_startup_stage("dest_cache", warm_dest_cache, started))
+    if PREFETCH_ENABLED:
+        prefetcher.start()
+    try:
+        yield
+    finally:
+        for task in list(background_tasks):
+            task.cancel()
+        for http_client in http_clients.values():
+            await http_client.aclose()
+        http_clients.clear()
+        client = None
+
+app = FastAPI(lifespan=lifespan)
+
+@app.middleware("http")
+async def record_request_latency(request: Request, call_next):
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # 라우트 템플릿으로 집계 (알 수 없는 경로는 하나로 묶어 라벨 폭증 방지)
+        route = request.scope.get("route")
+        request_latency.observe(
+            time.perf_counter() - start,
+            route=route.path if route else "unmatched", method=request.method, status=status,
+        )
+
+@dataclass(slots=True)
+class ConversationContext:
+    """
+    Slot state for one chat. Slotted, with interned strings (destinations and
+    dates repeat across sessions) and a tuple for hotel_filter, so hundreds of
+    thousands of idle sessions stay small. to_dict()/from_dict() give the JSON
+    shape used by the /chat response and the persistent session store.
+    """
+    destination: Optional[str] = None
+    departure_date: Optional[str] = None
+    return_date: Optional[str] = None
+    duration: Optional[int] = None
+    adults_number: Optional[int] = None
+    children_number: int = 0
+    no_rooms: int = 1
+    flight_asked: bool = False
+    hotel_asked: bool = False
+    hotel_filter: Optional[tuple] = None
+    food_asked: bool = False
+    food_filter: Optional[str] = None
+    tourist_asked: bool = False
+
+    def __setattr__(self, name, value):
+        if type(value) is str:
+            value = sys.intern(value)
+        elif name == "hotel_filter" and value is not None:
+            value = tuple(sys.intern(kw) for kw in value)
+        object.__setattr__(self, name, value)
+
+    def to_dict(self):
+        data = {name: getattr(self, name) for name in CONTEXT_FIELDS}
+        if self.hotel_filter is not None:
+            data["hotel_filter"] = list(self.hotel_filter)
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**{name: data[name] for name in CONTEXT_FIELDS if name in data})
+
+    def copy(self):
+        return dataclasses.replace(self)
+
+CONTEXT_FIELDS = tuple(field.name for field in dataclasses.fields(ConversationContext))
 
 def init_context():
-    return {
-        "destination": None,
-        "departure_date": None,
-        "return_date": None,
-        "duration": None,
-        "adults_number": None,
-        "children_number": 0,
-        "no_rooms": 1,
-        "flight_asked": False,
-        "hotel_asked": False,
-        "hotel_filter": None,
-        "food_asked": False,
-        "food_filter": None,
-        "tourist_asked": False
-    }
+    return ConversationContext()
 
 def korean_number_to_int(text):
     mapping = {'일':1, '이':2, '삼':3, '사':4, '오':5, '육':6, '칠':7, '팔':8, '구':9, '십':10}
@@ -51,375 +1270,1113 @@ def korean_number_to_int(text):
             result += mapping[text]
     return result
 
-def extract_dates_from_message(message):
-    # Korean format: 2025년 6월 20일
-    manual_match = re.search(r'(\d{4})년\s*(\d{1,2})월\s*(\d{1,2})일', message)
-    if manual_match:
-        year = int(manual_match.group(1))
-        month = int(manual_match.group(2))
-        day = int(manual_match.group(3))
-        departure = datetime(year, month, day)
-    else:
-        # Korean format: 6월 20일
-        manual_match = re.search(r'(\d{1,2})월\s*(\d{1,2})일', message)
-        if manual_match:
-            now = datetime.now()
-            month = int(manual_match.group(1))
-            day = int(manual_match.group(2))
-            year = now.year
-            if month < now.month:
-                year += 1
-            departure = datetime(year, month, day)
-        else:
-            # English format: Jun 20, June 20, 6/20, etc.
-            en_match = re.search(r'(?:Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)[a-z]*\.?\s+(\d{1,2})', message, re.IGNORECASE)
-            if en_match:
-                try:
-                    date_match = search_dates(message, languages=["en"])
-                    if date_match:
-                        departure = date_match[0][1]
-                    else:
-                        departure = None
-                except:
-                    departure = None
-            else:
-                # Fallback: try dateparser for Korean
-                try:
-                    date_match = search_dates(message, languages=["ko", "en"])
-                    if date_match:
-                        departure = date_match[0][1]
-                    else:
-                        departure = None
-                except:
-                    departure = None
+MONTHS_EN = {m: i for i, m in enumerate(["jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec"], 1)}
+WEEKDAYS_EN = {d: i for i, d in enumerate(["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"])}
+WEEKDAYS_KO = {d: i for i, d in enumerate("월화수목금토일")}
+RELATIVE_DAYS = {"오늘": 0, "내일": 1, "모레": 2, "글피": 3, "today": 0, "tomorrow": 1, "day after tomorrow": 2}
 
-    nights = None
-    # Korean: X박 X일
-    stay_match = re.search(r'([0-9]+|[일이삼사오육칠팔구십]+)\s*박\s*([0-9]+|[일이삼사오육칠팔구십]+)\s*일', message)
-    if stay_match:
-        nights = korean_number_to_int(stay_match.group(2))
-    else:
-        # English: X nights, X days, X-day trip
-        en_night_match = re.search(r'(\d+)\s*night', message, re.IGNORECASE)
-        en_day_match = re.search(r'(\d+)\s*day', message, re.IGNORECASE)
-        if en_night_match:
-            nights = int(en_night_match.group(1)) + 1  # nights + 1 = days
-        elif en_day_match:
-            nights = int(en_day_match.group(1))
-        else:
-            # Korean: X일
-            duration_match = re.search(r'([0-9]+|[일이삼사오육칠팔구십]+)\s*일', message)
-            if duration_match:
-                nights = korean_number_to_int(duration_match.group(1))
+# 실제 월 표기만 (Marseille/Marriott/maybe/Decide 같은 단어 제외) - 그룹 1의 앞 세 글자가 MONTHS_EN 키
+_MONTH_NAME = (r'(jan(?:uary)?|feb(?:ruary)?|mar(?:ch)?|apr(?:il)?|may|june?|july?|aug(?:ust)?'
+               r'|sep(?:t(?:ember)?)?|oct(?:ober)?|nov(?:ember)?|dec(?:ember)?)(?:\.|\b)')
+KO_FULL_DATE_RE = re.compile(r'(\d{4})년\s*(\d{1,2})월\s*(\d{1,2})일')
+KO_DATE_RE = re.compile(r'(\d{1,2})월\s*(\d{1,2})일')
+ISO_DATE_RE = re.compile(r'(?<!\d)(\d{4})[-./](\d{1,2})[-./](\d{1,2})(?!\d)')
+EN_MONTH_DAY_RE = re.compile(r'\b' + _MONTH_NAME + r'\s+(\d{1,2})(?:st|nd|rd|th)?\b(?:,?\s*(\d{4})\b)?', re.IGNORECASE)
+EN_DAY_MONTH_RE = re.compile(r'\b(\d{1,2})(?:st|nd|rd|th)?\s+(?:of\s+)?' + _MONTH_NAME + r'(?:\s*,?\s*(\d{4})\b)?', re.IGNORECASE)
+SLASH_DATE_RE = re.compile(r'(?<![\d/])(\d{1,2})/(\d{1,2})(?![\d/])')
+RELATIVE_DAY_RE = re.compile(r'day after tomorrow|today|tomorrow|오늘|내일|모레|글피', re.IGNORECASE)
+KO_WEEKDAY_RE = re.compile(r'(다음\s*주|담주|이번\s*주)?\s*([월화수목금토일])요일')
+EN_WEEKDAY_RE = re.compile(r'\b(?:(next|this|coming)\s+)?(monday|tuesday|wednesday|thursday|friday|saturday|sunday)\b', re.IGNORECASE)
+# 규칙으로 못 읽은 날짜 후보가 남아 있을 때만 dateparser 사용 (체류 기간/인원 수 숫자는 제외하고 판단)
+DATE_TOKEN_RE = re.compile(
+    r'\d|\b' + _MONTH_NAME + r'|\b(?:next|last|this)\s+(?:week|month)\b|weekend|yesterday|tonight|'
+    r'어제|다음\s*주|이번\s*주|다음\s*달|이번\s*달|주말|요일|보름',
+    re.IGNORECASE,
+)
+
+def _upcoming_date(month, day, today):
+    # 연도가 없으면 올해, 이미 지난 달이면 내년
+    year = today.year + 1 if month < today.month else today.year
+    return datetime(year, month, day)
+
+def parse_date_fast(message, today=None):
+    """
+    Rule-based departure date for the common chat forms, or None.
+
+    Absolute: 2025년 6월 20일, 6월 20일, 2025-06-20 / 2025.6.20, June 20(, 2025), 20 June, 6/20 (month/day).
+    Relative: 오늘/내일/모레/글피, today/tomorrow/day after tomorrow,
+    (다음주|이번주) 금요일 and (next|this) Friday - "next"/"다음주" is that weekday in the
+    following Monday-based week, a bare weekday is its next occurrence after today.
+    """
+    today = today or datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    try:
+        if (match := KO_FULL_DATE_RE.search(message)):
+            return datetime(int(match.group(1)), int(match.group(2)), int(match.group(3)))
+        if (match := KO_DATE_RE.search(message)):
+            return _upcoming_date(int(match.group(1)), int(match.group(2)), today)
+        if (match := ISO_DATE_RE.search(message)):
+            return datetime(int(match.group(1)), int(match.group(2)), int(match.group(3)))
+        if (match := EN_MONTH_DAY_RE.search(message)):
+            month, day, year = MONTHS_EN[match.group(1).lower()[:3]], int(match.group(2)), match.group(3)
+            return datetime(int(year), month, day) if year else _upcoming_date(month, day, today)
+        if (match := EN_DAY_MONTH_RE.search(message)):
+            day, month, year = int(match.group(1)), MONTHS_EN[match.group(2).lower()[:3]], match.group(3)
+            return datetime(int(year), month, day) if year else _upcoming_date(month, day, today)
+        if (match := SLASH_DATE_RE.search(message)):
+            return _upcoming_date(int(match.group(1)), int(match.group(2)), today)
+    except ValueError:
+        return None  # 6월 31일 같은 잘못된 날짜
+
+    if (match := RELATIVE_DAY_RE.search(message)):
+        return today + timedelta(days=RELATIVE_DAYS[match.group(0).lower()])
+
+    weekday, modifier = None, None
+    if (match := KO_WEEKDAY_RE.search(message)):
+        weekday, modifier = WEEKDAYS_KO[match.group(2)], match.group(1)
+        modifier = "this" if modifier and modifier.startswith("이번") else ("next" if modifier else None)
+    elif (match := EN_WEEKDAY_RE.search(message)):
+        weekday, modifier = WEEKDAYS_EN[match.group(2).lower()], (match.group(1) or "").lower() or None
+        modifier = None if modifier == "coming" else modifier
+    if weekday is None:
+        return None
+    week_start = today - timedelta(days=today.weekday())
+    if modifier == "next":
+        return week_start + timedelta(days=7 + weekday)
+    if modifier == "this":
+        return week_start + timedelta(days=weekday)
+    days_ahead = (weekday - today.weekday()) % 7 or 7
+    return today + timedelta(days=days_ahead)
+
+def has_date_tokens(message):
+    """Cheap gate for dateparser: anything date-like left once stay length and traveller counts are removed."""
+    for pattern in (STAY_KO_RE, NIGHTS_EN_RE, DAYS_EN_RE, DAYS_KO_RE, ADULT_KO_RE, ADULT_EN_RE, CHILD_KO_RE, CHILD_EN_RE):
+        message = pattern.sub(" ", message)
+    return DATE_TOKEN_RE.search(message) is not None
+
+def parse_date_with_dateparser(message):
+    # dateparser는 import만으로도 수백 ms라 실제로 필요할 때 로딩 (warm_dateparser가 시작 시 미리 호출)
+    from dateparser.search import search_dates
+    try:
+        date_match = search_dates(message, languages=["ko", "en"])
+        if date_match:
+            return date_match[0][1]
+    except Exception:
+        pass
+    return None
+
+def warm_dateparser():
+    """First search_dates call loads the ko/en locale data (~1 s); do it before the first user needs it."""
+    parse_date_with_dateparser("2025년 6월 20일 next Friday")
+
+def extract_dates_from_message(message, nights=_MISSING):
+    if nights is _MISSING:
+        nights = extract_turn_slots(message)["nights"]
+    if not nights:
+        # 체류 기간이 없으면 날짜를 찾아도 결과를 돌려줄 수 없으므로 파싱 생략
+        return None, None
 
-    if departure and nights:
+    departure = parse_date_fast(message)
+    if departure is None and has_date_tokens(message):
+        departure = parse_date_with_dateparser(message)
+
+    if departure:
         checkin = departure.date()
         checkout = (departure + timedelta(days=nights)).date()
         return str(checkin), str(checkout)
     return None, None
 
-def extract_location_by_regex(text):
-    city_keywords = [
-        # 🇯🇵 일본 (Korean + English)
-        "오사카", "도쿄", "후쿠오카", "교토", "삿포로", "나고야", "나라", "요코하마",
-        "Osaka", "Tokyo", "Fukuoka", "Kyoto", "Sapporo", "Nagoya", "Nara", "Yokohama",
-        # 🇰🇷 한국
-        "서울", "부산", "제주", "인천", "대구", "광주", "대전", "수원",
-        "Seoul", "Busan", "Jeju", "Incheon", "Daegu", "Gwangju", "Daejeon", "Suwon",
-        # 🇺🇸 미국
-        "뉴욕", "로스앤젤레스", "샌프란시스코", "라스베가스", "시카고",
-        "New York", "Los Angeles", "San Francisco", "Las Vegas", "Chicago",
-        # 🇫🇷 프랑스
-        "파리", "리옹", "마르세유", "Paris", "Lyon", "Marseille",
-        # 🇮🇹 이탈리아
-        "로마", "밀라노", "베네치아", "피렌체", "Rome", "Milan", "Venice", "Florence",
-        # 🇪🇸 스페인
-        "바르셀로나", "마드리드", "세비야", "Barcelona", "Madrid", "Seville",
-        # 🇬🇧 영국
-        "런던", "에딘버러", "맨체스터", "London", "Edinburgh", "Manchester",
-        # 🇹🇭 태국
-        "방콕", "푸켓", "치앙마이", "Bangkok", "Phuket", "Chiang Mai",
-        # 🇦🇺 호주
-        "Melbourne", "Sydney", "Brisbane", "Perth",
-        "멜버른", "시드니", "브리즈번",
-        # 기타
-        "하와이", "발리", "싱가포르", "홍콩", "마카오", "두바이",
-        "Hawaii", "Bali", "Singapore", "Hong Kong", "Macau", "Dubai",
-        "Taipei", "Shanghai", "Beijing", "Amsterdam", "Berlin", "Prague",
-    ]
+class AhoCorasick:
+    """Multi-pattern substring matcher: one pass over the text however many patterns there are."""
+
+    def __init__(self, patterns):
+        # patterns: 소문자 패턴 -> payload
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]
+        for pattern, payload in patterns.items():
+            node = 0
+            for ch in pattern:
+                nxt = self._goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[node][ch] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append([])
+                node = nxt
+            self._out[node].append((len(pattern), payload))
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in self._goto[node].items():
+                queue.append(nxt)
+                fail = self._fail[node]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                fail = self._goto[fail].get(ch, 0)
+                self._fail[nxt] = fail if fail != nxt else 0
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def finditer(self, text):
+        """Yields (start, end, payload) for every (possibly overlapping) match."""
+        node = 0
+        for i, ch in enumerate(text):
+            while node and ch not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(ch, 0)
+            for length, payload in self._out[node]:
+                yield i - length + 1, i + 1, payload
+
+def load_gazetteer(path=GAZETTEER_FILE):
+    """Builds the alias matcher: alias -> (canonical English city, ambiguous?)."""
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    ambiguous = {alias.lower() for alias in data.get("ambiguous", [])}
+    patterns = {}
+    for city, aliases in data["cities"].items():
+        for alias in [city, *aliases]:
+            patterns[alias.lower()] = (city, alias.lower() in ambiguous)
+    return AhoCorasick(patterns)
+
+destination_matcher = load_gazetteer()
+
+# 한글 별칭 바로 뒤에 붙어도 지명으로 보는 조사/접미어 ("오사카에서", "도쿄행", "부산여행")
+KOREAN_ALIAS_SUFFIXES = (
+    "에", "에서", "엔", "으로", "로", "은", "는", "이", "가", "을", "를", "의", "도", "랑", "하고", "와", "과",
+    "까지", "부터", "만", "쪽", "행", "처럼", "보다", "나", "요", "갈", "갔", "시", "역", "공항", "성", "타워", "섬",
+    "여행", "맛집", "호텔", "숙소", "관광", "일정", "날씨", "항공", "비행기", "근처", "투어",
+)
+
+def _is_latin_word_char(ch):
+    return ch.isascii() and ch.isalnum()
+
+def _is_hangul(ch):
+    return "가" <= ch <= "힣"
+
+def _is_word_boundary_match(text, start, end):
+    if _is_latin_word_char(text[start]):
+        # 영문 별칭은 단어 경계에서만 인정 (Rome ≠ Romeo)
+        return not ((start > 0 and _is_latin_word_char(text[start - 1]))
+                    or (end < len(text) and _is_latin_word_char(text[end])))
+    if _is_hangul(text[start]):
+        # 한글 별칭은 앞에 다른 음절이 없고, 뒤는 경계이거나 조사/접미어일 때만 ("대구탕", "우리나라" 제외)
+        if start > 0 and _is_hangul(text[start - 1]):
+            return False
+        return end == len(text) or not _is_hangul(text[end]) or text.startswith(KOREAN_ALIAS_SUFFIXES, end)
+    return True
+
+def match_destinations(text):
+    """Leftmost-longest gazetteer matches in text as (canonical city, ambiguous) pairs."""
     text_lower = text.lower()
-    for city in city_keywords:
-        if city.lower() in text_lower:
-            return city
+    matches = []
+    for start, end, payload in destination_matcher.finditer(text_lower):
+        if not _is_word_boundary_match(text_lower, start, end):
+            continue
+        matches.append((start, end, payload))
+    matches.sort(key=lambda m: (m[0], -m[1]))
+    selected = []
+    last_end = 0
+    for start, end, payload in matches:
+        if start >= last_end:
+            selected.append(payload)
+            last_end = end
+    return selected
+
+def resolve_destination_locally(text):
+    """Canonical city if the text names exactly one known city through an unambiguous alias, else None."""
+    matches = match_destinations(text)
+    cities = {city for city, _ in matches}
+    if len(cities) == 1 and not any(ambiguous for _, ambiguous in matches):
+        return cities.pop()
     return None
 
-def extract_location_keyword_gpt(user_input):
-    prompt = """
-    Extract the travel destination or city name from the following sentence in one word.
-    The input can be in Korean or English.
+def extract_location_by_regex(text):
+    """Fallback when GPT is unavailable: first unambiguous gazetteer city, else the first match at all."""
+    matches = match_destinations(text)
+    for city, ambiguous in matches:
+        if not ambiguous:
+            return city
+    return matches[0][0] if matches else None
+
+EXTRACTION_PROMPT = """
+    Extract trip details from the following sentence. The input can be in Korean or English.
+    - destination: the travel destination or city name, always as the English name of the city in one word.
+      Use null if no destination is mentioned.
+    - hotel_filters: hotel preference keywords as written by the user (empty list if none).
     Examples:
-    '오사카 맛집 추천해줘' → 'Osaka'
-    'Recommend hotels in Tokyo' → 'Tokyo'
-    'I want to visit Paris' → 'Paris'
-    '서울 숙소 예약하고 싶어' → 'Seoul'
-    'Find restaurants in Melbourne' → 'Melbourne'
-    If no destination found, answer '없음'.
-    Always return the English name of the city.
+    '오사카 맛집 추천해줘' → {"destination": "Osaka", "hotel_filters": []}
+    'Recommend hotels in Tokyo' → {"destination": "Tokyo", "hotel_filters": []}
+    'budget hotel with pool in Paris' → {"destination": "Paris", "hotel_filters": ["pool", "budget"]}
+    '서울 가성비 좋은 호텔' → {"destination": "Seoul", "hotel_filters": ["가성비"]}
+    'Find restaurants in Melbourne' → {"destination": "Melbourne", "hotel_filters": []}
+    """
+
+EXTRACTION_SCHEMA = {
+    "name": "trip_slots",
+    "strict": True,
+    "schema": {
+        "type": "object",
+        "properties": {
+            "destination": {"type": ["string", "null"]},
+            "hotel_filters": {"type": "array", "items": {"type": "string"}},
+        },
+        "required": ["destination", "hotel_filters"],
+        "additionalProperties": False,
+    },
+}
+
+# 추출 단계 LLM 호출 통계 - legacy는 목적지/호텔 필터를 따로 호출하던 기존 방식 기준 호출 수
+llm_call_stats = {"turns": 0, "legacy_calls": 0, "calls": 0, "local_destinations": 0}
+# 모델 라우팅 통계 - "task:model" → 호출 수, task → 큰 모델로 재시도한 횟수
+model_call_stats = {"calls": {}, "escalations": {}}
+
+class UnparseableOutput(ValueError):
+    pass
+
+async def chat_completion(task, messages, model=None, **kwargs):
+    """chat.completions.create with the task's route (model, max_tokens, temperature) through openai_upstream."""
+    route = MODEL_ROUTES[task]
+    model = model or route["model"]
+    key = f"{task}:{model}"
+    model_call_stats["calls"][key] = model_call_stats["calls"].get(key, 0) + 1
+    openai_client = await load_openai()
+    return await openai_upstream.call(lambda: openai_client.chat.completions.create(
+        model=model,
+        messages=messages,
+        max_tokens=route["max_tokens"],
+        temperature=route["temperature"],
+        **kwargs,
+    ))
+
+async def routed_completion(task, messages, parse, **kwargs):
+    """
+    Runs the task on its routed model and returns parse(content). When the
+    output is unparseable (parse raises UnparseableOutput, or max_tokens cut
+    it off) the call is repeated once on the route's escalate_to model.
+    """
+    route = MODEL_ROUTES[task]
+    models = [route["model"]]
+    if route["escalate_to"] and route["escalate_to"] != route["model"]:
+        models.append(route["escalate_to"])
+    for i, model in enumerate(models):
+        response = await chat_completion(task, messages, model=model, **kwargs)
+        choice = response.choices[0]
+        try:
+            if choice.finish_reason == "length":
+                raise UnparseableOutput("truncated by max_tokens")
+            return parse(choice.message.content)
+        except UnparseableOutput as e:
+            if i == len(models) - 1:
+                raise
+            model_call_stats["escalations"][task] = model_call_stats["escalations"].get(task, 0) + 1
+            log.info("↗️ %s: %s 응답 파싱 실패 (%s) → %s로 재시도", task, model, e, models[i + 1])
+
+def normalize_user_input(user_input):
+    return " ".join(user_input.split()).lower()
+
+def extract_hotel_filters_by_keyword(user_input):
+    return extract_turn_slots(user_input)["hotel_filters"]
+
+def parse_trip_slots(content):
+    try:
+        data = json.loads(content or "")
+    except ValueError as e:
+        raise UnparseableOutput(f"invalid JSON: {e}") from e
+    if not isinstance(data, dict):
+        raise UnparseableOutput("expected a JSON object")
+    destination, hotel_filters = data.get("destination"), data.get("hotel_filters") or []
+    if not isinstance(destination, (str, type(None))) or not isinstance(hotel_filters, list) \
+            or not all(isinstance(kw, str) for kw in hotel_filters):
+        raise UnparseableOutput("fields don't match EXTRACTION_SCHEMA")
+    destination = (destination or "").strip()
+    if destination.lower() in ["없음", "없다", "null", "none"]:
+        destination = ""
+    return {
+        "destination": destination or None,
+        "hotel_filters": [kw.strip() for kw in hotel_filters if kw.strip()],
+    }
+
+async def fetch_trip_slots_gpt(user_input):
+    with timed("gpt_extraction"):
+        return await routed_completion(
+            "extraction",
+            [{"role": "system", "content": EXTRACTION_PROMPT}, {"role": "user", "content": user_input}],
+            parse_trip_slots,
+            response_format={"type": "json_schema", "json_schema": EXTRACTION_SCHEMA},
+        )
+
+async def extract_trip_slots(user_input, legacy_calls=2):
+    """
+    One structured-output GPT call for destination + hotel filter keywords,
+    memoized on the normalized input. Falls back to the regex/keyword paths
+    when GPT fails or finds no destination.
     """
+    status = "miss"
     try:
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[{"role": "system", "content": prompt}, {"role": "user", "content": user_input}]
+        slots, status = await extraction_memo.lookup(
+            normalize_user_input(user_input), lambda: fetch_trip_slots_gpt(user_input)
         )
-        extracted = response.choices[0].message.content.strip()
-        if not extracted or extracted.lower() in ["없음", "없다", "null", "none"]:
-            return extract_location_by_regex(user_input)
-        return extracted
     except Exception as e:
-        print("❌ GPT 위치 키워드 추출 실패:", str(e))
-        return extract_location_by_regex(user_input)
-
-def extract_hotel_filter_keywords_gpt(user_input):
-    prompt = "Extract hotel preference keywords from the sentence. Comma-separated. Examples: 'budget hotel with pool' → pool, budget. '가성비 좋은 호텔' → 가성비"
-    response = client.chat.completions.create(
-        model="gpt-4o",
-        messages=[{"role": "system", "content": prompt}, {"role": "user", "content": user_input}]
-    )
-    keywords = response.choices[0].message.content.strip()
-    return [kw.strip() for kw in keywords.split(",")]
+        log.warning("❌ GPT 슬롯 추출 실패: %s", e)
+        slots = {"destination": None, "hotel_filters": extract_hotel_filters_by_keyword(user_input)}
+    finally:
+        llm_call_stats["legacy_calls"] += legacy_calls
+        llm_call_stats["calls"] += 1 if status == "miss" else 0
+    return {
+        "destination": slots["destination"] or extract_location_by_regex(user_input),
+        "hotel_filters": list(slots["hotel_filters"]),
+    }
+
+async def extract_location_keyword_gpt(user_input):
+    return (await extract_trip_slots(user_input, legacy_calls=1))["destination"]
+
+HOTEL_CATEGORIES_MAP = {
+    "럭셔리": ["class::5", "class::4"],
+    "luxury": ["class::5", "class::4"],
+    "저렴한": ["price::1"],
+    "cheap": ["price::1"],
+    "budget": ["price::1"],
+    "가성비": ["price::1", "review_score::8"],
+    "value": ["price::1", "review_score::8"],
+    "수영장": ["facility::11"],
+    "pool": ["facility::11"],
+    "조식": ["mealplan::1"],
+    "조식포함": ["mealplan::1"],
+    "breakfast": ["mealplan::1"],
+    "반려동물": ["facility::5"],
+    "pet": ["facility::5"],
+    "pet-friendly": ["facility::5"],
+}
+
+HOTEL_KEYWORDS = ["숙소", "호텔", "잠잘 곳", "묵을 곳", "자고싶어", "hotel", "accommodation", "stay", "lodge", "hostel"]
+FOOD_KEYWORDS = ["맛집", "음식", "카페", "배고파", "먹을 곳", "restaurant", "food", "cafe", "dining", "eat", "cuisine"]
+FOOD_FILTER_KEYWORDS = ["감성", "인스타", "해변", "해변 근처", "분위기 좋은", "인기 많은", "저렴한", "vibe", "instagram", "beach", "beachside", "cozy", "popular", "cheap", "budget"]
+TOURIST_KEYWORDS = ["관광지", "명소", "볼거리", "관광명소", "가볼만한 곳", "attraction", "sightseeing", "tourist", "visit", "landmark", "places to visit"]
+
+KOREAN_NUMBER = r'([0-9]+|[일이삼사오육칠팔구십]+)'
+ADULT_KO_RE = re.compile(r'성인\s*' + KOREAN_NUMBER)
+ADULT_EN_RE = re.compile(r'(\d+)\s*adult', re.IGNORECASE)
+CHILD_KO_RE = re.compile(r'어린이\s*' + KOREAN_NUMBER)
+CHILD_EN_RE = re.compile(r'(\d+)\s*child', re.IGNORECASE)
+STAY_KO_RE = re.compile(KOREAN_NUMBER + r'\s*박\s*' + KOREAN_NUMBER + r'\s*일')
+NIGHTS_EN_RE = re.compile(r'(\d+)\s*night', re.IGNORECASE)
+DAYS_EN_RE = re.compile(r'(\d+)\s*day', re.IGNORECASE)
+DAYS_KO_RE = re.compile(KOREAN_NUMBER + r'\s*일')
+
+def build_keyword_matcher():
+    """One automaton for every intent/filter keyword plus the anchors that gate the number regexes."""
+    patterns = {}
+    tagged = [
+        (HOTEL_KEYWORDS, "hotel"),
+        (FOOD_KEYWORDS, "food"),
+        (TOURIST_KEYWORDS, "tourist"),
+        (FOOD_FILTER_KEYWORDS, "food_filter"),
+        (list(HOTEL_CATEGORIES_MAP), "hotel_filter"),
+        (["성인", "adult"], "adults"),
+        (["어린이", "child"], "children"),
+        (["박", "night", "day", "일"], "stay"),
+    ]
+    for keywords, tag in tagged:
+        for keyword in keywords:
+            patterns.setdefault(keyword.lower(), []).append((tag, keyword))
+    return AhoCorasick(patterns)
+
+keyword_matcher = build_keyword_matcher()
+
+def extract_turn_slots(user_input):
+    """
+    Single pass over the message for intents, filters, traveller counts and stay
+    length. Same results as the original per-keyword `in` checks and re.search
+    calls: keyword hits come from one automaton pass, and each precompiled
+    number regex only runs when its anchor word occurred.
+    """
+    hits = set()
+    for _, _, tags in keyword_matcher.finditer(user_input.lower()):
+        hits.update(tags)
+    tags = {tag for tag, _ in hits}
+
+    # 맛집 필터는 원문 기준(대소문자 구분), 목록 순서가 우선순위
+    food_filter = next((kw for kw in FOOD_FILTER_KEYWORDS if ("food_filter", kw) in hits and kw in user_input), None)
+
+    adults = None
+    if "adults" in tags:
+        match = ADULT_KO_RE.search(user_input)
+        if match:
+            adults = korean_number_to_int(match.group(1))
+        else:
+            match = ADULT_EN_RE.search(user_input)
+            if match:
+                adults = int(match.group(1))
+
+    children = None
+    if "children" in tags:
+        match = CHILD_KO_RE.search(user_input)
+        if match:
+            children = korean_number_to_int(match.group(1))
+        else:
+            match = CHILD_EN_RE.search(user_input)
+            if match:
+                children = int(match.group(1))
+
+    nights = None
+    if "stay" in tags:
+        # Korean: X박 X일 / English: X nights, X days / Korean: X일
+        match = STAY_KO_RE.search(user_input)
+        if match:
+            nights = korean_number_to_int(match.group(2))
+        elif (match := NIGHTS_EN_RE.search(user_input)):
+            nights = int(match.group(1)) + 1  # nights + 1 = days
+        elif (match := DAYS_EN_RE.search(user_input)):
+            nights = int(match.group(1))
+        elif (match := DAYS_KO_RE.search(user_input)):
+            nights = korean_number_to_int(match.group(1))
+
+    return {
+        "hotel": "hotel" in tags,
+        "food": "food" in tags,
+        "tourist": "tourist" in tags,
+        "food_filter": food_filter,
+        "hotel_filters": [kw for kw in HOTEL_CATEGORIES_MAP if ("hotel_filter", kw) in hits],
+        "adults": adults,
+        "children": children,
+        "nights": nights,
+    }
+
+async def update_context(user_input, conversation_context, turn=None):
+    if turn is None:
+        turn = extract_turn_slots(user_input)
 
-def update_context(user_input, conversation_context):
     # 💡 목적지 키워드는 요청 종류와 무관하게 항상 추출 시도, 단 이미 있으면 중복 호출 방지
-    if not conversation_context["destination"]:
-        new_dest = extract_location_keyword_gpt(user_input)
-        if new_dest and new_dest.lower() not in ["없음", "none", "null"]:
-            conversation_context["destination"] = new_dest
-
-    if any(k in user_input.lower() for k in ["숙소", "호텔", "잠잘 곳", "묵을 곳", "자고싶어", "hotel", "accommodation", "stay", "lodge", "hostel"]):
-        conversation_context["hotel_asked"] = True
-        if not conversation_context["hotel_filter"]:
-            conversation_context["hotel_filter"] = extract_hotel_filter_keywords_gpt(user_input)
-
-    if any(k in user_input.lower() for k in ["맛집", "음식", "카페", "배고파", "먹을 곳", "restaurant", "food", "cafe", "dining", "eat", "cuisine"]):
-        conversation_context["food_asked"] = True
-        filter_keywords = ["감성", "인스타", "해변", "해변 근처", "분위기 좋은", "인기 많은", "저렴한", "vibe", "instagram", "beach", "beachside", "cozy", "popular", "cheap", "budget"]
-        for keyword in filter_keywords:
-            if keyword in user_input:
-                conversation_context["food_filter"] = keyword
-                break
+    # 목적지와 호텔 필터는 한 번의 GPT 호출로 함께 추출
+    llm_call_stats["turns"] += 1
+    need_destination = not conversation_context.destination
+    need_hotel_filter = turn["hotel"] and not conversation_context.hotel_filter
+    if need_destination:
+        # 사전에서 도시가 하나로 확정되면 GPT를 거치지 않음
+        local_dest = resolve_destination_locally(user_input)
+        if local_dest:
+            conversation_context.destination = local_dest
+            need_destination = False
+            llm_call_stats["legacy_calls"] += 1
+            llm_call_stats["local_destinations"] += 1
+    if need_destination or need_hotel_filter:
+        slots = await extract_trip_slots(user_input, legacy_calls=int(need_destination) + int(need_hotel_filter))
+        new_dest = slots["destination"]
+        if need_destination and new_dest and new_dest.lower() not in ["없음", "none", "null"]:
+            conversation_context.destination = new_dest
+        if need_hotel_filter:
+            conversation_context.hotel_filter = slots["hotel_filters"]
+
+    if turn["hotel"]:
+        conversation_context.hotel_asked = True
+
+    if turn["food"]:
+        conversation_context.food_asked = True
+        if turn["food_filter"]:
+            conversation_context.food_filter = turn["food_filter"]
 
     # Tourist spot request detection
-    if any(k in user_input.lower() for k in ["관광지", "명소", "볼거리", "관광명소", "가볼만한 곳", "attraction", "sightseeing", "tourist", "visit", "landmark", "places to visit"]):
-        conversation_context["tourist_asked"] = True
+    if turn["tourist"]:
+        conversation_context.tourist_asked = True
 
-    if not conversation_context["departure_date"] or not conversation_context["return_date"]:
-        checkin, checkout = extract_dates_from_message(user_input)
+    if not conversation_context.departure_date or not conversation_context.return_date:
+        checkin, checkout = extract_dates_from_message(user_input, nights=turn["nights"])
         if checkin and checkout:
-            conversation_context["departure_date"] = checkin
-            conversation_context["return_date"] = checkout
-            conversation_context["duration"] = (datetime.strptime(checkout, "%Y-%m-%d") - datetime.strptime(checkin, "%Y-%m-%d")).days
-
-    # 성인 수 인식 (Korean + English)
-    adult_match = re.search(r'성인\s*([0-9]+|[일이삼사오육칠팔구십]+)', user_input)
-    if adult_match:
-        conversation_context["adults_number"] = korean_number_to_int(adult_match.group(1))
-    else:
-        en_adult_match = re.search(r'(\d+)\s*adult', user_input, re.IGNORECASE)
-        if en_adult_match:
-            conversation_context["adults_number"] = int(en_adult_match.group(1))
-
-    # 어린이 수 인식 (Korean + English)
-    child_match = re.search(r'어린이\s*([0-9]+|[일이삼사오육칠팔구십]+)', user_input)
-    if child_match:
-        conversation_context["children_number"] = korean_number_to_int(child_match.group(1))
-    else:
-        en_child_match = re.search(r'(\d+)\s*child', user_input, re.IGNORECASE)
-        if en_child_match:
-            conversation_context["children_number"] = int(en_child_match.group(1))
-
-    # GPT 응답을 기반으로 호텔/맛집 요청 여부를 보완
-    if conversation_context["destination"] and not conversation_context["hotel_asked"]:
-        if any(k in user_input.lower() for k in ["숙소", "호텔", "hotel", "accommodation", "stay"]):
-            conversation_context["hotel_asked"] = True
-            if not conversation_context["hotel_filter"]:
-                conversation_context["hotel_filter"] = extract_hotel_filter_keywords_gpt(user_input)
-
-    if conversation_context["destination"] and not conversation_context["food_asked"]:
-        if any(k in user_input.lower() for k in ["맛집", "음식", "카페", "restaurant", "food", "cafe", "dining"]):
-            conversation_context["food_asked"] = True
-            filter_keywords = ["감성", "인스타", "해변", "해변 근처", "분위기 좋은", "인기 많은", "저렴한", "vibe", "instagram", "beach", "beachside", "cozy", "popular", "cheap", "budget"]
-            for keyword in filter_keywords:
-                if keyword in user_input:
-                    conversation_context["food_filter"] = keyword
-                    break
+            conversation_context.departure_date = checkin
+            conversation_context.return_date = checkout
+            conversation_context.duration = (datetime.strptime(checkout, "%Y-%m-%d") - datetime.strptime(checkin, "%Y-%m-%d")).days
 
-def search_hotels_by_dest_id(dest_id, checkin, checkout, filter_keywords=None, context=None):
-    url = "https://booking-com.p.rapidapi.com/v1/hotels/search"
-    headers = {
-        "X-RapidAPI-Key": RAPIDAPI_KEY,
-        "X-RapidAPI-Host": "booking-com.p.rapidapi.com"
-    }
+    # 성인/어린이 수 인식 (Korean + English)
+    if turn["adults"] is not None:
+        conversation_context.adults_number = turn["adults"]
+    if turn["children"] is not None:
+        conversation_context.children_number = turn["children"]
+
+def build_hotel_search_params(dest_id, checkin, checkout, filter_keywords=None, context=None):
+    """Booking /hotels/search querystring in canonical form (ISO dates, sorted unique categories)."""
     querystring = {
-        "checkin_date": checkin,
-        "checkout_date": checkout,
-        "dest_id": dest_id,
+        "checkin_date": datetime.strptime(checkin, "%Y-%m-%d").date().isoformat(),
+        "checkout_date": datetime.strptime(checkout, "%Y-%m-%d").date().isoformat(),
+        "dest_id": str(dest_id),
         "dest_type": "city",
-        "adults_number": context.get("adults_number", 2),
+        "adults_number": context.adults_number,
         "units": "metric",
         "order_by": "popularity",
         "locale": "en-us",
         "currency": "KRW",
         "filter_by_currency": "KRW",
-        "room_number": context.get("no_rooms", 1),
+        "room_number": context.no_rooms,
         "page_number": "0"
     }
-    categories_map = {
-        "럭셔리": ["class::5", "class::4"],
-        "luxury": ["class::5", "class::4"],
-        "저렴한": ["price::1"],
-        "cheap": ["price::1"],
-        "budget": ["price::1"],
-        "가성비": ["price::1", "review_score::8"],
-        "value": ["price::1", "review_score::8"],
-        "수영장": ["facility::11"],
-        "pool": ["facility::11"],
-        "조식": ["mealplan::1"],
-        "조식포함": ["mealplan::1"],
-        "breakfast": ["mealplan::1"],
-        "반려동물": ["facility::5"],
-        "pet": ["facility::5"],
-        "pet-friendly": ["facility::5"],
-    }
-    categories = ["price::1", "review_score::8"]
+    categories = {"price::1", "review_score::8"}
 
     if filter_keywords:
         for kw in filter_keywords:
-            if kw in categories_map:
-                categories.extend(categories_map[kw])
+            if kw in HOTEL_CATEGORIES_MAP:
+                categories.update(HOTEL_CATEGORIES_MAP[kw])
 
-    querystring["categories_filter_ids"] = ",".join(categories)
+    querystring["categories_filter_ids"] = ",".join(sorted(categories))
+    # 값이 없는 파라미터는 보내지 않음 (캐시 키도 동일하게)
+    return {k: str(v) for k, v in querystring.items() if v is not None}
 
-    response = requests.get(url, headers=headers, params=querystring)
-    if response.status_code != 200:
-        print("❌ 호텔 검색 API 오류:", response.text)
-        return []
-    print("📍 Booking 검색 응답 코드:", response.status_code)
-    data = response.json()
+_json_decoder = json.JSONDecoder()
+
+async def iter_json_array(chunks, key):
+    """
+    Yields the elements of the `key` array of a streamed JSON object as each
+    one arrives, without holding or parsing the rest of the payload. Assumes
+    the first "key": [ in the text is that array (true for Booking's "result").
+    """
+    start_re = re.compile(r'"%s"\s*:\s*\[' % re.escape(key))
+    buffer = ""
+    pos = None
+    async for chunk in chunks:
+        buffer += chunk
+        if pos is None:
+            match = start_re.search(buffer)
+            if not match:
+                continue
+            pos = match.end()
+        while True:
+            while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+                pos += 1
+            if pos >= len(buffer):
+                break
+            if buffer[pos] == "]":
+                return
+            try:
+                item, end = _json_decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                break  # 요소가 다음 청크까지 이어짐
+            if end >= len(buffer):
+                break  # 숫자 등은 다음 청크에서 더 이어질 수 있으므로 구분자를 확인한 뒤 사용
+            yield item
+            pos = end
+        buffer, pos = buffer[pos:], 0
+    if pos is not None:
+        raise ValueError(f"truncated JSON: {key!r} array never closed")
+
+def format_hotel(hotel):
+    map_link = f"https://www.google.com/maps/search/?api=1&query={urllib.parse.quote(hotel.get('hotel_name', ''))}"
+    return {
+        "name": hotel.get("hotel_name"),
+        "price": int(hotel.get("min_total_price", 0)) if hotel.get("min_total_price") else 0,
+        "rating": hotel.get("review_score"),
+        "address": hotel.get("address", "Address not available"),
+        "mapLink": map_link,
+        "latitude": hotel.get("latitude"),
+        "longitude": hotel.get("longitude"),
+    }
+
+async def fetch_hotel_search(querystring, want=HOTEL_RESULT_COUNT):
+    """
+    One Booking result page (querystring["page_number"]), parsed hotel by hotel
+    from the response stream. Reading stops as soon as `want` hotels with a
+    review score are collected. Returns {"hotels", "complete", "exhausted"}:
+    complete=False means the rest of the page was never read, exhausted=True
+    means Booking returned no results at all (no further pages).
+    """
+    url = "/v1/hotels/search"
+    headers = {
+        "X-RapidAPI-Key": RAPIDAPI_KEY,
+        "X-RapidAPI-Host": "booking-com.p.rapidapi.com"
+    }
+
+    async def request():
+        hotels, seen = [], 0
+        async with http_clients["booking"].stream("GET", url, headers=headers, params=querystring) as response:
+            if response.status_code != 200:
+                await response.aread()
+                if response.status_code in RETRYABLE_STATUS:
+                    raise RetryableStatus(response)
+                log.warning("❌ 호텔 검색 API 오류: %s", response.text)
+                response.raise_for_status()
+            log.debug("📍 Booking 검색 응답 코드: %s", response.status_code)
+            async with aclosing(iter_json_array(response.aiter_text(), "result")) as items:
+                async for hotel in items:
+                    seen += 1
+                    if hotel.get("review_score") is None:
+                        continue  # 리뷰 점수가 없는 호텔은 제외
+                    hotels.append(format_hotel(hotel))
+                    if len(hotels) >= want:
+                        return {"hotels": hotels, "complete": False, "exhausted": False}
+        return {"hotels": hotels, "complete": True, "exhausted": seen == 0}
+
+    return await booking_upstream.call(request)
+
+def hotel_cache_key(querystring):
+    return tuple(sorted(querystring.items()))
+
+async def load_hotel_page(querystring, page, want):
+    """Cached result page; a page cut short before `want` matches is fetched again further."""
+    params = {**querystring, "page_number": str(page)}
+    key = hotel_cache_key(params)
+    result, status = await hotel_search_cache.lookup(key, lambda: fetch_hotel_search(params, want))
+    if not result["complete"] and len(result["hotels"]) < want:
+        hotel_search_cache.delete(key)
+        result, status = await hotel_search_cache.lookup(key, lambda: fetch_hotel_search(params, want))
+    return result, status
+
+async def iter_hotels(querystring, want):
+    """Matching hotels in Booking order, fetching result pages lazily until `want` are produced."""
+    for page in range(HOTEL_SEARCH_MAX_PAGES):
+        result, status = await load_hotel_page(querystring, page, want)
+        if page == 0:
+            record_cache_status("hotels", status)
+        for hotel in result["hotels"]:
+            yield hotel
+        want -= len(result["hotels"])
+        if want <= 0 or result["exhausted"]:
+            return
+
+def encode_hotel_cursor(offset):
+    return base64.urlsafe_b64encode(json.dumps({"offset": offset}).encode()).decode().rstrip("=")
+
+def decode_hotel_cursor(cursor):
+    """Offset into the matching hotels; unknown or malformed cursors start from the top."""
+    if not cursor:
+        return 0
+    try:
+        offset = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))["offset"]
+    except (ValueError, TypeError, KeyError):
+        return 0
+    return offset if isinstance(offset, int) and offset >= 0 else 0
+
+async def search_hotels_by_dest_id(dest_id, checkin, checkout, filter_keywords=None, context=None,
+                                   count=HOTEL_RESULT_COUNT, offset=0):
+    querystring = build_hotel_search_params(dest_id, checkin, checkout, filter_keywords, context)
     hotels = []
-    for hotel in data.get("result", []):
-        if hotel.get("review_score") is None:
-            continue  # 리뷰 점수가 없는 호텔은 제외
-        lat = hotel.get("latitude")
-        lon = hotel.get("longitude")
-        real_address = hotel.get("address", "Address not available")
-        map_link = f"https://www.google.com/maps/search/?api=1&query={urllib.parse.quote(hotel.get('hotel_name', ''))}"
-        hotels.append({
-            "name": hotel.get("hotel_name"),
-            "price": int(hotel.get("min_total_price", 0)) if hotel.get("min_total_price") else 0,
-            "rating": hotel.get("review_score"),
-            "address": real_address,
-            "mapLink": map_link,
-            "latitude": lat,
-            "longitude": lon,
+    try:
+        with timed("hotel_search"):
+            async with aclosing(iter_hotels(querystring, offset + count)) as matches:
+                async for hotel in matches:
+                    hotels.append(hotel)
+                    if len(hotels) >= offset + count:
+                        break
+    except (httpx.HTTPStatusError, UpstreamError, ValueError) as e:
+        log.warning("❌ 호텔 검색 실패: %s", e)
+        if not hotels:
+            return []
+    checkin, checkout = querystring["checkin_date"], querystring["checkout_date"]
+    # 예약 링크는 어린이 수 등 세션 정보에 따라 달라지므로 캐시하지 않고 매번 생성
+    return [
+        {
+            **hotel,
             "url": (
                 f"https://www.booking.com/searchresults.ko.html?"
-                f"ss={hotel.get('hotel_name')}&"
+                f"ss={hotel['name']}&"
                 f"checkin_year={checkin[:4]}&checkin_month={int(checkin[5:7])}&checkin_monthday={int(checkin[8:10])}&"
                 f"checkout_year={checkout[:4]}&checkout_month={int(checkout[5:7])}&checkout_monthday={int(checkout[8:10])}&"
-                f"group_adults={context.get('adults_number',2)}&group_children={context.get('children_number',0)}&no_rooms={context.get('no_rooms',1)}"
+                f"group_adults={context.adults_number}&group_children={context.children_number}&no_rooms={context.no_rooms}"
             )
-        })
-        if len(hotels) >= 5:
-            break
-    return hotels
+        }
+        for hotel in hotels[offset:]
+    ]
 
-def recommend_food_places(destination, context=None):
-    if not destination:
-        return []
-    query = "restaurant in " + destination
-    if context.get("food_filter"):
-        query = f"{context['food_filter']} restaurant in {destination}"
-    url = "https://maps.googleapis.com/maps/api/place/textsearch/json"
+class PlacesAPIError(UpstreamError):
+    pass
+
+async def fetch_places(query, place_type=None, log_prefix="🍴"):
+    url = "/textsearch/json"
     params = {
         "query": query,
         "language": "en",
        # "region": context.get("destination", ""),
         "key": GOOGLE_API_KEY
     }
-    response = requests.get(url, params=params)
+    if place_type:
+        params["type"] = place_type
+    response = await google_upstream.get(url, params=params)
     data = response.json()
-    print(f"🍴 Google Places status: {data.get('status')}, error: {data.get('error_message', 'none')}")
-    if data.get("status") != "OK":
-        print(f"❌ Google Places API error: {data}")
+    log.debug("%s Google Places status: %s, error: %s", log_prefix, data.get("status"), data.get("error_message", "none"))
+    if data.get("status") == "ZERO_RESULTS":
         return []
+    if data.get("status") != "OK":
+        # 쿼터 초과/권한 오류 등은 캐시하지 않도록 예외로 전달
+        raise PlacesAPIError(str(data))
     results = data.get("results", [])
-    print(f"🍴 Google results count: {len(results)}")
-    food_list = []
+    log.debug("%s Google results count: %d", log_prefix, len(results))
+    places = []
     for place in results[:5]:
         name = place.get("name")
         rating = place.get("rating", "-")
         address = place.get("formatted_address", "Address not available")
         map_url = f"https://www.google.com/maps/search/?api=1&query={name.replace(' ', '+')}"
-        food_list.append({
+        location = (place.get("geometry") or {}).get("location") or {}
+        places.append({
             "name": name,
             "rating": rating,
             "address": address,
-            "url": map_url
+            "url": map_url,
+            "latitude": location.get("lat"),
+            "longitude": location.get("lng"),
         })
-    return food_list
+    return places
 
-def recommend_tourist_spots(destination, context=None):
+def places_cache_key(query, place_type=None):
+    return (" ".join(query.split()).lower(), place_type or "", "en")
+
+async def search_places(query, place_type=None, section="foods", log_prefix="🍴"):
+    """
+    Places text search shared by the food and tourist recommendations, served
+    from the city catalogue when it holds this search, else from places_cache.
+    """
+    catalogued = catalogue.places(query, place_type)
+    if catalogued is not None:
+        record_cache_status(section, "catalogue")
+        return catalogued
+    try:
+        with timed(f"places_{section}"):
+            places, status = await places_cache.lookup(places_cache_key(query, place_type), lambda: fetch_places(query, place_type, log_prefix))
+        record_cache_status(section, status)
+    except UpstreamError as e:
+        log.warning("❌ Google Places API error: %s", e)
+        return []
+    return places
+
+async def recommend_food_places(destination, context=None):
     if not destination:
         return []
-    query = "tourist attraction in " + destination
-    url = "https://maps.googleapis.com/maps/api/place/textsearch/json"
-    params = {
-        "query": query,
-        "type": "tourist_attraction",
-        "language": "en",
-       # "region": context.get("destination", "") if context else "",
-        "key": GOOGLE_API_KEY
-    }
-    response = requests.get(url, params=params)
-    data = response.json()
-    print(f"🗺️ Google Places status: {data.get('status')}, error: {data.get('error_message', 'none')}")
-    if data.get("status") != "OK":
-        print(f"❌ Google Places API error: {data}")
+    return await search_places(food_places_query(destination, context), section="foods", log_prefix="🍴")
+
+def food_places_query(destination, context):
+    if context.food_filter:
+        return f"{context.food_filter} restaurant in {destination}"
+    return "restaurant in " + destination
+
+async def recommend_tourist_spots(destination, context=None):
+    if not destination:
         return []
-    results = data.get("results", [])
-    print(f"🗺️ Tourist results count: {len(results)}")
-    tourist_list = []
-    for place in results[:5]:
-        name = place.get("name")
-        rating = place.get("rating", "-")
-        address = place.get("formatted_address", "Address not available")
-        map_url = f"https://www.google.com/maps/search/?api=1&query={name.replace(' ', '+')}"
-        tourist_list.append({
-            "name": name,
-            "rating": rating,
-            "address": address,
-            "url": map_url
-        })
-    return tourist_list
+    return await search_places(tourist_places_query(destination), place_type="tourist_attraction",
+                                section="tourist_spots", log_prefix="🗺️")
+
+def known_places(query, place_type=None):
+    """Places results already on hand (catalogue, then places_cache) without a network call; _MISSING if none."""
+    catalogued = catalogue.places(query, place_type)
+    if catalogued is not None:
+        return catalogued
+    return places_cache.get(places_cache_key(query, place_type))
+
+def tourist_places_query(destination):
+    return "tourist attraction in " + destination
+
+EARTH_RADIUS_KM = 6371.0088
+PROXIMITY_SECTIONS = ("foods", "tourist_spots")
+
+def coordinates(item):
+    """(lat, lng) of a formatted hotel or place, None when Booking/Places gave no usable position."""
+    try:
+        return float(item["latitude"]), float(item["longitude"])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+def haversine_km(a, b):
+    lat1, lng1, lat2, lng2 = map(math.radians, (*a, *b))
+    h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(h)))
+
+class SpotIndex:
+    """
+    The food / tourist spots a turn relates hotels to, with their positions
+    kept in radians so the distances from every hotel to every spot come out
+    of one broadcast haversine pass (NumPy when installed, math otherwise).
+    """
+
+    def __init__(self, spots):
+        self.entries = []  # (section, place)
+        points = []
+        for section, places in spots.items():
+            for place in places:
+                point = coordinates(place)
+                if point is not None:
+                    self.entries.append((section, place))
+                    points.append(point)
+        self.points = points
+        self.columns = {}  # section -> 해당 섹션 장소의 열 번호
+        for column, (section, _) in enumerate(self.entries):
+            self.columns.setdefault(section, []).append(column)
+        self.np = load_numpy() if points else None
+        if self.np is not None:
+            self.lat, self.lng = self.np.radians(self.np.array(points, dtype=float)).T
+
+    def __len__(self):
+        return len(self.entries)
+
+    def distance_matrix(self, points):
+        """km from each (lat, lng) in points to every spot - len(points) rows, len(self) columns."""
+        np = self.np
+        if np is None:
+            return [[haversine_km(point, spot) for spot in self.points] for point in points]
+        lat, lng = np.radians(np.array(points, dtype=float)).T
+        lat, lng = lat[:, None], lng[:, None]
+        h = np.sin((self.lat - lat) / 2) ** 2 + np.cos(lat) * np.cos(self.lat) * np.sin((self.lng - lng) / 2) ** 2
+        return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(h, 1.0)))
+
+    def nearest(self, matrix):
+        """Per section, the distance from each row's hotel to its closest spot of that section."""
+        if self.np is not None:
+            return {section: matrix[:, cols].min(axis=1).tolist() for section, cols in self.columns.items()}
+        return {section: [min(row[c] for c in cols) for row in matrix] for section, cols in self.columns.items()}
+
+    def within(self, matrix, radius_km):
+        """Per row, [(column, km)] of the spots inside radius_km, closest first."""
+        if self.np is not None:
+            order = self.np.argsort(matrix, axis=1, kind="stable")
+            ordered = self.np.take_along_axis(matrix, order, axis=1)
+            counts = (ordered <= radius_km).sum(axis=1)
+            return [list(zip(order[i, :n].tolist(), ordered[i, :n].tolist())) for i, n in enumerate(counts.tolist())]
+        return [sorted(((c, km) for c, km in enumerate(row) if km <= radius_km), key=lambda item: item[1]) for row in matrix]
+
+def proximity_spots(context, results):
+    """
+    Food / tourist spots to relate this turn's hotels to: the ones this turn
+    looked up, else the ones recommended (or prefetched) earlier for the same
+    destination, read from the catalogue / places_cache without calling Places.
+    """
+    spots = {}
+    for section in PROXIMITY_SECTIONS:
+        ok, places = results.get(section, (False, None))
+        if ok and places:
+            spots[section] = places
+            continue
+        if section == "foods":
+            cached = known_places(food_places_query(context.destination, context))
+        else:
+            cached = known_places(tourist_places_query(context.destination), "tourist_attraction")
+        if cached is not _MISSING and cached:
+            spots[section] = cached
+    return spots
+
+def rank_hotels_by_proximity(hotels, spots, radius_km=NEARBY_RADIUS_KM):
+    """
+    Hotels reordered by summed distance to the closest spot of each section
+    (stable, so Booking order breaks ties; hotels without coordinates go
+    last), each annotated with "nearest_km" and "nearby" - the spots within
+    radius_km per section, closest first.
+    """
+    index = SpotIndex(spots)
+    located = [(i, coordinates(hotel)) for i, hotel in enumerate(hotels)]
+    located = [(i, point) for i, point in located if point is not None]
+    if not index.columns or not located:
+        return hotels
+    matrix = index.distance_matrix([point for _, point in located])
+    nearest = index.nearest(matrix)
+    within = index.within(matrix, radius_km)
 
-def get_dest_id_from_booking(query):
-    url = "https://booking-com.p.rapidapi.com/v1/hotels/locations"
+    ranked = []
+    for row, (i, _) in enumerate(located):
+        nearby = {section: [] for section in index.columns}
+        for column, km in within[row]:
+            section, place = index.entries[column]
+            if len(nearby[section]) < NEARBY_MAX_SPOTS:
+                nearby[section].append({"name": place["name"], "distance_km": round(km, 2)})
+        ranked.append((sum(nearest[section][row] for section in nearest), i, {
+            **hotels[i],
+            "nearest_km": {section: round(nearest[section][row], 2) for section in nearest},
+            "nearby": nearby,
+        }))
+    ranked.sort(key=lambda item: item[:2])
+    placed = {i for _, i, _ in ranked}
+    return [hotel for _, _, hotel in ranked] + [hotel for i, hotel in enumerate(hotels) if i not in placed]
+
+def apply_proximity_rank(context, results):
+    """Reranks results["hotels"] in place against the turn's (or cached) food and tourist spots."""
+    ok, hotels = results.get("hotels", (False, None))
+    if not (HOTEL_PROXIMITY_RANK and ok and hotels and context.destination):
+        return
+    spots = proximity_spots(context, results)
+    if spots:
+        with timed("proximity_rank"):
+            results["hotels"] = (ok, rank_hotels_by_proximity(hotels, spots))
+
+def normalize_dest_query(query):
+    return " ".join(query.split()).lower()
+
+async def fetch_dest_id_from_booking(query):
+    """Upstream lookup. Returns (name, dest_id), None if Booking has no such city; raises on API errors."""
+    url = "/v1/hotels/locations"
     headers = {
         "X-RapidAPI-Key": RAPIDAPI_KEY,
         "X-RapidAPI-Host": "booking-com.p.rapidapi.com"
     }
-    print("📍 Booking 대상:", query)
+    log.debug("📍 Booking 대상: %s", query)
     params = {"name": query, "locale": "en-us"}
-    response = requests.get(url, headers=headers, params=params)
+    response = await booking_upstream.get(url, headers=headers, params=params)
+    response.raise_for_status()
+    results = response.json()
+    if isinstance(results, list):
+        for item in results:
+            if item.get("dest_type") == "city":
+                return item.get("name"), item.get("dest_id")
+    return None
+
+async def get_dest_id_from_booking(query):
+    catalogued = catalogue.dest_id(query)
+    if catalogued is not None:
+        record_cache_status("dest_id", "catalogue")
+        return catalogued
     try:
-        results = response.json()
-        if isinstance(results, list) and results:
-            for item in results:
-                if item.get("dest_type") == "city":
-                    return item.get("name"), item.get("dest_id")
-    except:
-        print("❌ dest_id 조회 실패:", response.text)
-    return None, None
+        with timed("dest_lookup"):
+            result, status = await dest_id_cache.lookup(
+                normalize_dest_query(query), lambda: fetch_dest_id_from_booking(query)
+            )
+        record_cache_status("dest_id", status)
+    except Exception as e:
+        log.warning("❌ dest_id 조회 실패: %s", e)
+        return None, None
+    return result or (None, None)
+
+def load_dest_seed(path=DEST_SEED_FILE):
+    """Seed file maps city name -> dest_id (null = resolve from Booking during warm-up)."""
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        log.error("❌ dest_id 시드 파일 로드 실패: %s", e)
+        return {}
+
+async def warm_dest_cache(path=DEST_SEED_FILE, concurrency=4):
+    seed = load_dest_seed(path)
+    unresolved = []
+    for city, dest_id in seed.items():
+        if dest_id:
+            dest_id_cache.set(normalize_dest_query(city), (city, str(dest_id)))
+        else:
+            unresolved.append(city)
+    if not RAPIDAPI_KEY:
+        return
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def resolve(city):
+        async with semaphore:
+            await get_dest_id_from_booking(city)
+
+    await asyncio.gather(*(resolve(city) for city in unresolved))
+    log.info("📍 dest_id 캐시 워밍업 완료: %d개", len(dest_id_cache))
+
+async def run_branch(name, coro):
+    """Run one /chat branch under its own deadline. Returns (ok, result); failures don't fail the turn."""
+    try:
+        return True, await asyncio.wait_for(coro, BRANCH_TIMEOUTS.get(name, 10.0))
+    except asyncio.TimeoutError:
+        log.warning("⏱️ %s timed out after %ss", name, BRANCH_TIMEOUTS.get(name, 10.0))
+    except Exception as e:
+        log.warning("❌ %s failed: %s", name, e)
+    return False, None
+
+class PrefetchScheduler:
+    """
+    Bounded priority queue of speculative lookups drained by a few background
+    workers. A job is skipped while the same key is already queued or running,
+    dropped when the queue is full, and only started while its provider's
+    circuit is closed, its rate-limit bucket holds more than `reserve` of the
+    burst, and the per-minute budget has room - live turns always keep their
+    quota.
+    """
+
+    def __init__(self, maxsize, workers, reserve, per_minute):
+        self.queue = asyncio.PriorityQueue(maxsize)
+        self.workers = workers
+        self.reserve = reserve
+        self.per_minute = per_minute
+        self.pending = set()
+        self.started = deque()  # 최근 1분간 시작한 작업 시각
+        self._seq = itertools.count()
+        self.counts = {"scheduled": 0, "deduped": 0, "dropped": 0, "over_budget": 0,
+                       "already_cached": 0, "fetched": 0, "failed": 0}
+
+    def schedule(self, key, priority, provider, job):
+        """Queue job() (a coroutine factory returning True if it fetched); lower priority runs first."""
+        if key in self.pending:
+            self.counts["deduped"] += 1
+            return False
+        try:
+            self.queue.put_nowait((priority, next(self._seq), key, provider, job))
+        except asyncio.QueueFull:
+            self.counts["dropped"] += 1
+            return False
+        self.pending.add(key)
+        self.counts["scheduled"] += 1
+        return True
+
+    def has_budget(self, provider):
+        now = time.monotonic()
+        while self.started and now - self.started[0] > 60:
+            self.started.popleft()
+        if len(self.started) >= self.per_minute:
+            return False
+        upstream = upstreams[provider]
+        if upstream.breaker.state != "closed":
+            return False
+        bucket = upstream.bucket
+        tokens = min(bucket.capacity, bucket.tokens + (now - bucket.updated) * bucket.rate)
+        return tokens >= bucket.capacity * self.reserve + 1
+
+    async def worker(self):
+        while True:
+            _, _, key, provider, job = await self.queue.get()
+            try:
+                if not self.has_budget(provider):
+                    self.counts["over_budget"] += 1
+                    continue
+                self.started.append(time.monotonic())
+                self.counts["fetched" if await job() else "already_cached"] += 1
+            except Exception as e:
+                self.counts["failed"] += 1
+                log.debug("❌ prefetch %s failed: %s", key, e)
+            finally:
+                self.pending.discard(key)
+
+    def start(self):
+        for _ in range(self.workers):
+            spawn_background(self.worker())
+
+    def stats(self):
+        return {**self.counts, "queued": self.queue.qsize(), "pending": len(self.pending)}
+
+prefetcher = PrefetchScheduler(PREFETCH_QUEUE_SIZE, PREFETCH_WORKERS, PREFETCH_RESERVE,
+                               max(1, PREFETCH_MAX_PER_MINUTE // WEB_CONCURRENCY))  # 예산도 서비스 전체 기준
+
+async def prefetch_hotels(context):
+    dest = catalogue.dest_id(context.destination) or dest_id_cache.get(normalize_dest_query(context.destination))
+    if dest is not _MISSING and dest is not None:
+        querystring = build_hotel_search_params(
+            dest[1], context.departure_date, context.return_date, context.hotel_filter or [], context
+        )
+        if hotel_search_cache.get(hotel_cache_key(querystring)) is not _MISSING:
+            return False
+    await find_hotels(context)
+    return True
+
+async def prefetch_places(query, place_type, section):
+    if known_places(query, place_type) is not _MISSING:
+        return False
+    await search_places(query, place_type, section)
+    return True
+
+def schedule_prefetch(context, before):
+    """
+    Once a turn has filled destination and dates, warm the hotel, food and
+    tourist lookups the next turn is likely to ask for (skipping sections
+    this turn already looks up live). Runs on a snapshot of the context.
+    """
+    if not PREFETCH_ENABLED or slot_snapshot(context) == before:
+        return
+    if not (context.destination and context.departure_date and context.return_date):
+        return
+    snapshot = context.copy()
+    destination = context.destination
+    if not context.hotel_asked:
+        key = ("hotels", destination.lower(), context.departure_date, context.return_date,
+               context.adults_number, context.children_number, tuple(context.hotel_filter or ()))
+        prefetcher.schedule(key, 0, "booking", lambda: prefetch_hotels(snapshot))
+    if not context.food_asked:
+        food_query = food_places_query(destination, snapshot)
+        prefetcher.schedule(("places", food_query), 1, "google", lambda: prefetch_places(food_query, None, "foods"))
+    if not context.tourist_asked:
+        tourist_query = tourist_places_query(destination)
+        prefetcher.schedule(("places", tourist_query), 2, "google",
+                            lambda: prefetch_places(tourist_query, "tourist_attraction", "tourist_spots"))
 
 @app.get("/")
 async def health():
@@ -432,15 +2389,74 @@ async def health():
         "google_key_preview": (GOOGLE_API_KEY[:8] + "...") if GOOGLE_API_KEY else "NOT SET"
     }
 
+@app.get("/ready")
+async def ready():
+    """
+    Readiness probe - 200 once the startup stages the first chat turn depends
+    on have finished. A failed stage is listed under "failed" while it
+    retries in the background but doesn't hold readiness back: the request
+    path loads it lazily on first use.
+    """
+    required = [name for name in READINESS_STAGES if name in startup_stages]
+    pending = [name for name in required if startup_stages[name] is None]
+    failed = [name for name in required if isinstance(startup_stages[name], str)]
+    body = {"ready": not pending and bool(http_clients), "pending": pending, "failed": failed, "stages": startup_stages}
+    return JSONResponse(body, status_code=200 if body["ready"] else 503)
+
+@app.get("/cache/stats")
+async def cache_stats():
+    """Hit/miss counters for every in-process cache and the city catalogue"""
+    stats = {name: cache.stats() for name, cache in caches.items()}
+    stats["catalogue"] = catalogue.stats()
+    return stats
+
+@app.get("/sessions/stats")
+async def sessions_stats():
+    """Session store size, memory use and evictions"""
+    return session_store.stats()
+
+@app.get("/prefetch/stats")
+async def prefetch_stats():
+    """Speculative prefetch queue - scheduled, deduped, dropped, over budget, fetched"""
+    return prefetcher.stats()
+
+@app.get("/upstreams")
+async def upstream_stats():
+    """Circuit breaker state, retries and rate-limit budget per provider"""
+    return {name: upstream.stats() for name, upstream in upstreams.items()}
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Prometheus scrape endpoint - stage/upstream latency histograms, status codes, cache and breaker state"""
+    return Response(render_metrics(), media_type="text/plain; version=0.0.4")
+
+@app.get("/llm/stats")
+async def llm_stats():
+    """LLM calls made by the extraction stage vs. the old one-call-per-slot approach, plus the reply bypass rate"""
+    turns = llm_call_stats["turns"]
+    saved = llm_call_stats["legacy_calls"] - llm_call_stats["calls"]
+    reply_turns = reply_stats["turns"]
+    return {
+        **llm_call_stats,
+        "saved": saved,
+        "saved_per_turn": round(saved / turns, 3) if turns else 0.0,
+        "models": model_call_stats,
+        "reply": {
+            **reply_stats,
+            "policy": REPLY_POLICY,
+            "bypass_rate": round(reply_stats["templated"] / reply_turns, 4) if reply_turns else 0.0,
+        },
+    }
+
 @app.get("/test-google")
 async def test_google():
     """Test Google Places API directly"""
     if not GOOGLE_API_KEY:
         return {"error": "GOOGLE_API_KEY is not set in environment variables"}
-    url = "https://maps.googleapis.com/maps/api/place/textsearch/json"
+    url = "/textsearch/json"
     params = {"query": "restaurant in Tokyo", "language": "en", "key": GOOGLE_API_KEY}
     try:
-        response = requests.get(url, params=params, timeout=10)
+        response = await http_clients["google"].get(url, params=params, timeout=10)
         data = response.json()
         return {
             "status_code": response.status_code,
@@ -464,22 +2480,20 @@ async def debug_chat(req: Request):
     debug_log.append(f"1. Input: '{user_input}'")
 
     # Step 2: Destination extraction
-    dest = extract_location_keyword_gpt(user_input)
-    test_context["destination"] = dest
+    dest = await extract_location_keyword_gpt(user_input)
+    test_context.destination = dest
     debug_log.append(f"2. Extracted destination: '{dest}'")
 
-    # Step 3: Keyword detection
-    input_lower = user_input.lower()
-    hotel_match = any(k in input_lower for k in ["숙소", "호텔", "hotel", "accommodation", "stay"])
-    food_match = any(k in input_lower for k in ["맛집", "음식", "카페", "restaurant", "food", "cafe", "dining", "eat"])
-    tourist_match = any(k in input_lower for k in ["관광지", "명소", "attraction", "sightseeing", "tourist", "visit", "landmark", "places to visit"])
+    # Step 3: Keyword detection (same engine as /chat)
+    turn = extract_turn_slots(user_input)
+    hotel_match, food_match, tourist_match = turn["hotel"], turn["food"], turn["tourist"]
     debug_log.append(f"3. Keywords - hotel:{hotel_match}, food:{food_match}, tourist:{tourist_match}")
 
     # Step 4: Try Places API if food detected
     food_results = []
     if food_match and dest:
         try:
-            food_results = recommend_food_places(dest, context=test_context)
+            food_results = await recommend_food_places(dest, context=test_context)
             debug_log.append(f"4. Food API returned {len(food_results)} results")
             if food_results:
                 debug_log.append(f"   First: {food_results[0].get('name')}")
@@ -492,7 +2506,7 @@ async def debug_chat(req: Request):
     tourist_results = []
     if tourist_match and dest:
         try:
-            tourist_results = recommend_tourist_spots(dest, context=test_context)
+            tourist_results = await recommend_tourist_spots(dest, context=test_context)
             debug_log.append(f"5. Tourist API returned {len(tourist_results)} results")
         except Exception as e:
             debug_log.append(f"5. Tourist API ERROR: {str(e)}")
@@ -501,7 +2515,7 @@ async def debug_chat(req: Request):
 
     return {
         "debug_log": debug_log,
-        "context": test_context,
+        "context": test_context.to_dict(),
         "food_results": food_results[:2],
         "tourist_results": tourist_results[:2],
         "google_key_set": bool(GOOGLE_API_KEY)
@@ -513,21 +2527,8 @@ async def reset_context(req: Request):
     user_id = data.get("user_id", "default")
     chat_id = data.get("chat_id", "default")
     context_key = f"{user_id}_{chat_id}"
-    memory_store[context_key] = {
-        "destination": None,
-        "departure_date": None,
-        "return_date": None,
-        "duration": None,
-        "adults_number": None,
-        "children_number": 0,
-        "no_rooms": 1,
-        "flight_asked": False,
-        "hotel_asked": False,
-        "hotel_filter": None,
-        "food_asked": False,
-        "food_filter": None,
-        "tourist_asked": False
-    }
+    async with session_store.lock(context_key):
+        await session_store.save(context_key, init_context())
     return {"status": "reset"}
 
 @app.post("/chat")
@@ -538,27 +2539,30 @@ async def chat(req: Request):
     chat_id = data.get("chat_id", "default")
     context_key = f"{user_id}_{chat_id}"
 
-    if context_key not in memory_store:
-        memory_store[context_key] = init_context()
-
-    context = memory_store[context_key]
-    update_context(user_input, context)
+    # 같은 대화의 동시 요청은 순서대로 처리 (컨텍스트 덮어쓰기 방지)
+    async with session_store.lock(context_key):
+        context = await session_store.load(context_key) or init_context()
+        response_data = await run_chat_turn(user_input, context, hotel_count=data.get("hotel_count"),
+                                            hotel_cursor=data.get("hotel_cursor"))
+        await session_store.save(context_key, context)
+    return response_data
 
+def build_reply_prompt(context):
     def memory_text():
         parts = []
-        if context["destination"]:
-            parts.append(f"Destination: {context['destination']}")
-        if context["departure_date"]:
-            parts.append(f"Departure: {context['departure_date']}")
-        if context["duration"]:
-            parts.append(f"{context['duration']}-day trip")
-        if context["adults_number"]:
-            parts.append(f"{context['adults_number']} adults")
-        if context["children_number"]:
-            parts.append(f"{context['children_number']} children")
+        if context.destination:
+            parts.append(f"Destination: {context.destination}")
+        if context.departure_date:
+            parts.append(f"Departure: {context.departure_date}")
+        if context.duration:
+            parts.append(f"{context.duration}-day trip")
+        if context.adults_number:
+            parts.append(f"{context.adults_number} adults")
+        if context.children_number:
+            parts.append(f"{context.children_number} children")
         return ", ".join(parts) if parts else "None"
 
-    prompt = f"""
+    return f"""
     You are a friendly travel chatbot. Continue the conversation to help the user plan their trip.
     Here is the user's info so far: {memory_text()}
     Only ask about missing info (destination, departure date, duration, number of travelers) naturally.
@@ -566,57 +2570,475 @@ async def chat(req: Request):
     Always reply concisely in 1-2 sentences in English.
     """
 
-    response = client.chat.completions.create(
-        model="gpt-4o",
-        messages=[
+# 턴 종류별 결정적 답변 (한/영) - {destination}, {date}, {duration}, {sections} 치환
+REPLY_TEMPLATES = {
+    "ko": {
+        "ask_destination": "어디로 여행을 계획하고 계신가요?",
+        "ask_dates": "{destination} 좋네요! 출발 날짜와 일정(예: 6월 20일부터 3박 4일)을 알려주세요.",
+        "ask_travelers": "{destination}, {date}부터 {duration}일 일정이군요. 성인과 어린이는 각각 몇 명인가요?",
+        "ready": "{destination} 여행 준비가 끝났어요! 호텔, 맛집, 관광지 중 무엇을 추천해 드릴까요?",
+        "results": "{destination}의 {sections} 추천이에요.",
+        "no_results": "지금은 {destination}의 {sections} 정보를 가져오지 못했어요.",
+        "needs_dates": "{sections} 검색에는 여행 날짜가 필요해요.",
+        "closing": "즐거운 여행 되세요! 더 필요한 게 있으면 언제든 말씀해 주세요.",
+        "sections": {"hotels": "호텔", "foods": "맛집", "tourist_spots": "관광지"},
+        "and": ", ",
+    },
+    "en": {
+        "ask_destination": "Where are you planning to travel?",
+        "ask_dates": "{destination} sounds great! When are you leaving, and for how long?",
+        "ask_travelers": "{destination} from {date} for {duration} days - how many adults and children are going?",
+        "ready": "You're all set for {destination}! Would you like hotels, restaurants or places to visit?",
+        "results": "Here are some {sections} in {destination}.",
+        "no_results": "I couldn't get {sections} for {destination} just now.",
+        "needs_dates": "I need your travel dates to look up {sections}.",
+        "closing": "Have a great trip! Let me know if there's anything else I can help with.",
+        "sections": {"hotels": "hotels", "foods": "restaurants", "tourist_spots": "places to visit"},
+        "and": " and ",
+    },
+}
+CLOSING_KEYWORDS = ("고마워", "감사", "땡큐", "thank", "thanks", "that's all", "bye")
+# 슬롯 외의 질문이 섞인 턴은 LLM이 답하도록 남김
+OPEN_QUESTION_MARKERS = ("?", "어때", "어떻게", "왜", "뭐", "무엇", "how", "what", "why", "which", "should")
+# 한글 표지는 부분 일치, 영문 표지는 단어 경계로 ("show"의 how, "whatever"의 what 제외)
+OPEN_QUESTION_RE = re.compile("|".join(
+    rf"\b{re.escape(marker)}\b" if marker.isascii() and marker.isalpha() else re.escape(marker)
+    for marker in OPEN_QUESTION_MARKERS
+), re.IGNORECASE)
+HANGUL_RE = re.compile(r"[가-힣]")
+
+reply_stats = {"turns": 0, "templated": 0, "recommendations": 0, "slot_update": 0, "closing": 0}
+
+def slot_snapshot(context):
+    return (context.destination, context.departure_date, context.adults_number, context.children_number)
+
+def classify_reply_turn(user_input, context, before):
+    """
+    Which deterministic template (if any) answers this turn: "recommendations"
+    when a lookup was asked for a known destination, "slot_update" when the
+    turn only filled slots, "closing" for thanks/bye. None = open-ended (LLM).
+    Questions go to the LLM even when they mention a lookup ("which area
+    should I stay in?"), since the templates can't answer them.
+    """
+    if OPEN_QUESTION_RE.search(user_input):
+        return None
+    if context.destination and (context.hotel_asked or context.food_asked or context.tourist_asked):
+        return "recommendations"
+    lowered = user_input.lower()
+    if slot_snapshot(context) != before:
+        return "slot_update"
+    if any(keyword in lowered for keyword in CLOSING_KEYWORDS):
+        return "closing"
+    return None
+
+def plan_templated_reply(user_input, context, before):
+    """Returns the template intent for this turn under REPLY_POLICY, or None to call the LLM."""
+    reply_stats["turns"] += 1
+    if REPLY_POLICY != "templates":
+        return None
+    intent = classify_reply_turn(user_input, context, before)
+    if intent not in REPLY_TEMPLATE_INTENTS:
+        return None
+    reply_stats["templated"] += 1
+    reply_stats[intent] += 1
+    return intent
+
+def next_slot_question(context, templates):
+    if not context.destination:
+        return templates["ask_destination"]
+    if not context.departure_date:
+        return templates["ask_dates"]
+    if not context.adults_number:
+        return templates["ask_travelers"]
+    return None
+
+def render_template_reply(intent, user_input, context, results=None, waiting=()):
+    """waiting: sections the user asked for that could not be looked up yet (no dates)."""
+    templates = REPLY_TEMPLATES["ko" if HANGUL_RE.search(user_input) else "en"]
+    departure = datetime.strptime(context.departure_date, "%Y-%m-%d") if context.departure_date else None
+    if departure is None:
+        date = ""
+    elif templates is REPLY_TEMPLATES["ko"]:
+        date = f"{departure.month}월 {departure.day}일"
+    else:
+        date = f"{departure:%B} {departure.day}"
+    values = {"destination": context.destination, "date": date, "duration": context.duration}
+
+    if intent == "closing":
+        return templates["closing"]
+    sentences = []
+    if intent == "recommendations":
+        found, missing = [], []
+        for section in ("hotels", "foods", "tourist_spots"):
+            if section in results:
+                ok, items = results[section]
+                (found if ok and items else missing).append(templates["sections"][section])
+        if found:
+            sentences.append(templates["results"].format(sections=templates["and"].join(found), **values))
+        if missing:
+            sentences.append(templates["no_results"].format(sections=templates["and"].join(missing), **values))
+        if waiting:
+            names = [templates["sections"][section] for section in waiting]
+            sentences.append(templates["needs_dates"].format(sections=templates["and"].join(names), **values))
+    question = next_slot_question(context, templates)
+    if question:
+        sentences.append(question.format(**values))
+    elif intent == "slot_update":
+        sentences.append(templates["ready"].format(**values))
+    return " ".join(sentences)
+
+async def generate_reply(prompt, user_input):
+    with timed("gpt_reply"):
+        response = await chat_completion("reply", [
+            {"role": "system", "content": prompt},
+            {"role": "user", "content": user_input}
+        ])
+    return response.choices[0].message.content.strip()
+
+async def stream_reply(prompt, user_input, on_token):
+    """Streams the reply, awaiting on_token(text) for every delta; returns the full reply."""
+    with timed("gpt_reply_stream"):
+        stream = await chat_completion("reply", [
             {"role": "system", "content": prompt},
             {"role": "user", "content": user_input}
-        ]
+        ], stream=True)
+        parts = []
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                parts.append(chunk.choices[0].delta.content)
+                await on_token(chunk.choices[0].delta.content)
+    return "".join(parts).strip()
+
+async def find_hotels(context, count=HOTEL_RESULT_COUNT, offset=0):
+    dest_name, dest_id = await get_dest_id_from_booking(context.destination)
+    if not dest_id:
+        return []
+    return await search_hotels_by_dest_id(
+        dest_id,
+        context.departure_date,
+        context.return_date,
+        context.hotel_filter or [],
+        context=context,
+        count=count,
+        offset=offset,
     )
 
-    hotel_recommendations = []
-    if context["hotel_asked"] and context["destination"]:
-        dest_name, dest_id = get_dest_id_from_booking(context["destination"])
-        if dest_id:
-            hotel_recommendations = search_hotels_by_dest_id(
-                dest_id,
-                context["departure_date"],
-                context["return_date"],
-                context.get("hotel_filter") or [],
-                context=context
-            )
+def hotel_page_request(hotel_count=None, hotel_cursor=None):
+    """(count, offset) from the optional hotel_count / hotel_cursor request fields."""
+    try:
+        count = int(hotel_count) if hotel_count is not None else HOTEL_RESULT_COUNT
+    except (TypeError, ValueError):
+        count = HOTEL_RESULT_COUNT
+    return max(1, min(count, HOTEL_MAX_RESULT_COUNT)), decode_hotel_cursor(hotel_cursor)
 
-    food_recommendations = []
-    print(f"🔍 CHAT DEBUG: food_asked={context['food_asked']}, destination={context['destination']}, tourist_asked={context.get('tourist_asked')}")
-    if context["food_asked"] and context["destination"]:
-        print(f"🍴 Calling recommend_food_places for: {context['destination']}")
-        food_recommendations = recommend_food_places(context["destination"], context=context)
-        print(f"🍴 Got {len(food_recommendations)} food results")
+def plan_lookups(context, hotel_page=(HOTEL_RESULT_COUNT, 0)):
+    """Recommendation lookups this turn asked for, as {section: coroutine}."""
+    log.debug("🔍 CHAT DEBUG: food_asked=%s, destination=%s, tourist_asked=%s",
+              context.food_asked, context.destination, context.tourist_asked)
+    lookups = {}
+    # 호텔 검색은 체크인/체크아웃 날짜가 있어야 가능 - 없으면 조회하지 않고 답변에서 날짜를 물어봄
+    if context.hotel_asked and context.destination and context.departure_date and context.return_date:
+        lookups["hotels"] = find_hotels(context, *hotel_page)
+    if context.food_asked and context.destination:
+        lookups["foods"] = recommend_food_places(context.destination, context=context)
+    if context.tourist_asked and context.destination:
+        lookups["tourist_spots"] = recommend_tourist_spots(context.destination, context=context)
+    return lookups
 
-    tourist_recommendations = []
-    if context.get("tourist_asked") and context["destination"]:
-        print(f"🗺️ Calling recommend_tourist_spots for: {context['destination']}")
-        tourist_recommendations = recommend_tourist_spots(context["destination"], context=context)
-        print(f"🗺️ Got {len(tourist_recommendations)} tourist results")
+def waiting_sections(context, lookups):
+    """Sections the user asked for that plan_lookups held back until the trip dates are known."""
+    return ["hotels"] if context.hotel_asked and context.destination and "hotels" not in lookups else []
 
+def clear_turn_flags(context):
     # 호텔/맛집/관광지 요청 여부 초기화
-    context["hotel_asked"] = False
-    context["food_asked"] = False
-    context["tourist_asked"] = False
+    context.hotel_asked = False
+    context.food_asked = False
+    context.tourist_asked = False
 
-    response_data = {
-        "context": context
-    }
-    response_data["recommendation"] = response.choices[0].message.content.strip()
-    if hotel_recommendations:
-        response_data["hotels"] = hotel_recommendations
-    if food_recommendations:
-        response_data["foods"] = food_recommendations
-    if tourist_recommendations:
-        response_data["tourist_spots"] = tourist_recommendations
+async def run_chat_turn(user_input, context, turn=None, hotel_count=None, hotel_cursor=None):
+    """
+    One /chat turn against an already-loaded context; mutates the context in
+    place. hotel_count / hotel_cursor page through the hotel matches; a full
+    page comes back with "hotels_cursor" for the next one.
+    """
+    hotel_page = hotel_page_request(hotel_count, hotel_cursor)
+    before = slot_snapshot(context)
+    with timed("extract_context"):
+        await update_context(user_input, context, turn)
+    if hotel_cursor:
+        context.hotel_asked = True  # 커서가 오면 다음 호텔 페이지 요청으로 처리
+
+    # 답변 생성과 호텔/맛집/관광지 조회는 서로 독립적이므로 동시에 실행 (템플릿 턴은 LLM 호출 없음)
+    template_intent = plan_templated_reply(user_input, context, before)
+    branches = plan_lookups(context, hotel_page)
+    waiting = waiting_sections(context, branches)
+    schedule_prefetch(context, before)
+    if template_intent is None:
+        branches["recommendation"] = generate_reply(build_reply_prompt(context), user_input)
+
+    cache_status = {}
+    turn_cache_status.set(cache_status)
+    results = await asyncio.gather(*(run_branch(name, coro) for name, coro in branches.items()))
+    results = dict(zip(branches, results))
+    degraded = [name for name, (ok, _) in results.items() if not ok]
+    apply_proximity_rank(context, results)
+
+    clear_turn_flags(context)
+
+    with timed("build_response"):
+        response_data = {
+            "context": context.to_dict()
+        }
+        if template_intent is None:
+            ok, reply = results["recommendation"]
+            response_data["recommendation"] = reply if ok else FALLBACK_REPLY
+        else:
+            response_data["recommendation"] = render_template_reply(template_intent, user_input, context, results, waiting)
+        for section in ("hotels", "foods", "tourist_spots"):
+            ok, items = results.get(section, (True, []))
+            if ok and items:
+                response_data[section] = items
+        ok, hotels = results.get("hotels", (False, None))
+        if ok and hotels and len(hotels) >= hotel_page[0]:
+            response_data["hotels_cursor"] = encode_hotel_cursor(sum(hotel_page))
+        if degraded:
+            response_data["degraded"] = degraded
+        if cache_status:
+            response_data["cache"] = cache_status
 
     return response_data
 
-if __name__ == "__main__":
+async def stream_chat_turn(user_input, context, hotel_count=None, hotel_cursor=None):
+    """
+    Streaming variant of run_chat_turn, yielding (event, payload) pairs:
+    context first, then reply tokens interleaved with each recommendation
+    section as soon as its lookup finishes, then done. Templated replies
+    arrive as one token once the lookups they describe have finished.
+    """
+    hotel_page = hotel_page_request(hotel_count, hotel_cursor)
+    before = slot_snapshot(context)
+    with timed("extract_context"):
+        await update_context(user_input, context)
+    if hotel_cursor:
+        context.hotel_asked = True
+    yield "context", context.to_dict()
+    template_intent = plan_templated_reply(user_input, context, before)
+
+    queue = asyncio.Queue()
+    cache_status = {}
+    turn_cache_status.set(cache_status)
+
+    async def on_token(text):
+        await queue.put(("token", True, text))
+
+    async def run(name, coro):
+        ok, result = await run_branch(name, coro)
+        await queue.put((name, ok, result))
+
+    branches = plan_lookups(context, hotel_page)
+    waiting = waiting_sections(context, branches)
+    schedule_prefetch(context, before)
+    if template_intent is None:
+        branches["recommendation"] = stream_reply(build_reply_prompt(context), user_input, on_token)
+    tasks = [asyncio.ensure_future(run(name, coro)) for name, coro in branches.items()]
+    clear_turn_flags(context)
+    # 호텔은 같은 턴의 맛집/관광지 조회가 끝난 뒤 거리순으로 재정렬해서 보냄 (보통 Places가 Booking보다 빠름)
+    places_pending = {name for name in branches if name in PROXIMITY_SECTIONS}
+    hotels_held = False
+
+    results = {}
+    degraded = []
+    pending = len(tasks)
+    try:
+        while pending:
+            name, ok, result = await queue.get()
+            if name == "token":
+                yield "token", {"text": result}
+                continue
+            pending -= 1
+            results[name] = (ok, result)
+            places_pending.discard(name)
+            if not ok:
+                degraded.append(name)
+            if name == "recommendation":
+                yield "recommendation", {"text": result if ok else FALLBACK_REPLY}
+            elif name == "hotels":
+                hotels_held = ok
+            elif ok:
+                yield name, result
+            if hotels_held and not places_pending:
+                apply_proximity_rank(context, results)
+                hotels_held = False
+                yield "hotels", results["hotels"][1]
+        if template_intent is not None:
+            reply = render_template_reply(template_intent, user_input, context, results, waiting)
+            yield "token", {"text": reply}
+            yield "recommendation", {"text": reply}
+        done = {"degraded": degraded, "cache": cache_status}
+        ok, hotels = results.get("hotels", (False, None))
+        if ok and hotels and len(hotels) >= hotel_page[0]:
+            done["hotels_cursor"] = encode_hotel_cursor(sum(hotel_page))
+        yield "done", done
+    finally:
+        # 클라이언트가 중간에 끊으면 남은 조회는 취소
+        for task in tasks:
+            task.cancel()
+
+def format_sse(event, payload):
+    return f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+@app.post("/chat/stream")
+async def chat_stream(req: Request):
+    """/chat as Server-Sent Events - context, reply tokens, then each recommendation section as it arrives"""
+    data = await req.json()
+    user_input = data.get("user_input", "")
+    user_id = data.get("user_id", "default")
+    chat_id = data.get("chat_id", "default")
+    context_key = f"{user_id}_{chat_id}"
+
+    async def events():
+        async with session_store.lock(context_key):
+            context = await session_store.load(context_key) or init_context()
+            try:
+                async for event, payload in stream_chat_turn(user_input, context, data.get("hotel_count"),
+                                                             data.get("hotel_cursor")):
+                    yield format_sse(event, payload)
+            finally:
+                await session_store.save(context_key, context)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+async def run_chat_batch(items, concurrency=BATCH_CONCURRENCY):
+    """
+    Runs many (user_id, chat_id, user_input) items as /chat turns, yielding
+    one result dict per item in completion order and a summary last.
+
+    Slot extraction runs once per distinct message up front. Items of the
+    same conversation run in order under its session lock, and at most
+    `concurrency` conversations run at a time. Identical destination, hotel
+    and Places lookups across items are shared through the coalescing caches:
+    concurrent duplicates join one in-flight call, later ones are cache hits.
+    """
+    start = time.perf_counter()
+    turns = {}
+    conversations = {}
+    for index, item in enumerate(items):
+        user_input = item.get("user_input", "")
+        if user_input not in turns:
+            turns[user_input] = extract_turn_slots(user_input)
+        context_key = f"{item.get('user_id', 'default')}_{item.get('chat_id', 'default')}"
+        conversations.setdefault(context_key, []).append((index, item))
+
+    results = asyncio.Queue()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    def item_line(index, item):
+        return {"index": index, "user_id": item.get("user_id", "default"), "chat_id": item.get("chat_id", "default")}
+
+    async def run_conversation(context_key, entries):
+        pending = dict(entries)
+        try:
+            async with semaphore, session_store.lock(context_key):
+                context = await session_store.load(context_key) or init_context()
+                try:
+                    for index, item in entries:
+                        user_input = item.get("user_input", "")
+                        line = item_line(index, item)
+                        try:
+                            line.update(await run_chat_turn(user_input, context, turns[user_input],
+                                                            item.get("hotel_count"), item.get("hotel_cursor")))
+                        except Exception as e:
+                            log.warning("❌ batch item %d failed: %s", index, e)
+                            line["error"] = str(e)
+                        await results.put(line)
+                        del pending[index]
+                finally:
+                    await session_store.save(context_key, context)
+        except Exception as e:
+            # 세션 로드/저장 실패 등 항목 밖의 오류 - 남은 항목마다 오류 줄을 내보내야 스트림이 끝남
+            log.warning("❌ batch conversation %s failed: %s", context_key, e)
+            for index, item in pending.items():
+                await results.put({**item_line(index, item), "error": str(e)})
+
+    tasks = [asyncio.ensure_future(run_conversation(key, entries)) for key, entries in conversations.items()]
+    lookups = {}
+    errors = 0
+    try:
+        for _ in range(len(items)):
+            line = await results.get()
+            errors += "error" in line
+            for status in line.get("cache", {}).values():
+                lookups[status] = lookups.get(status, 0) + 1
+            yield line
+    finally:
+        # 클라이언트가 중간에 끊으면 남은 대화는 취소
+        for task in tasks:
+            task.cancel()
+    yield {"summary": {
+        "items": len(items),
+        "conversations": len(conversations),
+        "unique_messages": len(turns),
+        "errors": errors,
+        "lookups": lookups,
+        "elapsed_ms": round((time.perf_counter() - start) * 1000, 1),
+    }}
+
+@app.post("/chat/batch")
+async def chat_batch(req: Request):
+    """Many /chat turns in one request, streamed back as NDJSON (one line per item, then a summary)"""
+    data = await req.json()
+    # 스트림 헤더를 보내기 전에 검증 - 이후의 예외는 잘린 스트림이 됨
+    if not isinstance(data, dict):
+        return JSONResponse({"error": "body must be a JSON object"}, status_code=422)
+    items = data.get("items") or []
+    if not isinstance(items, list):
+        return JSONResponse({"error": "items must be a list"}, status_code=422)
+    if len(items) > BATCH_MAX_ITEMS:
+        return JSONResponse({"error": f"at most {BATCH_MAX_ITEMS} items per batch"}, status_code=413)
+    for index, item in enumerate(items):
+        if not isinstance(item, dict) or not isinstance(item.get("user_input", ""), str):
+            return JSONResponse({"error": f"items[{index}] must be an object with a string user_input"}, status_code=422)
+    concurrency = data.get("concurrency", BATCH_CONCURRENCY)
+    if not isinstance(concurrency, int) or isinstance(concurrency, bool):
+        return JSONResponse({"error": "concurrency must be an integer"}, status_code=422)
+    concurrency = max(1, min(concurrency, BATCH_CONCURRENCY))
+
+    async def lines():
+        async for line in run_chat_batch(items, concurrency):
+            yield json.dumps(line, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+def serve():
+    """
+    python main.py - SERVER_MODE=dev runs one auto-reloading process;
+    SERVER_MODE=production runs WEB_CONCURRENCY workers. With more than one
+    worker, sessions and caches default to the SQLite backends so every
+    worker sees the same state.
+    """
     import uvicorn
-    uvicorn.run("main:app", host="0.0.0.0", port=10000, reload=True)
+    if SERVER_MODE != "production":
+        uvicorn.run("main:app", host="0.0.0.0", port=PORT, reload=True)
+        return
+    if WEB_CONCURRENCY > 1:
+        # 워커는 main을 새로 import하므로 env 기본값으로 전달
+        for name in SHARED_STATE_BACKENDS:
+            os.environ.setdefault(name, "sqlite")
+    log.info("🚀 production: %d worker(s) on port %d", WEB_CONCURRENCY, PORT)
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=PORT,
+        workers=WEB_CONCURRENCY,
+        log_level=LOG_LEVEL.lower(),
+        proxy_headers=True,
+        forwarded_allow_ips="*",
+    )
+
+if __name__ == "__main__":
+    serve()
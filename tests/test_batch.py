@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+"""/chat/batch input validation and the NDJSON stream's failure handling."""
+import asyncio
+
+import httpx
+import pytest
+
+import main
+
+
+def post_batch(body):
+    async def scenario():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.post("/chat/batch", json=body)
+    return asyncio.run(scenario())
+
+
+@pytest.mark.parametrize("body", [
+    ["not", "an", "object"],
+    {"items": "hello"},
+    {"items": ["hello"]},
+    {"items": [{"user_input": 3}]},
+    {"items": [{"user_input": "hi"}], "concurrency": "8"},
+    {"items": [{"user_input": "hi"}], "concurrency": 2.5},
+])
+def test_malformed_batches_are_rejected_before_streaming(body):
+    response = post_batch(body)
+    assert response.status_code == 422
+    assert "error" in response.json()
+
+
+def test_failed_conversation_emits_error_lines_for_its_items(monkeypatch):
+    async def broken_load(context_key):
+        raise RuntimeError("session store unavailable")
+
+    monkeypatch.setattr(main.session_store, "load", broken_load)
+    items = [{"user_id": "u1", "user_input": "안녕"}, {"user_id": "u1", "user_input": "고마워"}]
+
+    async def scenario():
+        return [line async for line in main.run_chat_batch(items, concurrency=2)]
+
+    lines = asyncio.run(asyncio.wait_for(scenario(), timeout=5))
+    assert sorted(line["index"] for line in lines[:-1]) == [0, 1]
+    assert all(line["error"] == "session store unavailable" for line in lines[:-1])
+    assert lines[-1]["summary"]["errors"] == 2
@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+"""Rule-based departure date parsing (parse_date_fast) with a fixed today."""
+from datetime import datetime
+
+import pytest
+
+import main
+
+TODAY = datetime(2026, 10, 17)  # 토요일
+
+
+@pytest.mark.parametrize("message, expected", [
+    ("2027년 3월 5일 출발", datetime(2027, 3, 5)),
+    ("6월 20일부터 3박", datetime(2027, 6, 20)),
+    ("12월 24일 출발", datetime(2026, 12, 24)),
+    ("2026-11-02 for 3 nights", datetime(2026, 11, 2)),
+    ("June 20 for 3 nights", datetime(2027, 6, 20)),
+    ("Jan. 5, 2027, 2 nights", datetime(2027, 1, 5)),
+    ("from Sept 3rd", datetime(2027, 9, 3)),
+    ("December 24 2 adults", datetime(2026, 12, 24)),
+    ("20 March 2027", datetime(2027, 3, 20)),
+    ("the 1st of nov", datetime(2026, 11, 1)),
+    ("11/20 출발", datetime(2026, 11, 20)),
+    ("내일 출발", datetime(2026, 10, 18)),
+    ("next Friday", datetime(2026, 10, 23)),
+    ("다음주 금요일", datetime(2026, 10, 23)),
+    ("Trip to Marseille 3 nights", None),
+    ("maybe 2 adults, 3 nights in Tokyo", None),
+    ("Decide 2 weeks later, 3 days", None),
+    ("Marriott 2 nights", None),
+    ("Augsburg 4 nights", None),
+])
+def test_parse_date_fast(message, expected):
+    assert main.parse_date_fast(message, today=TODAY) == expected
+
+
+@pytest.mark.parametrize("message, expected", [
+    ("Trip to Marseille 3 nights", False),
+    ("Marriott 2 nights", False),
+    ("sometime in march, 3 nights", True),
+])
+def test_month_words_gate_dateparser(message, expected):
+    assert main.has_date_tokens(message) is expected
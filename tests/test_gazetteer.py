@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+"""Local destination resolution from the gazetteer (no GPT call)."""
+import pytest
+
+import main
+
+
+@pytest.mark.parametrize("text, city", [
+    ("오사카 맛집 추천해줘", "Osaka"),
+    ("오사카에서 3박", "Osaka"),
+    ("도쿄행 비행기", "Tokyo"),
+    ("부산여행 가고 싶어", "Busan"),
+    ("오사카성 구경", "Osaka"),
+    ("Trip to Rome", "Rome"),
+])
+def test_named_city_resolves_locally(text, city):
+    assert main.resolve_destination_locally(text) == city
+
+
+@pytest.mark.parametrize("text", [
+    "대구탕 맛집",     # 대구 + 탕: 다른 단어의 일부
+    "우리나라 좋은 곳",  # 앞 음절에 붙은 나라
+    "파리 잡는 법",     # 흔한 단어와 같은 별칭은 GPT가 판단
+    "대구 여행",
+    "Romeo and Juliet",
+])
+def test_common_words_are_not_resolved_locally(text):
+    assert main.resolve_destination_locally(text) is None
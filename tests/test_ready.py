@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+"""Startup stages and the /ready probe."""
+import asyncio
+import json
+import time
+
+import main
+
+
+def test_failed_stage_is_retried_until_it_succeeds(monkeypatch):
+    monkeypatch.setattr(main, "STARTUP_RETRY_DELAY", 0)
+    monkeypatch.setattr(main, "startup_stages", {})
+    attempts = []
+
+    async def flaky():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise RuntimeError("locale data not found")
+
+    asyncio.run(main.run_startup_stage("dateparser", flaky, time.perf_counter(), retries=3))
+    assert len(attempts) == 3
+    assert isinstance(main.startup_stages["dateparser"], float)
+
+
+def test_failed_stage_is_reported_without_blocking_readiness(monkeypatch):
+    monkeypatch.setattr(main, "startup_stages", {"openai": 120.0, "dateparser": "failed: locale data not found"})
+    monkeypatch.setattr(main, "http_clients", {"openai": object()})
+    response = asyncio.run(main.ready())
+    body = json.loads(response.body)
+    assert response.status_code == 200
+    assert body["failed"] == ["dateparser"] and body["pending"] == []
+
+
+def test_running_stage_holds_readiness(monkeypatch):
+    monkeypatch.setattr(main, "startup_stages", {"openai": None})
+    monkeypatch.setattr(main, "http_clients", {"openai": object()})
+    response = asyncio.run(main.ready())
+    assert response.status_code == 503
+    assert json.loads(response.body)["pending"] == ["openai"]
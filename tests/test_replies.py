@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+"""Templated reply routing: which turns skip the LLM and what the templates say."""
+import main
+
+
+def filled_context(**slots):
+    context = main.init_context()
+    for name, value in slots.items():
+        setattr(context, name, value)
+    return context
+
+
+def test_latin_question_markers_match_whole_words_only():
+    before = main.slot_snapshot(main.init_context())
+    context = filled_context(destination="Osaka", departure_date="2026-06-20", return_date="2026-06-23",
+                             duration=3, adults_number=2)
+    assert main.classify_reply_turn("Show me Osaka from June 20 for 3 nights, 2 adults", context, before) == "slot_update"
+    assert main.classify_reply_turn("How about Osaka from June 20 for 3 nights?", context, before) is None
+    assert main.classify_reply_turn("오사카 어때", context, before) is None
+
+
+def test_hotels_without_dates_ask_for_dates_instead_of_failing():
+    context = filled_context(destination="Osaka", hotel_asked=True)
+    lookups = main.plan_lookups(context)
+    assert "hotels" not in lookups
+    waiting = main.waiting_sections(context, lookups)
+    reply = main.render_template_reply("recommendations", "오사카 호텔 추천해줘", context, {}, waiting)
+    assert "가져오지 못했어요" not in reply
+    assert "날짜" in reply
+
+
+def test_questions_mentioning_a_lookup_go_to_the_llm():
+    before = main.slot_snapshot(main.init_context())
+    context = filled_context(destination="Osaka", hotel_asked=True)
+    assert main.classify_reply_turn("Which area should I stay in Osaka, Namba or Umeda?", context, before) is None
+    assert main.classify_reply_turn("오사카 숙소는 난바랑 우메다 중 어디가 나아?", context, before) is None
+    assert main.classify_reply_turn("오사카 숙소 추천해줘", context, before) == "recommendations"
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+"""SQLiteTTLCache: read-only hits, batched LRU touches and bounded lock waits."""
+import asyncio
+import sqlite3
+
+import pytest
+
+import main
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = main.SQLiteTTLCache("sqlite_test", 100, 60, str(tmp_path / "cache.sqlite3"), busy_timeout=0.05)
+    yield cache
+    main.caches.pop("sqlite_test", None)
+
+
+def test_hits_do_not_write(cache):
+    cache.set("osaka", {"dest_id": "-240905"})
+    changes = cache._conn.total_changes
+    for _ in range(10):
+        assert cache.get("osaka") == {"dest_id": "-240905"}
+    assert cache._conn.total_changes == changes
+
+
+def test_touches_are_flushed_with_the_next_write(cache):
+    cache.set("osaka", 1)
+    before = cache._conn.execute("SELECT accessed FROM cache WHERE key = ?", ('"osaka"',)).fetchone()[0]
+    cache.get("osaka")
+    cache.set("tokyo", 2)
+    after = cache._conn.execute("SELECT accessed FROM cache WHERE key = ?", ('"osaka"',)).fetchone()[0]
+    assert after > before
+
+
+def test_locked_database_degrades_to_miss_and_dropped_write(cache):
+    cache.set("osaka", 1)
+    cache.get("osaka")  # 대기 중인 touch가 있어도 쓰기 잠금 실패는 예외가 아님
+    other = sqlite3.connect(cache.path, isolation_level=None)
+    other.execute("BEGIN EXCLUSIVE")
+    try:
+        cache.set("tokyo", 2)
+        assert cache.busy_errors >= 1
+    finally:
+        other.execute("ROLLBACK")
+        other.close()
+    assert cache.get("tokyo") is main._MISSING
+    assert cache.get("osaka") == 1
+
+
+class LockedConnection:
+    def execute(self, *args):
+        raise sqlite3.OperationalError("database is locked")
+
+
+@pytest.fixture
+def sessions(tmp_path):
+    cache = main.make_cache("sqlite_sessions_test", 100, 60, backend="sqlite", path=str(tmp_path / "sessions.sqlite3"),
+                            busy_timeout=0.05, raise_on_busy=True)
+    yield main.SessionStore(cache)
+    main.caches.pop("sqlite_sessions_test", None)
+
+
+def test_busy_session_read_raises_instead_of_starting_over(sessions):
+    context = main.init_context()
+    context.destination = "Osaka"
+    asyncio.run(sessions.save("u_c", context))
+    sessions.cache._conn = LockedConnection()
+    with pytest.raises(sqlite3.OperationalError):
+        asyncio.run(sessions.load("u_c"))
+
+
+def test_busy_session_write_raises_instead_of_dropping_the_turn(sessions):
+    other = sqlite3.connect(sessions.cache.path, isolation_level=None)
+    other.execute("BEGIN EXCLUSIVE")
+    try:
+        with pytest.raises(sqlite3.OperationalError):
+            asyncio.run(sessions.save("u_c", main.init_context()))
+    finally:
+        other.execute("ROLLBACK")
+        other.close()
@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+"""
+Upstream resilience layer (retries, deadlines, circuit breaker, token bucket)
+driven against benchmark.stub_app with its fault injection, in-process over
+an ASGI transport.
+"""
+import asyncio
+import time
+
+import httpx
+import pytest
+
+import benchmark
+import main
+
+NAME = "stubtest"
+URL = "/v1/hotels/locations?name=Osaka"  # 스텁에서 booking 제공자로 집계되는 경로
+
+
+@pytest.fixture
+def stub(monkeypatch):
+    monkeypatch.setattr(benchmark, "STUB_LATENCY", 0.0)
+    monkeypatch.setattr(benchmark, "STUB_PROVIDER_LATENCY", {})
+    monkeypatch.setattr(benchmark, "STUB_LATENCY_DIST", "fixed")
+    monkeypatch.setattr(benchmark, "STUB_ERROR_RATE", 0.0)
+    monkeypatch.setattr(benchmark, "STUB_HANG_RATE", 0.0)
+    monkeypatch.setattr(benchmark, "STUB_FAULT_PROVIDERS", {"booking"})
+    yield benchmark
+    main.upstreams.pop(NAME, None)
+
+
+def make_upstream(**kwargs):
+    options = dict(timeout=2.0, retries=2, rate=1000, burst=1000, failure_threshold=5, reset_timeout=30.0,
+                   backoff_base=0.01, backoff_max=0.02)
+    options.update(kwargs)
+    return main.Upstream(NAME, **options)
+
+
+def run(scenario):
+    async def wrapper():
+        transport = httpx.ASGITransport(app=benchmark.stub_app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://stub") as client:
+            main.http_clients[NAME] = client
+            try:
+                return await scenario()
+            finally:
+                main.http_clients.pop(NAME, None)
+    return asyncio.run(wrapper())
+
+
+def stub_calls():
+    return benchmark.stub_calls.get("booking", 0)
+
+
+def test_success_makes_one_call(stub):
+    upstream = make_upstream()
+    before = stub_calls()
+    response = run(lambda: upstream.get(URL))
+    assert response.status_code == 200
+    assert stub_calls() - before == 1
+    assert upstream.retried == 0
+    assert upstream.breaker.state == "closed"
+
+
+def test_retries_injected_503s_then_gives_up(stub, monkeypatch):
+    monkeypatch.setattr(benchmark, "STUB_ERROR_RATE", 1.0)
+    upstream = make_upstream(retries=2)
+    before = stub_calls()
+    with pytest.raises(main.UpstreamError):
+        run(lambda: upstream.get(URL))
+    assert stub_calls() - before == 3
+    assert upstream.retried == 2
+    assert upstream.failures == 1
+
+
+def test_deadline_cuts_hanging_upstream(stub, monkeypatch):
+    monkeypatch.setattr(benchmark, "STUB_HANG_RATE", 1.0)
+    upstream = make_upstream(timeout=0.3)
+    start = time.monotonic()
+    with pytest.raises(main.UpstreamError):
+        run(lambda: upstream.get(URL))
+    assert time.monotonic() - start < 1.0
+
+
+def test_breaker_opens_half_opens_and_closes(stub, monkeypatch):
+    monkeypatch.setattr(benchmark, "STUB_ERROR_RATE", 1.0)
+    upstream = make_upstream(retries=0, failure_threshold=2, reset_timeout=0.2)
+
+    async def scenario():
+        for _ in range(2):
+            with pytest.raises(main.UpstreamError):
+                await upstream.get(URL)
+        assert upstream.breaker.state == "open"
+        before = stub_calls()
+        with pytest.raises(main.CircuitOpenError):
+            await upstream.get(URL)
+        assert stub_calls() == before  # 열린 동안은 업스트림을 호출하지 않음
+        assert upstream.short_circuited == 1
+
+        await asyncio.sleep(0.25)
+        assert upstream.breaker.state == "half_open"
+        monkeypatch.setattr(benchmark, "STUB_ERROR_RATE", 0.0)
+        response = await upstream.get(URL)
+        assert response.status_code == 200
+        assert upstream.breaker.state == "closed"
+
+    run(scenario)
+
+
+def test_failed_probe_reopens_breaker(stub, monkeypatch):
+    monkeypatch.setattr(benchmark, "STUB_ERROR_RATE", 1.0)
+    upstream = make_upstream(retries=0, failure_threshold=1, reset_timeout=0.2)
+
+    async def scenario():
+        with pytest.raises(main.UpstreamError):
+            await upstream.get(URL)
+        await asyncio.sleep(0.25)
+        with pytest.raises(main.UpstreamError):
+            await upstream.get(URL)  # 시험 호출도 실패
+        assert upstream.breaker.state == "open"
+
+    run(scenario)
+
+
+def test_cancelled_probe_does_not_stick_half_open(stub, monkeypatch):
+    monkeypatch.setattr(benchmark, "STUB_ERROR_RATE", 1.0)
+    upstream = make_upstream(retries=0, failure_threshold=1, reset_timeout=0.2)
+
+    async def scenario():
+        with pytest.raises(main.UpstreamError):
+            await upstream.get(URL)
+        await asyncio.sleep(0.25)
+        monkeypatch.setattr(benchmark, "STUB_ERROR_RATE", 0.0)
+        monkeypatch.setattr(benchmark, "STUB_HANG_RATE", 1.0)
+        probe = asyncio.ensure_future(upstream.get(URL))
+        await asyncio.sleep(0.05)
+        assert upstream.breaker.probing
+        probe.cancel()  # /chat/stream 클라이언트 끊김과 같은 경로
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+        assert not upstream.breaker.probing
+
+        await asyncio.sleep(0.25)
+        monkeypatch.setattr(benchmark, "STUB_HANG_RATE", 0.0)
+        response = await upstream.get(URL)
+        assert response.status_code == 200
+        assert upstream.breaker.state == "closed"
+
+    run(scenario)
+
+
+def test_probe_without_rate_budget_does_not_stick_half_open(stub, monkeypatch):
+    monkeypatch.setattr(benchmark, "STUB_ERROR_RATE", 1.0)
+    upstream = make_upstream(retries=0, failure_threshold=1, reset_timeout=0.2, timeout=0.5, rate=0.01, burst=1)
+
+    async def scenario():
+        with pytest.raises(main.UpstreamError):
+            await upstream.get(URL)  # 유일한 토큰 사용
+        await asyncio.sleep(0.25)
+        with pytest.raises(main.UpstreamError, match="rate limit budget exhausted"):
+            await upstream.get(URL)
+        assert not upstream.breaker.probing
+        await asyncio.sleep(0.25)
+        assert upstream.breaker.allow()  # 다음 시험 호출이 허용됨
+
+    run(scenario)
+
+
+def test_token_bucket_paces_calls_beyond_burst(stub):
+    upstream = make_upstream(rate=20, burst=2)
+
+    async def scenario():
+        start = time.monotonic()
+        await asyncio.gather(*(upstream.get(URL) for _ in range(4)))
+        return time.monotonic() - start
+
+    elapsed = run(scenario)
+    assert elapsed >= 0.09  # 버스트 2개 이후 2개는 20/s 속도로 (약 0.1초)
+
+
+def test_token_bucket_rejects_wait_longer_than_budget():
+    bucket = main.TokenBucket(rate=1, capacity=1)
+
+    async def scenario():
+        await bucket.acquire(0.1)
+        with pytest.raises(main.UpstreamError):
+            await bucket.acquire(0.1)
+
+    asyncio.run(scenario())